@@ -1,12 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 import uuid
 import structlog
 
 from app.core.chat_engine import ChatEngine
-from app.core.context_memory import ContextMemory
+from app.core.model_registry import ModelRegistry
 from app.utils.auth import get_current_user
+from app.utils.sse import SSE_HEADERS, format_event
 
 router = APIRouter()
 logger = structlog.get_logger()
@@ -21,7 +23,8 @@ class ChatResponse(BaseModel):
     recommendations: Optional[List[dict]] = None
     stage_info: Optional[dict] = None
     emotion: Optional[dict] = None
-    needs: Optional[List[str]] = None
+    needs: Optional[List[dict]] = None
+    degraded_stages: Optional[List[str]] = None
 
 @router.post("/", response_model=ChatResponse)
 async def chat(
@@ -37,8 +40,12 @@ async def chat(
         session_id = request.session_id or str(uuid.uuid4())
         logger.info("Processing chat request", user_id=current_user["id"], session_id=session_id)
 
-        # Initialize chat engine for this user/session
-        chat_engine = ChatEngine(user_id=current_user["id"], session_id=session_id)
+        # Per-session engine; models are shared through the registry
+        chat_engine = ChatEngine(
+            user_id=current_user["id"],
+            session_id=session_id,
+            registry=ModelRegistry
+        )
 
         # Process the user message through full AI pipeline
         response_data: Dict[str, Any] = await chat_engine.process_message(
@@ -51,9 +58,43 @@ async def chat(
             recommendations=response_data.get("recommendations"),
             stage_info=response_data.get("stage_info"),
             emotion=response_data.get("emotion"),
-            needs=response_data.get("needs")
+            needs=response_data.get("needs"),
+            degraded_stages=response_data.get("degraded_stages")
         )
 
     except Exception as e:
         logger.error("Chat processing failed", error=str(e))
         raise HTTPException(status_code=500, detail="Chat processing failed. Please try again later.")
+
+
+@router.post("/stream")
+async def chat_stream(
+    request: ChatRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Streaming variant of the chat endpoint (server-sent events).
+    Sends "token" events as the reply is generated, then one "metadata" event
+    with the session, recommendations, stage, emotion and needs.
+    """
+    session_id = request.session_id or str(uuid.uuid4())
+    logger.info("Processing streaming chat request", user_id=current_user["id"], session_id=session_id)
+
+    chat_engine = ChatEngine(
+        user_id=current_user["id"],
+        session_id=session_id,
+        registry=ModelRegistry
+    )
+
+    async def events():
+        try:
+            async for item in chat_engine.stream_message(message=request.message):
+                data = item["data"]
+                if item["event"] == "metadata":
+                    data = dict(data, session_id=session_id)
+                yield format_event(data, event=item["event"])
+        except Exception as e:
+            logger.error("Streaming chat failed", error=str(e))
+            yield format_event({"detail": "Chat processing failed. Please try again later."}, event="error")
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
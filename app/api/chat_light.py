@@ -1,7 +1,9 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
 from app.core.chat_engine_light import ChatEngineLight
+from app.utils.sse import SSE_HEADERS, format_event
 
 router = APIRouter()
 
@@ -20,3 +22,24 @@ async def chat_endpoint(request: ChatRequest):
         return ChatResponse(response=reply)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """Stream the reply as server-sent "token" events, ending with a "metadata" event."""
+    try:
+        engine = ChatEngineLight()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def events():
+        parts = []
+        try:
+            async for token in engine.stream_response(request.message):
+                parts.append(token)
+                yield format_event(token, event="token")
+            yield format_event({"response": "".join(parts).strip()}, event="metadata")
+        except Exception as e:
+            yield format_event({"detail": str(e)}, event="error")
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
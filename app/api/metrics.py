@@ -0,0 +1,11 @@
+from fastapi import APIRouter
+
+from app.utils import metrics
+
+router = APIRouter()
+
+
+@router.get("/")
+async def get_metrics():
+    """Runtime stats of inference pools, caches and clients for capacity tuning."""
+    return metrics.snapshot()
@@ -3,7 +3,8 @@ from pydantic import BaseModel
 from typing import List, Optional
 import uuid
 
-from app.embedding.retriever import SemanticRetriever
+from app.core.model_registry import ModelRegistry
+from app.embedding.metadata_filter import normalize_filters
 from app.utils.auth import get_current_user
 
 router = APIRouter()
@@ -27,7 +28,13 @@ async def semantic_search(
     request: QueryRequest,
     current_user: dict = Depends(get_current_user)
 ):
-    retriever = SemanticRetriever()
+    try:
+        normalize_filters(request.filters)
+    except ValueError as e:
+        # Unknown filter field or malformed chunk_range
+        raise HTTPException(status_code=400, detail=str(e))
+
+    retriever = ModelRegistry.get("semantic_retriever")
     results = await retriever.search(
         query=request.query,
         top_k=request.top_k,
@@ -1,93 +1,319 @@
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Callable, Awaitable, Tuple, List, AsyncIterator
+import os
+import copy
+import time
 import asyncio
 from langchain.memory import ConversationBufferMemory
 
-from app.core.stage_estimator import StageEstimator
-from app.core.needs_analyzer import NeedsAnalyzer
-from app.core.recommend_engine import RecommendEngine
-from app.core.emotion_detector import EmotionDetector
-from app.core.proactivity import ProactivityEngine
-from app.core.context_memory import ContextMemory
-from app.core.prompt_builder import PromptBuilder
-from app.utils.ibm_client import IBMClient  # Placeholder for Watson API wrapper
+from app.core.context_memory import ContextMemory, SessionContext
+from app.core.model_registry import ModelRegistry
 import structlog
 
 logger = structlog.get_logger()
 
+FALLBACK_RESPONSE = "I'm sorry, something went wrong while generating a response."
+
+# Per-stage time budgets in seconds; a stage that overruns is replaced by its degraded result
+STAGE_TIMEOUTS = {
+    "context": float(os.getenv("CHAT_CONTEXT_TIMEOUT", "1.0")),
+    "emotion": float(os.getenv("CHAT_EMOTION_TIMEOUT", "2.0")),
+    "stage": float(os.getenv("CHAT_STAGE_TIMEOUT", "1.0")),
+    "needs": float(os.getenv("CHAT_NEEDS_TIMEOUT", "1.0")),
+    "recommendations": float(os.getenv("CHAT_RECOMMEND_TIMEOUT", "3.0")),
+    "proactivity": float(os.getenv("CHAT_PROACTIVITY_TIMEOUT", "1.0")),
+    "response": float(os.getenv("CHAT_LLM_TIMEOUT", "30.0")),
+}
+
+DEGRADED_EMOTION = {"emotion": "neutral", "confidence": 0.0, "strategy": "informative", "details": {}}
+DEGRADED_STAGE = {"stage": "unknown", "stage_name": "unknown", "confidence": 0.0, "probabilities": {}}
+
+# name -> (dependencies, stage function taking the dependency results, degraded result)
+StageGraph = Dict[str, Tuple[Tuple[str, ...], Callable[..., Awaitable[Any]], Any]]
+
+
 class ChatEngine:
     """Multiturn conversation manager for ALS semantic assistant."""
 
-    def __init__(self, user_id: str, session_id: str):
+    def __init__(self, user_id: str, session_id: str, registry=ModelRegistry):
         self.user_id = user_id
         self.session_id = session_id
 
-        self.stage_estimator = StageEstimator()
-        self.needs_analyzer = NeedsAnalyzer()
-        self.recommend_engine = RecommendEngine()
-        self.emotion_detector = EmotionDetector()
-        self.proactivity_engine = ProactivityEngine()
-        self.prompt_builder = PromptBuilder()
+        # Shared, process-wide components (loaded once in the app lifespan)
+        self.stage_estimator = registry.get("stage_estimator")
+        self.needs_analyzer = registry.get("needs_analyzer")
+        self.recommend_engine = registry.get("recommend_engine")
+        self.emotion_detector = registry.get("emotion_detector")
+        self.proactivity_engine = registry.get("proactivity_engine")
+        self.prompt_builder = registry.get("prompt_builder")
+        self.generation_cache = registry.get("generation_cache")
 
         self.memory = ConversationBufferMemory()
-        self.llm_client = IBMClient()  # Can support .generate(prompt) or similar
+        self.llm_client = registry.get("llm_client")  # Can support .generate(prompt) or similar
+
+        # Loaded once by the context stage and flushed once at the end of the turn
+        self.session: Optional[SessionContext] = None
+        self.degraded_stages: List[str] = []
+        self.stage_timings: Dict[str, float] = {}
 
     async def process_message(self, message: str) -> Dict[str, Any]:
-        """Process user message and return AI-driven response"""
+        """Process user message and return AI-driven response.
 
-        # 1. Load context history
-        context = await ContextMemory.get_context(self.session_id)
+        Stages run as a dependency graph: context loading and emotion detection
+        start together, recommendations and the proactive question run alongside
+        the LLM call, so latency follows the critical path
+        (context -> stage -> needs -> response) rather than the sum of all stages.
+        """
+        results = await self._run_graph(self._build_graph(message))
 
-        # 2. Run emotion detection
-        emotion = await self.emotion_detector.detect(message)
-        logger.info("Emotion detected", emotion=emotion)
+        response = results["response"]
+        if results["proactivity"]:
+            response += f"\n\n{results['proactivity']}"
 
-        # 3. Estimate current ALS stage
-        stage_info = await self.stage_estimator.estimate(self.user_id, context)
-        logger.info("Stage estimated", stage=stage_info)
+        # Update context memory
+        await self._save_turn(message, response)
 
-        # 4. Analyze user needs
-        needs = await self.needs_analyzer.analyze(message, stage_info)
-        logger.info("Needs extracted", needs=needs)
+        logger.info(
+            "Turn processed",
+            session_id=self.session_id,
+            stage_timings=self.stage_timings,
+            degraded=self.degraded_stages
+        )
 
-        # 5. Generate resource or content recommendations
-        recommendations = await self.recommend_engine.generate(needs, stage_info)
+        return {
+            "response": response,
+            "recommendations": results["recommendations"],
+            "stage_info": results["stage"],
+            "emotion": results["emotion"],
+            "needs": results["needs"],
+            "degraded_stages": list(self.degraded_stages)
+        }
 
-        # 6. Build structured prompt
-        prompt = self.prompt_builder.build(
-            message=message,
-            context=context,
-            emotion=emotion,
-            stage_name=stage_info.get("stage_name", "unknown"),
-            needs=needs
-        )
+    async def stream_message(self, message: str) -> AsyncIterator[Dict[str, Any]]:
+        """Process a message like process_message, yielding the reply while it is generated.
+
+        Yields {"event": "token", "data": text} as chunks arrive from the LLM,
+        then one {"event": "metadata", "data": {...}} with the same fields as
+        process_message once recommendations and the proactive question are done.
+        """
+        graph = self._build_graph(message)
+        del graph["response"]  # generated below, token by token
+        tasks = self._start_graph(graph)
+        try:
+            context, emotion, stage_info, needs = [
+                await tasks[name] for name in ("context", "emotion", "stage", "needs")
+            ]
+            try:
+                prompt = self._build_prompt(message, context, emotion, stage_info, needs)
+                cache_key = self._cache_key(message, context, emotion, stage_info, needs)
+            except Exception as e:
+                # As in process_message, where these run inside the response stage
+                logger.error("Stage failed, using degraded result", stage="response", error=str(e))
+                self.degraded_stages.append("response")
+                prompt, cache_key = None, None
+
+            parts = []
+            cached = await self._cache_lookup(cache_key, message)
+            if prompt is None or cached is not None:
+                parts.append(FALLBACK_RESPONSE if prompt is None else cached)
+                yield {"event": "token", "data": parts[-1]}
+            else:
+                started = time.perf_counter()
+                async for chunk in self._stream_response(prompt):
+                    parts.append(chunk)
+                    yield {"event": "token", "data": chunk}
+                if "response" not in self.degraded_stages:
+                    await self._cache_store(cache_key, message, "".join(parts).strip(),
+                                            time.perf_counter() - started)
+
+            proactivity = await tasks["proactivity"]
+            if proactivity:
+                parts.append(f"\n\n{proactivity}")
+                yield {"event": "token", "data": parts[-1]}
+            response = "".join(parts).rstrip()
+
+            await self._save_turn(message, response)
+            logger.info(
+                "Turn streamed",
+                session_id=self.session_id,
+                stage_timings=self.stage_timings,
+                degraded=self.degraded_stages
+            )
+            yield {"event": "metadata", "data": {
+                "response": response,
+                "recommendations": await tasks["recommendations"],
+                "stage_info": stage_info,
+                "emotion": emotion,
+                "needs": needs,
+                "degraded_stages": list(self.degraded_stages)
+            }}
+        finally:
+            # The client may disconnect mid-stream; stop the stages still running
+            for task in tasks.values():
+                if not task.done():
+                    task.cancel()
 
-        # 7. Generate response using IBM Granite
+    def _build_graph(self, message: str) -> StageGraph:
+        return {
+            "context": ((), self._load_session, ContextMemory.new_context(self.session_id)),
+            "emotion": ((), lambda: self.emotion_detector.detect(message), DEGRADED_EMOTION),
+            "stage": (("context",), lambda context: self.stage_estimator.estimate(self.user_id, context),
+                      DEGRADED_STAGE),
+            "needs": (("stage",), lambda stage_info: self.needs_analyzer.analyze(message, stage_info), []),
+            "recommendations": (("needs", "stage"), self.recommend_engine.generate, []),
+            "proactivity": (("context", "stage"), self.proactivity_engine.get_next_question, None),
+            "response": (("context", "emotion", "stage", "needs"),
+                         lambda context, emotion, stage_info, needs: self._respond(
+                             message, context, emotion, stage_info, needs),
+                         FALLBACK_RESPONSE),
+        }
+
+    async def _load_session(self) -> Dict[str, Any]:
+        self.session = await ContextMemory.load(self.session_id)
+        return self.session.data
+
+    async def _save_turn(self, message: str, response: str):
+        """Flush this turn's messages with the session loaded at the start (one write)."""
+        # Without a loaded session (context stage degraded) only the append is written
+        session = self.session or SessionContext(self.session_id, ContextMemory.new_context(self.session_id),
+                                                 version=None)
+        session.append_turn(message, response)
         try:
-            response = await self._generate_response(prompt)
+            if not await session.flush():
+                logger.warning("Session changed during the turn; kept the newer fields",
+                               session_id=self.session_id)
         except Exception as e:
-            logger.error("LLM generation failed", error=str(e))
-            response = "I'm sorry, something went wrong while generating a response."
+            logger.error("Failed to save conversation turn", session_id=self.session_id, error=str(e))
+
+    async def _run_graph(self, graph: StageGraph) -> Dict[str, Any]:
+        tasks = self._start_graph(graph)
+        values = await asyncio.gather(*tasks.values())
+        return dict(zip(tasks.keys(), values))
+
+    def _start_graph(self, graph: StageGraph) -> Dict[str, asyncio.Task]:
+        """Start every stage as a task that waits only on its own dependencies."""
+        tasks: Dict[str, asyncio.Task] = {}
 
-        # 8. Optionally ask proactive follow-up question
-        proactive_question = await self.proactivity_engine.get_next_question(
+        async def run(name: str) -> Any:
+            deps, stage_fn, degraded = graph[name]
+            inputs = [await tasks[dep] for dep in deps]
+            return await self._run_stage(name, lambda: stage_fn(*inputs), degraded)
+
+        for name in graph:
+            tasks[name] = asyncio.ensure_future(run(name))
+        return tasks
+
+    async def _run_stage(self, name: str, stage_fn: Callable[[], Awaitable[Any]], degraded: Any) -> Any:
+        """Run one stage under its time budget, falling back to the degraded result."""
+        started = time.perf_counter()
+        try:
+            return await asyncio.wait_for(stage_fn(), timeout=STAGE_TIMEOUTS[name])
+        except asyncio.TimeoutError:
+            logger.warning("Stage timed out, using degraded result", stage=name, timeout=STAGE_TIMEOUTS[name])
+        except Exception as e:
+            logger.error("Stage failed, using degraded result", stage=name, error=str(e))
+        finally:
+            self.stage_timings[name] = round(time.perf_counter() - started, 4)
+        self.degraded_stages.append(name)
+        return copy.deepcopy(degraded)
+
+    async def _respond(self, message: str, context: Dict, emotion: Dict,
+                       stage_info: Dict, needs: List[Dict]) -> str:
+        """Build the structured prompt and generate the reply, unless the generation cache has it."""
+        cache_key = self._cache_key(message, context, emotion, stage_info, needs)
+        cached = await self._cache_lookup(cache_key, message)
+        if cached is not None:
+            return cached
+
+        prompt = self._build_prompt(message, context, emotion, stage_info, needs)
+        started = time.perf_counter()
+        response = await self._generate_response(prompt)
+        await self._cache_store(cache_key, message, response, time.perf_counter() - started)
+        return response
+
+    def _build_prompt(self, message: str, context: Dict, emotion: Dict,
+                      stage_info: Dict, needs: List[Dict]) -> str:
+        return self.prompt_builder.build(
+            message=message,
             context=context,
-            stage_info=stage_info
+            emotion=emotion["emotion"],
+            strategy=emotion["strategy"],
+            stage_name=stage_info.get("stage_name", "unknown"),
+            needs=[need["type"] for need in needs]
         )
-        if proactive_question:
-            response += f"\n\n{proactive_question}"
 
-        # 9. Update context memory
-        await ContextMemory.update_context(self.session_id, message, response)
+    def _cache_key(self, message: str, context: Dict, emotion: Dict, stage_info: Dict,
+                   needs: List[Dict]) -> Optional[Tuple[str, str]]:
+        if not self.generation_cache.enabled:
+            return None
+        return self.generation_cache.key(
+            template=self.prompt_builder.template_for(emotion["strategy"]),
+            stage=stage_info.get("stage_name", "unknown"),
+            strategy=emotion["strategy"],
+            needs=[need["type"] for need in needs],
+            context=self.prompt_builder.format_context(context),
+            message=message,
+            model=getattr(self.llm_client, "model", ""),
+            params=getattr(self.llm_client, "parameters", {})
+        )
 
-        return {
-            "response": response,
-            "recommendations": recommendations,
-            "stage_info": stage_info,
-            "emotion": emotion,
-            "needs": needs
-        }
+    async def _cache_lookup(self, key: Optional[Tuple[str, str]], message: str) -> Optional[str]:
+        """Cached reply for this turn; a cache failure only costs the LLM call."""
+        if key is None:
+            return None
+        try:
+            return await self.generation_cache.get(key, message)
+        except Exception as e:
+            logger.warning("Generation cache lookup failed", error=str(e))
+            return None
+
+    async def _cache_store(self, key: Optional[Tuple[str, str]], message: str, reply: str, seconds: float):
+        if key is None or not reply:
+            return
+        try:
+            await self.generation_cache.set(key, message, reply, seconds)
+        except Exception as e:
+            logger.warning("Generation cache store failed", error=str(e))
 
     async def _generate_response(self, prompt: str) -> str:
         """Call IBM Granite or Watson LLM to generate a response"""
         result = await self.llm_client.generate(prompt=prompt)
         return result.strip()
+
+    async def _stream_response(self, prompt: str) -> AsyncIterator[str]:
+        """Stream the LLM reply; the response time budget applies to the first token.
+
+        If the stream fails before producing anything the fallback response is
+        sent instead; a failure mid-stream keeps the text produced so far.
+        Either way the response stage is reported as degraded.
+        """
+        started = time.perf_counter()
+        stream = self.llm_client.generate_stream(prompt=prompt)
+        emitted, failed = False, False
+        try:
+            while True:
+                try:
+                    timeout = None if emitted else STAGE_TIMEOUTS["response"]
+                    chunk = await asyncio.wait_for(stream.__anext__(), timeout=timeout)
+                except StopAsyncIteration:
+                    break
+                if not emitted:
+                    chunk = chunk.lstrip()  # process_message strips the reply too
+                    if not chunk:
+                        continue
+                    emitted = True
+                yield chunk
+        except asyncio.TimeoutError:
+            failed = True
+            logger.warning("LLM stream timed out before the first token", timeout=STAGE_TIMEOUTS["response"])
+        except Exception as e:
+            failed = True
+            logger.error("LLM stream failed", error=str(e), partial=emitted)
+        finally:
+            # Releases the HTTP connection back to the pool
+            await stream.aclose()
+            self.stage_timings["response"] = round(time.perf_counter() - started, 4)
+
+        if failed:
+            self.degraded_stages.append("response")
+            if not emitted:
+                yield FALLBACK_RESPONSE
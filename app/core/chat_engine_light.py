@@ -1,7 +1,11 @@
 import os
-import aiohttp
+import json
+from typing import AsyncIterator
 from dotenv import load_dotenv
 
+from app.utils.http_client import HTTPClientPool
+from app.utils.sse import read_events
+
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
 load_dotenv(os.path.join(BASE_DIR, ".env"))
 print(os.getenv("HF_API_TOKEN"))
@@ -22,9 +26,30 @@ class ChatEngineLight:
         }
         payload = {"inputs": prompt}
 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=headers, json=payload) as resp:
-                if resp.status != 200:
-                    raise RuntimeError(f"HF API Error: {resp.status}, {await resp.text()}")
-                data = await resp.json()
-                return data[0]["generated_text"].replace(prompt, "").strip()
+        session = await HTTPClientPool.session()
+        async with session.post(url, headers=headers, json=payload) as resp:
+            if resp.status != 200:
+                raise RuntimeError(f"HF API Error: {resp.status}, {await resp.text()}")
+            data = await resp.json()
+            return data[0]["generated_text"].replace(prompt, "").strip()
+
+    async def stream_response(self, message: str) -> AsyncIterator[str]:
+        """Yield the reply token by token (text-generation-inference stream format)."""
+        prompt = f"You are a helpful assistant. User: {message}\nAssistant:"
+        url = f"https://api-inference.huggingface.co/models/{self.model}"
+
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+            "Accept": "text/event-stream"
+        }
+        payload = {"inputs": prompt, "parameters": {"return_full_text": False}, "stream": True}
+
+        session = await HTTPClientPool.session()
+        async with session.post(url, headers=headers, json=payload) as resp:
+            if resp.status != 200:
+                raise RuntimeError(f"HF API Error: {resp.status}, {await resp.text()}")
+            async for _, data in read_events(resp):
+                token = json.loads(data).get("token") or {}
+                if token.get("text") and not token.get("special"):
+                    yield token["text"]
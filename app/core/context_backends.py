@@ -0,0 +1,667 @@
+"""Storage backends for ContextMemory.
+
+    redis   shared by every worker; the default
+    memory  one process only, no service or package needed
+    sqlite  a local file in WAL mode, shared by the workers of one node
+
+Any of them can be the primary store (CONTEXT_BACKEND), and ``memory`` or
+``sqlite`` can also back up another one (CONTEXT_FALLBACK): every write is
+copied to the fallback, and a session whose read or write fails on the
+primary is served from the fallback from then on, so a Redis outage does not
+make the assistant forget ongoing conversations.
+
+Every backend keeps the same semantics: at most CONTEXT_MAX_MESSAGES
+messages per session, expiry CONTEXT_TTL_SECONDS after the last write, and a
+``version`` that counts flushes and guards changed fields (see SessionContext).
+"""
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import os
+import copy
+import json
+import time
+import sqlite3
+import asyncio
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+import structlog
+
+from app.utils.cache import TTLCache
+from app.utils.context_codec import ContextCodec
+
+logger = structlog.get_logger()
+
+CONTEXT_TTL_SECONDS = int(os.getenv("CONTEXT_TTL_SECONDS", "86400"))  # 24h expiry
+CONTEXT_MAX_MESSAGES = int(os.getenv("CONTEXT_MAX_MESSAGES", "20"))
+CONTEXT_BACKENDS = ("redis", "memory", "sqlite")
+CONTEXT_BACKEND = os.getenv("CONTEXT_BACKEND", "redis")
+CONTEXT_FALLBACK = os.getenv("CONTEXT_FALLBACK", "none")  # none, memory or sqlite
+CONTEXT_SQLITE_PATH = os.getenv("CONTEXT_SQLITE_PATH", "data/context.db")
+CONTEXT_MEMORY_MAX_SESSIONS = int(os.getenv("CONTEXT_MEMORY_MAX_SESSIONS", "10000"))
+# Every Redis flush publishes "<session id> <version>" here; workers drop older local copies
+CONTEXT_INVALIDATION_CHANNEL = os.getenv("CONTEXT_INVALIDATION_CHANNEL", "context:invalidate")
+
+# Flush one turn atomically: append the new messages, trim, bump the metadata
+# hash and refresh expiry. Changed fields are written only if the session
+# version still matches the one the turn loaded (an empty expected version
+# skips the check); appends always land. A session still stored as a single
+# JSON blob (legacy layout) is converted first, so its history is kept.
+# KEYS: messages list, meta hash, legacy blob
+# ARGV: ttl, max messages, now (JSON), session id (JSON), expected version,
+#       turns, message count, invalidation channel, messages..., then field / JSON value pairs
+# Returns {fields applied (0/1), new version}
+FLUSH_SCRIPT = """
+local messages, meta, legacy = KEYS[1], KEYS[2], KEYS[3]
+local blob = redis.call('GET', legacy)
+if blob then
+    local old = cjson.decode(blob)
+    for _, message in ipairs(old['messages'] or {}) do
+        redis.call('RPUSH', messages, cjson.encode(message))
+    end
+    for field, value in pairs(old) do
+        if field ~= 'messages' then
+            redis.call('HSET', meta, field, cjson.encode(value))
+        end
+    end
+    redis.call('DEL', legacy)
+end
+
+local current = tonumber(redis.call('HGET', meta, 'version') or '0')
+local applied = 0
+if ARGV[5] == '' or tonumber(ARGV[5]) == current then
+    applied = 1
+end
+
+local count = tonumber(ARGV[7])
+for i = 9, 8 + count do
+    redis.call('RPUSH', messages, ARGV[i])
+end
+if count > 0 then
+    redis.call('LTRIM', messages, -tonumber(ARGV[2]), -1)
+end
+if applied == 1 then
+    for i = 9 + count, #ARGV, 2 do
+        redis.call('HSET', meta, ARGV[i], ARGV[i + 1])
+    end
+end
+redis.call('HSETNX', meta, 'session_id', ARGV[4])
+redis.call('HSETNX', meta, 'created_at', ARGV[3])
+redis.call('HSET', meta, 'last_updated', ARGV[3])
+redis.call('HINCRBY', meta, 'turn_count', tonumber(ARGV[6]))
+local version = redis.call('HINCRBY', meta, 'version', 1)
+redis.call('EXPIRE', messages, ARGV[1])
+redis.call('EXPIRE', meta, ARGV[1])
+redis.call('PUBLISH', ARGV[8], cjson.decode(ARGV[4]) .. ' ' .. version)
+return {applied, version}
+"""
+
+
+# Rewrite a session's messages in the current codec, unless the session was
+# flushed since they were read (a flush bumps the version)
+# KEYS: messages list, meta hash
+# ARGV: expected version, ttl, encoded messages...
+MIGRATE_SCRIPT = """
+if tonumber(redis.call('HGET', KEYS[2], 'version') or '0') ~= tonumber(ARGV[1]) then
+    return 0
+end
+if redis.call('LLEN', KEYS[1]) ~= #ARGV - 2 then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+redis.call('RPUSH', KEYS[1], unpack(ARGV, 3))
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS context_sessions (
+    session_id TEXT PRIMARY KEY,
+    meta TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS context_sessions_expires_at ON context_sessions (expires_at);
+CREATE TABLE IF NOT EXISTS context_messages (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (session_id, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS context_diverged (
+    session_id TEXT PRIMARY KEY,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def new_context(session_id: str) -> Dict[str, Any]:
+    """Return an empty context for a session with no stored history"""
+    now = datetime.utcnow().isoformat()
+    return {
+        "session_id": session_id,
+        "messages": [],
+        "turn_count": 0,
+        "created_at": now,
+        "last_updated": now
+    }
+
+
+def _merge_turn(meta: Dict[str, Any], session_id: str, turns: int, fields: Dict[str, Any], applied: bool) -> None:
+    """Apply one flush to a session's fields, as the Redis flush script does."""
+    now = datetime.utcnow().isoformat()
+    if applied:
+        meta.update(fields)
+    meta.setdefault("session_id", session_id)
+    meta.setdefault("created_at", now)
+    meta["last_updated"] = now
+    meta["turn_count"] = meta.get("turn_count", 0) + turns
+
+
+class ContextBackend:
+    """Where ContextMemory keeps sessions.
+
+    ``fetch`` returns the stored context (messages included) with its
+    ``version``, or an empty context for an unknown session, and raises when
+    the store cannot be read. ``flush`` appends messages, bumps the version and
+    writes ``fields`` only if ``expected_version`` is None or still current;
+    it returns (fields applied, new version).
+    """
+
+    name = "base"
+    # Whether ``invalidations`` announces every other worker's writes
+    supports_invalidation = False
+
+    async def fetch(self, session_id: str) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    async def flush(self, session_id: str, expected_version: Optional[int], turns: int,
+                    messages: List[Dict[str, Any]], fields: Dict[str, Any]) -> Tuple[bool, int]:
+        raise NotImplementedError
+
+    async def delete(self, session_id: str):
+        raise NotImplementedError
+
+    async def mark_diverged(self, session_id: str):
+        """Record that the primary store failed this session (fallback stores only).
+
+        The marker lives as long as the session and is removed with it.
+        """
+        raise NotImplementedError
+
+    async def is_diverged(self, session_id: str) -> bool:
+        raise NotImplementedError
+
+    def invalidations(self) -> AsyncIterator[Optional[Tuple[str, int]]]:
+        """Yields None once subscribed, then (session id, new version; -1 when deleted)."""
+        raise NotImplementedError
+
+    def cacheable(self, session_id: str) -> bool:
+        """Whether a worker may keep this session in its local tier."""
+        return self.supports_invalidation
+
+    async def close(self):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+
+class RedisContextBackend(ContextBackend):
+    """Sessions in Redis, shared by every worker.
+
+    Each session is stored as two keys: ``context:{id}:messages``, a list of
+    messages encoded with the ContextCodec, and ``context:{id}:meta``, a hash
+    of JSON-encoded fields (turn_count, created_at, last_updated, version, ...).
+    A flush is one script call that appends to the list, so its cost does not
+    grow with the history and overlapping turns of one session cannot
+    overwrite each other; it also publishes the new version on
+    CONTEXT_INVALIDATION_CHANNEL. Messages read in another format are
+    rewritten in the current one. Sessions written as one ``context:{id}``
+    JSON blob by earlier versions are still read, and converted on their next turn.
+    """
+
+    name = "redis"
+    supports_invalidation = True
+
+    def __init__(self, redis_url: str = "redis://localhost:6379", codec: Optional[ContextCodec] = None):
+        import redis.asyncio as redis
+
+        self.client = redis.from_url(redis_url)
+        self.codec = codec or ContextCodec()
+        self._flush_script = self.client.register_script(FLUSH_SCRIPT)
+        self._migrate_script = self.client.register_script(MIGRATE_SCRIPT)
+        self.migrations = 0
+
+    @staticmethod
+    def _keys(session_id: str) -> List[str]:
+        """messages list, meta hash, legacy JSON blob"""
+        return [f"context:{session_id}:messages", f"context:{session_id}:meta", f"context:{session_id}"]
+
+    async def fetch(self, session_id: str) -> Dict[str, Any]:
+        messages_key, meta_key, legacy_key = self._keys(session_id)
+        # One round trip; MULTI keeps the list and hash consistent with each other
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.lrange(messages_key, 0, -1)
+            pipe.hgetall(meta_key)
+            pipe.get(legacy_key)
+            messages, meta, legacy = await pipe.execute()
+        if meta:
+            context = new_context(session_id)
+            context.update({field.decode(): json.loads(value) for field, value in meta.items()})
+            context["messages"] = [self.codec.decode(message) for message in messages]
+            if any(self.codec.needs_migration(message) for message in messages):
+                await self._migrate(session_id, context)
+            return context
+        if legacy:
+            return json.loads(legacy)
+        return new_context(session_id)
+
+    async def flush(self, session_id: str, expected_version: Optional[int], turns: int,
+                    messages: List[Dict[str, Any]], fields: Dict[str, Any]) -> Tuple[bool, int]:
+        args = [
+            CONTEXT_TTL_SECONDS, CONTEXT_MAX_MESSAGES,
+            json.dumps(datetime.utcnow().isoformat()), json.dumps(session_id),
+            "" if expected_version is None else expected_version,
+            turns, len(messages), CONTEXT_INVALIDATION_CHANNEL
+        ]
+        args += [self.codec.encode(message) for message in messages]
+        for field, value in fields.items():
+            args += [field, json.dumps(value)]
+        applied, version = await self._flush_script(keys=self._keys(session_id), args=args)
+        return bool(applied), int(version)
+
+    async def _migrate(self, session_id: str, context: Dict[str, Any]):
+        """Re-encode a session's stored messages in the current codec (best effort)."""
+        messages_key, meta_key, _ = self._keys(session_id)
+        try:
+            migrated = await self._migrate_script(
+                keys=[messages_key, meta_key],
+                args=[context.get("version", 0), CONTEXT_TTL_SECONDS]
+                     + [self.codec.encode(message) for message in context["messages"]]
+            )
+        except Exception as e:
+            logger.warning("Context codec migration failed", session_id=session_id, error=str(e))
+            return
+        self.migrations += int(migrated)
+
+    async def delete(self, session_id: str):
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.delete(*self._keys(session_id))
+            pipe.publish(CONTEXT_INVALIDATION_CHANNEL, f"{session_id} -1")
+            await pipe.execute()
+
+    async def invalidations(self) -> AsyncIterator[Optional[Tuple[str, int]]]:
+        pubsub = self.client.pubsub()
+        try:
+            await pubsub.subscribe(CONTEXT_INVALIDATION_CHANNEL)
+            async for message in pubsub.listen():
+                if message["type"] == "subscribe":
+                    yield None
+                elif message["type"] == "message":
+                    session_id, _, version = message["data"].decode().rpartition(" ")
+                    yield session_id, int(version)
+        finally:
+            await pubsub.close()
+
+    async def close(self):
+        await self.client.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"codec": self.codec.name, "codec_migrations": self.migrations}
+
+
+class MemoryContextBackend(ContextBackend):
+    """Sessions in this process only: for single-worker deployments, tests and offline load runs.
+
+    Bounded to CONTEXT_MEMORY_MAX_SESSIONS sessions, least recently written evicted first.
+    """
+
+    name = "memory"
+
+    def __init__(self, max_sessions: int = CONTEXT_MEMORY_MAX_SESSIONS,
+                 ttl_seconds: float = CONTEXT_TTL_SECONDS, max_messages: int = CONTEXT_MAX_MESSAGES):
+        self.max_messages = max_messages
+        # session id -> (fields including version, messages)
+        self._sessions = TTLCache(max_sessions, ttl_seconds)
+        # Sessions the primary store failed, when this is a fallback store
+        self._diverged = TTLCache(max_sessions, ttl_seconds)
+
+    async def fetch(self, session_id: str) -> Dict[str, Any]:
+        context = new_context(session_id)
+        stored = self._sessions.peek(session_id)
+        if stored is not None:
+            meta, messages = stored
+            context.update(copy.deepcopy(meta))
+            context["messages"] = copy.deepcopy(messages)
+        return context
+
+    async def flush(self, session_id: str, expected_version: Optional[int], turns: int,
+                    messages: List[Dict[str, Any]], fields: Dict[str, Any]) -> Tuple[bool, int]:
+        meta, stored = self._sessions.peek(session_id) or ({}, [])
+        current = meta.get("version", 0)
+        applied = expected_version is None or expected_version == current
+        meta = dict(meta)
+        _merge_turn(meta, session_id, turns, copy.deepcopy(fields), applied)
+        meta["version"] = current + 1
+        stored = (stored + copy.deepcopy(messages))[-self.max_messages:]
+        self._sessions.set(session_id, (meta, stored))
+        if self._diverged.peek(session_id) is not None:
+            self._diverged.set(session_id, True)
+        return applied, meta["version"]
+
+    async def delete(self, session_id: str):
+        self._sessions.pop(session_id)
+        self._diverged.pop(session_id)
+
+    async def mark_diverged(self, session_id: str):
+        self._diverged.set(session_id, True)
+
+    async def is_diverged(self, session_id: str) -> bool:
+        return self._diverged.peek(session_id) is not None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"sessions": len(self._sessions), "evictions": self._sessions.evictions,
+                "diverged_sessions": len(self._diverged)}
+
+
+class SQLiteContextBackend(ContextBackend):
+    """Sessions in a local SQLite file, shared by the worker processes of one node.
+
+    WAL mode lets readers run alongside the single writer, and each flush is
+    one ``BEGIN IMMEDIATE`` transaction, so the version check holds across
+    processes. Queries run in the default thread pool, one at a time per
+    process. Messages are stored with the ContextCodec; expired sessions are
+    skipped on read and pruned every ``prune_every`` flushes.
+    """
+
+    name = "sqlite"
+    prune_every = 1000
+
+    def __init__(self, path: str = CONTEXT_SQLITE_PATH, codec: Optional[ContextCodec] = None,
+                 ttl_seconds: float = CONTEXT_TTL_SECONDS, max_messages: int = CONTEXT_MAX_MESSAGES):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.codec = codec or ContextCodec()
+        self.ttl_seconds = ttl_seconds
+        self.max_messages = max_messages
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")  # durable at checkpoints; a crash loses at most the last turns
+        self._conn.executescript(SQLITE_SCHEMA)
+        self._flushes = 0
+        self.migrations = 0
+        self.pruned = 0
+
+    @contextmanager
+    def _transaction(self, mode: str = ""):
+        """Run a block of statements as one transaction on the shared connection."""
+        with self._lock:
+            self._conn.execute(f"BEGIN {mode}")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    async def fetch(self, session_id: str) -> Dict[str, Any]:
+        return await asyncio.to_thread(self._fetch, session_id)
+
+    def _fetch(self, session_id: str) -> Dict[str, Any]:
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT meta, version, expires_at FROM context_sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None or row[2] < time.time():
+                return new_context(session_id)
+            rows = conn.execute(
+                "SELECT seq, data FROM context_messages WHERE session_id = ? ORDER BY seq", (session_id,)
+            ).fetchall()
+
+        context = new_context(session_id)
+        context.update(json.loads(row[0]))
+        context["version"] = row[1]
+        context["messages"] = [self.codec.decode(data) for _, data in rows]
+        stale = [(seq, data, message) for (seq, data), message in zip(rows, context["messages"])
+                 if self.codec.needs_migration(data)]
+        if stale:
+            self._migrate(session_id, stale)
+        return context
+
+    def _migrate(self, session_id: str, stale: List[Tuple[int, bytes, Dict[str, Any]]]):
+        """Re-encode messages in the current codec, skipping rows changed since they were read."""
+        try:
+            with self._transaction("IMMEDIATE") as conn:
+                for seq, data, message in stale:
+                    conn.execute(
+                        "UPDATE context_messages SET data = ? WHERE session_id = ? AND seq = ? AND data = ?",
+                        (self.codec.encode(message), session_id, seq, data)
+                    )
+        except sqlite3.Error as e:
+            logger.warning("Context codec migration failed", session_id=session_id, error=str(e))
+            return
+        self.migrations += 1
+
+    async def flush(self, session_id: str, expected_version: Optional[int], turns: int,
+                    messages: List[Dict[str, Any]], fields: Dict[str, Any]) -> Tuple[bool, int]:
+        encoded = [self.codec.encode(message) for message in messages]
+        return await asyncio.to_thread(self._flush, session_id, expected_version, turns, encoded, fields)
+
+    def _flush(self, session_id: str, expected_version: Optional[int], turns: int,
+               encoded: List[bytes], fields: Dict[str, Any]) -> Tuple[bool, int]:
+        now = time.time()
+        with self._transaction("IMMEDIATE") as conn:
+            row = conn.execute(
+                "SELECT meta, version, expires_at FROM context_sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None or row[2] < now:
+                conn.execute("DELETE FROM context_messages WHERE session_id = ?", (session_id,))
+                meta, current = {}, 0
+            else:
+                meta, current = json.loads(row[0]), row[1]
+            applied = expected_version is None or expected_version == current
+            _merge_turn(meta, session_id, turns, fields, applied)
+
+            if encoded:
+                last = conn.execute(
+                    "SELECT COALESCE(MAX(seq), 0) FROM context_messages WHERE session_id = ?", (session_id,)
+                ).fetchone()[0]
+                conn.executemany(
+                    "INSERT INTO context_messages (session_id, seq, data) VALUES (?, ?, ?)",
+                    [(session_id, last + i, data) for i, data in enumerate(encoded, 1)]
+                )
+                conn.execute(
+                    "DELETE FROM context_messages WHERE session_id = ? AND seq <= ?",
+                    (session_id, last + len(encoded) - self.max_messages)
+                )
+            conn.execute(
+                "INSERT OR REPLACE INTO context_sessions (session_id, meta, version, expires_at) VALUES (?, ?, ?, ?)",
+                (session_id, json.dumps(meta), current + 1, now + self.ttl_seconds)
+            )
+            conn.execute("UPDATE context_diverged SET expires_at = ? WHERE session_id = ?",
+                         (now + self.ttl_seconds, session_id))
+
+        self._flushes += 1
+        if self._flushes % self.prune_every == 0:
+            self._prune(now)
+        return applied, current + 1
+
+    def _prune(self, now: float):
+        with self._transaction("IMMEDIATE") as conn:
+            conn.execute(
+                "DELETE FROM context_messages WHERE session_id IN "
+                "(SELECT session_id FROM context_sessions WHERE expires_at < ?)", (now,)
+            )
+            self.pruned += conn.execute("DELETE FROM context_sessions WHERE expires_at < ?", (now,)).rowcount
+            conn.execute("DELETE FROM context_diverged WHERE expires_at < ?", (now,))
+
+    async def delete(self, session_id: str):
+        await asyncio.to_thread(self._delete, session_id)
+
+    def _delete(self, session_id: str):
+        with self._transaction("IMMEDIATE") as conn:
+            conn.execute("DELETE FROM context_messages WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM context_sessions WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM context_diverged WHERE session_id = ?", (session_id,))
+
+    async def mark_diverged(self, session_id: str):
+        await asyncio.to_thread(self._mark_diverged, session_id)
+
+    def _mark_diverged(self, session_id: str):
+        with self._transaction("IMMEDIATE") as conn:
+            conn.execute("INSERT OR REPLACE INTO context_diverged (session_id, expires_at) VALUES (?, ?)",
+                         (session_id, time.time() + self.ttl_seconds))
+
+    async def is_diverged(self, session_id: str) -> bool:
+        return await asyncio.to_thread(self._is_diverged, session_id)
+
+    def _is_diverged(self, session_id: str) -> bool:
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT expires_at FROM context_diverged WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return row is not None and row[0] >= time.time()
+
+    async def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"path": self.path, "codec": self.codec.name, "codec_migrations": self.migrations,
+                "pruned_sessions": self.pruned}
+
+
+class FallbackContextBackend(ContextBackend):
+    """A primary store with a write-through local fallback.
+
+    Writes go to the primary and are then copied to the fallback (fields
+    always applied there, since the fallback's versions are its own). When the
+    primary fails to read or write a session, the session is served from the
+    fallback from then on: mixing the two would lose turns written to only
+    one of them. Since only the last CONTEXT_MAX_MESSAGES messages are kept,
+    the fallback holds a session's full context after that many messages have
+    been mirrored.
+
+    The switch is recorded in the fallback store, which every read and write
+    of a session not yet known to have diverged consults. So it reaches the
+    workers sharing that store: with a ``memory`` fallback only this worker,
+    with ``sqlite`` every worker on the node. Workers on other nodes keep
+    using the primary and do not see turns written to this node's fallback.
+    """
+
+    def __init__(self, primary: ContextBackend, fallback: ContextBackend):
+        self.primary = primary
+        self.fallback = fallback
+        self.name = f"{primary.name}+{fallback.name}"
+        self.supports_invalidation = primary.supports_invalidation
+        # Sessions this worker knows are served by the fallback; the fallback
+        # store's own marker is what other workers see
+        self._diverged = TTLCache(CONTEXT_MEMORY_MAX_SESSIONS, CONTEXT_TTL_SECONDS)
+        self.fallback_reads = 0
+        self.fallback_writes = 0
+        self.mirror_errors = 0
+
+    async def _diverge(self, session_id: str, operation: str, error: Exception):
+        if self._diverged.peek(session_id) is None:
+            logger.warning("Context primary store failed, session moved to the fallback store",
+                           session_id=session_id, operation=operation, primary=self.primary.name,
+                           fallback=self.fallback.name, error=str(error))
+        self._diverged.set(session_id, True)
+        try:
+            await self.fallback.mark_diverged(session_id)
+        except Exception as e:
+            logger.warning("Context fallback store could not record the switch", session_id=session_id,
+                           error=str(e))
+
+    async def _is_diverged(self, session_id: str) -> bool:
+        """Whether this or another worker sharing the fallback store moved the session to it."""
+        if self._diverged.get(session_id) is not None:
+            return True
+        try:
+            diverged = await self.fallback.is_diverged(session_id)
+        except Exception as e:
+            logger.warning("Context fallback store read failed", session_id=session_id, error=str(e))
+            return False
+        if diverged:
+            self._diverged.set(session_id, True)
+        return diverged
+
+    async def fetch(self, session_id: str) -> Dict[str, Any]:
+        if not await self._is_diverged(session_id):
+            try:
+                return await self.primary.fetch(session_id)
+            except Exception as e:
+                await self._diverge(session_id, "fetch", e)
+        self.fallback_reads += 1
+        return await self.fallback.fetch(session_id)
+
+    async def flush(self, session_id: str, expected_version: Optional[int], turns: int,
+                    messages: List[Dict[str, Any]], fields: Dict[str, Any]) -> Tuple[bool, int]:
+        if not await self._is_diverged(session_id):
+            try:
+                result = await self.primary.flush(session_id, expected_version, turns, messages, fields)
+            except Exception as e:
+                await self._diverge(session_id, "flush", e)
+                expected_version = None  # the version was issued by the primary
+            else:
+                try:
+                    await self.fallback.flush(session_id, None, turns, messages, fields)
+                except Exception as e:
+                    self.mirror_errors += 1
+                    logger.warning("Context fallback store write failed", session_id=session_id, error=str(e))
+                return result
+        self.fallback_writes += 1
+        return await self.fallback.flush(session_id, expected_version, turns, messages, fields)
+
+    async def delete(self, session_id: str):
+        self._diverged.pop(session_id)
+        try:
+            await self.primary.delete(session_id)
+        finally:
+            await self.fallback.delete(session_id)
+
+    def invalidations(self) -> AsyncIterator[Optional[Tuple[str, int]]]:
+        return self.primary.invalidations()
+
+    def cacheable(self, session_id: str) -> bool:
+        return self.supports_invalidation and self._diverged.peek(session_id) is None
+
+    async def close(self):
+        try:
+            await self.primary.close()
+        finally:
+            await self.fallback.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "primary": self.primary.stats(),
+            "fallback": self.fallback.stats(),
+            "diverged_sessions": len(self._diverged),
+            "fallback_reads": self.fallback_reads,
+            "fallback_writes": self.fallback_writes,
+            "mirror_errors": self.mirror_errors,
+        }
+
+
+def create_backend(name: str = CONTEXT_BACKEND, fallback: str = CONTEXT_FALLBACK,
+                   redis_url: str = "redis://localhost:6379", codec: Optional[ContextCodec] = None,
+                   sqlite_path: str = CONTEXT_SQLITE_PATH) -> ContextBackend:
+    """Build the configured store, wrapped with a write-through fallback unless ``fallback`` is "none"."""
+    def build(kind: str) -> ContextBackend:
+        if kind == "redis":
+            return RedisContextBackend(redis_url, codec)
+        if kind == "memory":
+            return MemoryContextBackend()
+        if kind == "sqlite":
+            return SQLiteContextBackend(sqlite_path, codec)
+        raise ValueError(f"Unknown context backend {kind!r}; expected one of {CONTEXT_BACKENDS}")
+
+    backend = build(name)
+    if fallback in ("", "none"):
+        return backend
+    if fallback == "redis" or fallback == name:
+        raise ValueError(f"Context fallback must be a local store other than {name!r}: memory or sqlite")
+    return FallbackContextBackend(backend, build(fallback))
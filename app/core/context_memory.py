@@ -1,85 +1,207 @@
-from typing import Dict, List, Any
-import json
+from typing import Dict, List, Any, Optional, Tuple, Union
+import os
+import copy
 import asyncio
 from datetime import datetime
-import redis.asyncio as redis
+import structlog
 
 from database.users.conversation import Conversation  
 from sqlalchemy.orm import Session
 # from db.session import get_session  SQLAlchemy session provider
 
+from app.utils import metrics
+from app.utils.cache import TTLCache
+from app.utils.context_codec import ContextCodec
+from app.core.context_backends import (
+    CONTEXT_BACKEND, CONTEXT_FALLBACK, CONTEXT_MAX_MESSAGES, ContextBackend, create_backend, new_context
+)
+
+logger = structlog.get_logger()
+
+# In-process tier of recently used sessions (0 disables); the TTL bounds staleness
+# if an invalidation is ever missed. Only used with a store that announces writes (Redis).
+CONTEXT_LOCAL_CACHE_SIZE = int(os.getenv("CONTEXT_LOCAL_CACHE_SIZE", "1024"))
+CONTEXT_LOCAL_CACHE_TTL = float(os.getenv("CONTEXT_LOCAL_CACHE_TTL", "300"))
+
+
+class SessionContext:
+    """One turn's view of a session: loaded once, changed in memory, flushed once.
+
+    ``data`` is the context dict the pipeline stages read. New messages and
+    changed fields are buffered and written by a single ``flush``, which only
+    overwrites fields if nobody else flushed the session since it was loaded.
+    A ``version`` of None (context unavailable at load time) skips that check.
+    """
+
+    def __init__(self, session_id: str, data: Dict[str, Any], version: Optional[int] = 0):
+        self.session_id = session_id
+        self.data = data
+        self.version = version
+        self._new_messages: List[Dict[str, Any]] = []
+        self._turns = 0
+        self._changed: Dict[str, Any] = {}
+
+    @property
+    def messages(self) -> List[Dict[str, Any]]:
+        return self.data["messages"]
+
+    def set(self, field: str, value: Any):
+        """Change a context field; written on flush."""
+        self.data[field] = value
+        self._changed[field] = value
+
+    def append_turn(self, user_message: str, assistant_response: str):
+        now = datetime.utcnow().isoformat()
+        turn = [
+            {"role": "user", "content": user_message, "timestamp": now},
+            {"role": "assistant", "content": assistant_response, "timestamp": now}
+        ]
+        self._new_messages.extend(turn)
+        self._turns += 1
+        self.data["messages"] = (self.data["messages"] + turn)[-CONTEXT_MAX_MESSAGES:]
+        self.data["turn_count"] = self.data.get("turn_count", 0) + 1
+        self.data["last_updated"] = now
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self._new_messages or self._changed)
+
+    async def flush(self) -> bool:
+        """Write buffered changes in one round trip; False if changed fields lost a version race."""
+        if not self.dirty:
+            return True
+        applied, self.version = await ContextMemory.flush(self)
+        self._new_messages, self._turns, self._changed = [], 0, {}
+        return applied
+
+
 class ContextMemory:
-    """Conversation memory context manager with Redis and DB fallback."""
+    """Conversation memory context manager with Redis and DB fallback.
+
+    Sessions live in a ContextBackend chosen with CONTEXT_BACKEND (redis,
+    memory or sqlite), optionally mirrored to a local CONTEXT_FALLBACK store
+    that takes over sessions the primary fails on; see context_backends.
+    A turn is one fetch and one flush; a ``version`` field counts flushes
+    (see SessionContext).
 
-    _redis_client: redis.Redis = None
+    With Redis, recently used sessions are also kept in a per-process LRU, so
+    a worker serving consecutive turns of a session does not read Redis again.
+    Every flush publishes the session's new version and a subscriber drops
+    local copies older than that; while the subscription is down the local
+    tier is emptied and bypassed, and every load goes to the store.
+    """
+
+    _backend: ContextBackend = None
+    # session id -> (context without its version, version)
+    _local = TTLCache(CONTEXT_LOCAL_CACHE_SIZE, CONTEXT_LOCAL_CACHE_TTL)
+    # session id -> newest version announced by any worker
+    _announced = TTLCache(CONTEXT_LOCAL_CACHE_SIZE * 4, CONTEXT_LOCAL_CACHE_TTL)
+    _listener: Optional[asyncio.Task] = None
+    _coherent = False
+    _backend_reads = 0
+    _invalidations = 0
+    _errors = 0
 
     @classmethod
-    def initialize(cls, redis_url: str = "redis://localhost:6379"):
-        cls._redis_client = redis.from_url(redis_url)
+    def initialize(cls, redis_url: str = "redis://localhost:6379",
+                   backend: Union[str, ContextBackend] = CONTEXT_BACKEND, fallback: str = CONTEXT_FALLBACK):
+        """Open the configured store; ``backend`` may also be a ready ContextBackend (tests, benchmarks)."""
+        if isinstance(backend, ContextBackend):
+            cls._backend = backend
+        else:
+            cls._backend = create_backend(backend, fallback, redis_url, ContextCodec())
+        logger.info("Context store ready", backend=cls._backend.name)
 
     @classmethod
     async def cleanup(cls):
-        if cls._redis_client:
-            await cls._redis_client.close()
+        if cls._listener is not None:
+            cls._listener.cancel()
+            cls._listener = None
+        cls._coherent = False
+        cls._local.clear()
+        if cls._backend:
+            await cls._backend.close()
+
+    @classmethod
+    def new_context(cls, session_id: str) -> Dict[str, Any]:
+        """Return an empty context for a session with no stored history"""
+        return new_context(session_id)
 
     @classmethod
     async def get_context(cls, session_id: str) -> Dict[str, Any]:
-        key = f"context:{session_id}"
         try:
-            data = await cls._redis_client.get(key)
-            if data:
-                return json.loads(data)
-        except Exception:
-            pass
+            return await cls._fetch(session_id)
+        except Exception as e:
+            cls._errors += 1
+            logger.error("Context fetch failed, using an empty context", session_id=session_id,
+                         backend=cls._backend.name, error=str(e))
+            return cls.new_context(session_id)
 
-        return {
-            "session_id": session_id,
-            "messages": [],
-            "turn_count": 0,
-            "created_at": datetime.utcnow().isoformat(),
-            "last_updated": datetime.utcnow().isoformat()
-        }
+    @classmethod
+    async def _fetch(cls, session_id: str) -> Dict[str, Any]:
+        cls._backend_reads += 1
+        return await cls._backend.fetch(session_id)
 
     @classmethod
-    async def update_context(cls, session_id: str, user_message: str, assistant_response: str):
-        context = await cls.get_context(session_id)
-
-        context["messages"].append({
-            "role": "user",
-            "content": user_message,
-            "timestamp": datetime.utcnow().isoformat()
-        })
-        context["messages"].append({
-            "role": "assistant",
-            "content": assistant_response,
-            "timestamp": datetime.utcnow().isoformat()
-        })
-
-        context["turn_count"] += 1
-        context["last_updated"] = datetime.utcnow().isoformat()
-
-        # Keep only the last 20 messages
-        if len(context["messages"]) > 20:
-            context["messages"] = context["messages"][-20:]
+    async def load(cls, session_id: str) -> SessionContext:
+        """Load a session once for a whole turn: from the local tier, else one store round trip."""
+        cls._ensure_listener()
+        cached = cls._local.get(session_id) if cls._coherent else None
+        if cached is not None:
+            context, version = cached
+            return SessionContext(session_id, copy.deepcopy(context), version)
 
         try:
-            key = f"context:{session_id}"
-            await cls._redis_client.setex(
-                key, 86400, json.dumps(context)  # 24h expiry
-            )
-        except Exception:
-            pass
+            context = await cls._fetch(session_id)
+        except Exception as e:
+            cls._errors += 1
+            logger.error("Context load failed, starting from an empty context", session_id=session_id,
+                         backend=cls._backend.name, error=str(e))
+            return SessionContext(session_id, cls.new_context(session_id), version=None)
+        version = context.pop("version", 0)
+        cls._remember(session_id, context, version)
+        return SessionContext(session_id, copy.deepcopy(context), version)
 
     @classmethod
-    async def get_dialogue_history(cls, session_id: str) -> List[Dict[str, str]]:
+    async def flush(cls, session: SessionContext) -> Tuple[bool, int]:
+        """Write a session's buffered messages and fields; returns (fields applied, new version)."""
+        applied, version = await cls._backend.flush(
+            session.session_id, session.version, session._turns, session._new_messages, session._changed
+        )
+
+        # The in-memory state is exactly what the store holds only if this was the sole write
+        if applied and session.version is not None and version == session.version + 1:
+            cls._remember(session.session_id, session.data, version)
+        else:
+            cls._local.pop(session.session_id)
+        return applied, version
+
+    @classmethod
+    async def update_context(cls, session_id: str, user_message: str, assistant_response: str):
+        """Append one turn without loading the session first."""
+        session = SessionContext(session_id, cls.new_context(session_id), version=None)
+        session.append_turn(user_message, assistant_response)
+        try:
+            await session.flush()
+        except Exception as e:
+            cls._errors += 1
+            logger.error("Context update failed, turn not stored", session_id=session_id,
+                         backend=cls._backend.name, error=str(e))
+
+    @classmethod
+    async def get_dialogue_history(cls, session_id: str,
+                                   context: Optional[Dict[str, Any]] = None) -> List[Dict[str, str]]:
         """Return the formatted message history for summarization or LLM input"""
-        context = await cls.get_context(session_id)
+        if context is None:
+            context = await cls.get_context(session_id)
         return context.get("messages", [])
 
     @classmethod
-    async def persist_to_database(cls, session_id: str, user_id: str, db: Session = None):
+    async def persist_to_database(cls, session_id: str, user_id: str, db: Session = None,
+                                  context: Optional[Dict[str, Any]] = None):
         """Save context as a conversation record to the database"""
-        context = await cls.get_context(session_id)
+        if context is None:
+            context = await cls.get_context(session_id)
 
         if db is None:
             db = get_session()
@@ -101,8 +223,72 @@ class ContextMemory:
 
     @classmethod
     async def clear_context(cls, session_id: str):
-        """Manually clear Redis context (e.g., after saving or reset)"""
+        """Manually clear stored context (e.g., after saving or reset)"""
         try:
-            await cls._redis_client.delete(f"context:{session_id}")
-        except Exception:
-            pass
+            await cls._backend.delete(session_id)
+        except Exception as e:
+            cls._errors += 1
+            logger.error("Context clear failed", session_id=session_id, backend=cls._backend.name, error=str(e))
+        cls._local.pop(session_id)
+
+    @classmethod
+    def _remember(cls, session_id: str, context: Dict[str, Any], version: int):
+        """Keep a copy in the local tier unless a newer version was already announced."""
+        if not cls._coherent or cls._local.max_entries <= 0 or not cls._backend.cacheable(session_id):
+            return
+        announced = cls._announced.peek(session_id)
+        if announced is not None and announced > version:
+            return
+        cls._local.set(session_id, (copy.deepcopy(context), version))
+
+    @classmethod
+    def _ensure_listener(cls):
+        if CONTEXT_LOCAL_CACHE_SIZE <= 0 or cls._backend is None or not cls._backend.supports_invalidation:
+            return
+        if cls._listener is None or cls._listener.done():
+            cls._listener = asyncio.get_running_loop().create_task(cls._listen())
+
+    @classmethod
+    async def _listen(cls):
+        """Apply invalidations from every worker; resubscribes after connection errors."""
+        while True:
+            feed = cls._backend.invalidations()
+            try:
+                async for event in feed:
+                    if event is None:
+                        cls._coherent = True
+                    else:
+                        cls._invalidate(*event)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Context invalidation feed lost, local cache bypassed", error=str(e))
+            finally:
+                cls._coherent = False
+                cls._local.clear()
+                await feed.aclose()
+            await asyncio.sleep(1.0)
+
+    @classmethod
+    def _invalidate(cls, session_id: str, version: int):
+        if version > (cls._announced.peek(session_id) or 0):
+            cls._announced.set(session_id, version)
+        cached = cls._local.peek(session_id)
+        if cached is not None and (version < 0 or cached[1] < version):
+            cls._local.pop(session_id)
+            cls._invalidations += 1
+
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        return {
+            "backend": cls._backend.name if cls._backend else None,
+            "store": cls._backend.stats() if cls._backend else {},
+            "local_cache": cls._local.stats(),
+            "coherent": cls._coherent,
+            "backend_reads": cls._backend_reads,
+            "invalidations": cls._invalidations,
+            "errors": cls._errors,
+        }
+
+
+metrics.register("context_memory", ContextMemory.stats)
@@ -1,15 +1,24 @@
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List
+import os
 import json
-from transformers import pipeline
+from app.utils.batcher import MicroBatcher
+from app.utils.inference_backends import EMOTION_BACKEND, EMOTION_MODEL, load_text_classifier
+
+EMOTION_BATCH_SIZE = int(os.getenv("EMOTION_BATCH_SIZE", "16"))
+EMOTION_BATCH_WAIT_MS = float(os.getenv("EMOTION_BATCH_WAIT_MS", "5"))
 
 class EmotionDetector:
     """Emotion detection module"""
     
     def __init__(self):
-        # Load emotion analysis model
-        self.classifier = pipeline(
-            "sentiment-analysis",
-            model="cardiffnlp/twitter-roberta-base-sentiment-latest"
+        # Load emotion analysis model (torch, int8 or ONNX backend, see EMOTION_BACKEND)
+        self.classifier = load_text_classifier(EMOTION_MODEL, EMOTION_BACKEND)
+        # Concurrent detect() calls share one batched forward pass
+        self.batcher = MicroBatcher(
+            self._classify_batch,
+            max_batch_size=EMOTION_BATCH_SIZE,
+            max_wait_ms=EMOTION_BATCH_WAIT_MS,
+            name="emotion_batcher"
         )
         self.load_emotion_keywords()
     
@@ -24,8 +33,8 @@ class EmotionDetector:
     
     async def detect(self, message: str) -> Dict[str, Any]:
         """Detect user emotion"""
-        # Use pre-trained model
-        model_result = self.classifier(message)[0]
+        # Use pre-trained model (batched with concurrent requests on the inference pool)
+        model_result = await self.batcher.submit(message)
         
         # Keyword enhancement
         keyword_emotion = self._detect_by_keywords(message)
@@ -46,6 +55,10 @@ class EmotionDetector:
             }
         }
     
+    def _classify_batch(self, messages: List[str]) -> List[Dict]:
+        """Run one batched forward pass; returns one {label, score} per message"""
+        return self.classifier(messages, batch_size=len(messages), truncation=True)
+    
     def _detect_by_keywords(self, message: str) -> Dict[str, float]:
         """Keyword-based emotion detection"""
         scores = {"positive": 0, "negative": 0, "neutral": 0}
@@ -0,0 +1,135 @@
+from typing import Dict, Any, Callable
+import os
+import threading
+import time
+import resource
+import structlog
+
+from app.core.stage_estimator import StageEstimator
+from app.core.needs_analyzer import NeedsAnalyzer
+from app.core.recommend_engine import RecommendEngine
+from app.core.emotion_detector import EmotionDetector
+from app.core.proactivity import ProactivityEngine
+from app.core.prompt_builder import PromptBuilder
+from app.embedding.retriever import SemanticRetriever
+from app.utils.generation_cache import GENERATION_CACHE, GenerationCache
+from app.utils.ibm_client import IBMClient
+from app.utils.llm_client import LLM_BACKEND, ResilientLLMClient
+from app.utils.stub_llm import StubLLMClient
+
+logger = structlog.get_logger()
+
+
+def _resident_mb() -> float:
+    """Current resident set size of this process in MB."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        # Non-Linux fallback: peak RSS (KB on Linux, bytes on macOS)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class ModelRegistry:
+    """Process-wide registry of models and clients shared by every chat session.
+
+    Loaded once from the FastAPI lifespan; ChatEngine instances only hold
+    references to these components, so constructing one per request is cheap.
+    A component requested before that, or after a failed load, is loaded by
+    its first get() with only the components it depends on.
+    """
+
+    _components: Dict[str, Any] = {}
+    _load_report: Dict[str, Dict[str, float]] = {}
+    # Reentrant: a factory may get() the components it depends on
+    _lock = threading.RLock()
+    # Load order for initialize(); dependencies come first
+    _factories: Dict[str, Callable[[], Any]] = {
+        "semantic_retriever": SemanticRetriever,
+        "emotion_detector": EmotionDetector,
+        "recommend_engine": lambda: RecommendEngine(
+            semantic_retriever=ModelRegistry.get("semantic_retriever")
+        ),
+        "prompt_builder": PromptBuilder,
+        "llm_client": lambda: ResilientLLMClient(
+            StubLLMClient() if LLM_BACKEND == "stub" else IBMClient()
+        ),
+        "generation_cache": lambda: GenerationCache(
+            GENERATION_CACHE,
+            embed_fn=ModelRegistry.get("semantic_retriever").embed_query
+        ),
+        "stage_estimator": StageEstimator,
+        "needs_analyzer": NeedsAnalyzer,
+        "proactivity_engine": ProactivityEngine,
+    }
+
+    @classmethod
+    def initialize(cls) -> Dict[str, Dict[str, float]]:
+        """Load all shared components and return the per-component load report.
+
+        All or nothing: if a factory raises, the components loaded by this call
+        are released again and the error propagates, so a later call retries.
+        """
+        with cls._lock:
+            loaded = []
+            try:
+                for name in cls._factories:
+                    if name not in cls._components:
+                        cls._load(name)
+                        loaded.append(name)
+            except Exception:
+                for name in reversed(loaded):
+                    cls._release(name)
+                raise
+
+            if loaded:
+                total_seconds = sum(r["load_seconds"] for r in cls._load_report.values())
+                logger.info(
+                    "Model registry ready",
+                    components=cls._load_report,
+                    total_load_seconds=round(total_seconds, 3),
+                    resident_mb=round(_resident_mb(), 1)
+                )
+            return cls._load_report
+
+    @classmethod
+    def _load(cls, name: str) -> None:
+        factory = cls._factories[name]
+        rss_before = _resident_mb()
+        started = time.perf_counter()
+        component = factory()
+        cls._components[name] = component
+        cls._load_report[name] = {
+            "load_seconds": round(time.perf_counter() - started, 3),
+            "resident_mb_delta": round(_resident_mb() - rss_before, 1)
+        }
+        logger.info("Component loaded", component=name, **cls._load_report[name])
+
+    @classmethod
+    def _release(cls, name: str) -> None:
+        component = cls._components.pop(name, None)
+        cls._load_report.pop(name, None)
+        if name == "semantic_retriever" and component is not None:
+            component.close()
+
+    @classmethod
+    def get(cls, name: str) -> Any:
+        """Return a shared component, loading it (and what it depends on) on first use."""
+        component = cls._components.get(name)
+        if component is None:
+            with cls._lock:
+                if name not in cls._components:
+                    cls._load(name)
+                component = cls._components[name]
+        return component
+
+    @classmethod
+    def report(cls) -> Dict[str, Dict[str, float]]:
+        return dict(cls._load_report)
+
+    @classmethod
+    def cleanup(cls):
+        with cls._lock:
+            for name in list(cls._components):
+                cls._release(name)
@@ -40,11 +40,10 @@ class PromptBuilder:
               needs: List[str],
               positive_indicators: str = "") -> str:
         # Select template
-        template_file = self.index["mappings"].get(strategy, self.index["default"])
-        template = self._load_template(template_file)
+        template = self._load_template(self.template_for(strategy))
 
         # Format context
-        context_str = self._format_context(context)
+        context_str = self.format_context(context)
         needs_str = ", ".join(needs) if needs else "general support"
 
         prompt = template.format(
@@ -59,7 +58,12 @@ class PromptBuilder:
         full_prompt = f"{self.system_prompt}\n\n{prompt}"
         return full_prompt
 
-    def _format_context(self, context: Dict) -> str:
+    def template_for(self, strategy: str) -> str:
+        """Template file used for a response strategy."""
+        return self.index["mappings"].get(strategy, self.index["default"])
+
+    def format_context(self, context: Dict) -> str:
+        """Conversation history as it appears in the prompt."""
         messages = context.get("messages", [])[-6:]
         formatted = []
         for msg in messages:
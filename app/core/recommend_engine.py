@@ -1,13 +1,13 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import yaml
 from app.embedding.retriever import SemanticRetriever
 
 class RecommendEngine:
     """Recommendation system (rules + semantic)"""
     
-    def __init__(self):
+    def __init__(self, semantic_retriever: Optional[SemanticRetriever] = None):
         self.load_rules()
-        self.semantic_retriever = SemanticRetriever()
+        self.semantic_retriever = semantic_retriever or SemanticRetriever()
     
     def load_rules(self):
         """Load recommendation rules"""
@@ -43,16 +43,17 @@ class RecommendEngine:
     async def generate(self, needs: List[Dict], stage_info: Dict) -> List[Dict[str, Any]]:
         """Generate personalized recommendations"""
         recommendations = []
+        primary_needs = needs[:2]  # Process top 2 primary needs
         
-        for need in needs[:2]:  # Process top 2 primary needs
+        # Semantic recommendations for all primary needs in one batched search
+        semantic_by_need = await self._get_semantic_recommendations(primary_needs, stage_info)
+        
+        for need, semantic_recs in zip(primary_needs, semantic_by_need):
             need_type = need["type"]
             
             # Rule-based recommendations
             rule_recs = self._get_rule_recommendations(need_type, stage_info)
             
-            # Semantic recommendations
-            semantic_recs = await self._get_semantic_recommendations(need, stage_info)
-            
             # Combine and sort
             combined = self._combine_recommendations(rule_recs, semantic_recs)
             recommendations.extend(combined[:2])
@@ -79,26 +80,32 @@ class RecommendEngine:
         
         return adjusted_recs
     
-    async def _get_semantic_recommendations(self, need: Dict, stage_info: Dict) -> List[Dict]:
-        """Semantic search-based recommendations"""
-        # Construct search query
-        query = f"{need['type']} {stage_info['stage']} ALS patient support"
+    async def _get_semantic_recommendations(self, needs: List[Dict], stage_info: Dict) -> List[List[Dict]]:
+        """Semantic search-based recommendations, one list per need"""
+        if not needs:
+            return []
+        
+        # Construct search queries
+        queries = [f"{need['type']} {stage_info['stage']} ALS patient support" for need in needs]
         
         # Semantic search
-        results = await self.semantic_retriever.search(query, top_k=3)
+        results_by_query = await self.semantic_retriever.search_many(queries, top_k=3)
         
         # Convert to recommendation format
-        semantic_recs = []
-        for result in results:
-            semantic_recs.append({
-                "type": "resource",
-                "name": result.metadata.get("title", "Related resource"),
-                "content": result.content[:200],
-                "score": result.score,
-                "priority": result.score
-            })
+        semantic_by_need = []
+        for results in results_by_query:
+            semantic_recs = []
+            for result in results:
+                semantic_recs.append({
+                    "type": "resource",
+                    "name": result["metadata"].get("title", "Related resource"),
+                    "content": result["content"][:200],
+                    "score": result["score"],
+                    "priority": result["score"]
+                })
+            semantic_by_need.append(semantic_recs)
         
-        return semantic_recs
+        return semantic_by_need
     
     def _combine_recommendations(self, rule_recs: List[Dict], semantic_recs: List[Dict]) -> List[Dict]:
         """Combine rule and semantic recommendations"""
@@ -0,0 +1,154 @@
+import os
+import re
+import json
+import numpy as np
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+
+# Latin words keep inner hyphens/dots ("bi-pap", "c9orf72"); CJK runs become bigrams
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-.][a-z0-9]+)*|[一-鿿]+")
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for match in _TOKEN_PATTERN.findall(text.lower()):
+        if "一" <= match[0] <= "鿿" and len(match) > 1:
+            tokens.extend(match[i:i + 2] for i in range(len(match) - 1))
+        else:
+            tokens.append(match)
+    return tokens
+
+
+def bm25_path(index_path: str) -> str:
+    """Location of the keyword index saved next to a FAISS index."""
+    return f"{os.path.splitext(index_path)[0]}.bm25.npz"
+
+
+class BM25Index:
+    """In-process sparse inverted index scored with Okapi BM25.
+
+    Postings are stored CSR-style (per-term offsets into doc id / weight
+    arrays) and each posting holds its precomputed BM25 impact, so a query
+    is a gather and a sum over the postings of its terms only; documents
+    sharing no term with the query are never touched.
+    """
+
+    def __init__(self, vocabulary: Dict[str, int], offsets: np.ndarray, doc_ids: np.ndarray,
+                 weights: np.ndarray, doc_count: int, avg_length: float,
+                 k1: float = BM25_K1, b: float = BM25_B):
+        self.vocabulary = vocabulary
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.weights = weights
+        self.doc_count = doc_count
+        self.avg_length = avg_length
+        self.k1 = k1
+        self.b = b
+
+    @classmethod
+    def build(cls, texts: Iterable[str], k1: float = BM25_K1, b: float = BM25_B) -> "BM25Index":
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        lengths = []
+        for doc_id, text in enumerate(texts):
+            terms = tokenize(text)
+            lengths.append(len(terms))
+            for term, tf in Counter(terms).items():
+                postings.setdefault(term, []).append((doc_id, tf))
+
+        doc_count = len(lengths)
+        lengths = np.asarray(lengths, dtype="float32")
+        avg_length = float(lengths.mean()) if doc_count else 0.0
+        vocabulary = {term: i for i, term in enumerate(sorted(postings))}
+        offsets = np.zeros(len(vocabulary) + 1, dtype="int64")
+        doc_ids, weights = [], []
+        for term, i in vocabulary.items():
+            ids, tfs = zip(*postings[term])
+            ids = np.asarray(ids, dtype="int32")
+            tfs = np.asarray(tfs, dtype="float32")
+            norm = k1 * (1 - b + b * lengths[ids] / max(avg_length, 1e-6))
+            weights.append(cls._idf(len(ids), doc_count) * tfs * (k1 + 1) / (tfs + norm))
+            doc_ids.append(ids)
+            offsets[i + 1] = offsets[i] + len(ids)
+        return cls(vocabulary, offsets,
+                   np.concatenate(doc_ids) if doc_ids else np.empty(0, dtype="int32"),
+                   np.concatenate(weights).astype("float32") if weights else np.empty(0, dtype="float32"),
+                   doc_count, avg_length, k1, b)
+
+    @staticmethod
+    def _idf(doc_freq: int, doc_count: int) -> float:
+        return float(np.log(1 + (doc_count - doc_freq + 0.5) / (doc_freq + 0.5)))
+
+    def idf(self, term: str) -> float:
+        i = self.vocabulary.get(term)
+        # Terms only seen in newer documents (the WAL delta) are as rare as it gets
+        doc_freq = 0 if i is None else int(self.offsets[i + 1] - self.offsets[i])
+        return self._idf(doc_freq, self.doc_count)
+
+    def __len__(self) -> int:
+        return self.doc_count
+
+    def search(self, query: str, top_k: int,
+               allowed_ids: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (scores, doc ids) of the best matches, highest first.
+
+        ``allowed_ids`` (sorted) restricts the candidates, e.g. to a metadata filter.
+        """
+        term_ids = [self.vocabulary[t] for t in set(tokenize(query)) if t in self.vocabulary]
+        if not term_ids:
+            return np.empty(0, dtype="float32"), np.empty(0, dtype="int64")
+        ids = np.concatenate([self.doc_ids[self.offsets[t]:self.offsets[t + 1]] for t in term_ids])
+        weights = np.concatenate([self.weights[self.offsets[t]:self.offsets[t + 1]] for t in term_ids])
+        candidates, inverse = np.unique(ids, return_inverse=True)
+        scores = np.bincount(inverse, weights=weights).astype("float32")
+        if allowed_ids is not None:
+            keep = np.isin(candidates, allowed_ids, assume_unique=True)
+            candidates, scores = candidates[keep], scores[keep]
+        return self._top(scores, candidates.astype("int64"), top_k)
+
+    def score_texts(self, query: str, texts: List[str], top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Score documents outside the index (e.g. the WAL delta) with this index's statistics."""
+        terms = set(tokenize(query))
+        idf = {t: self.idf(t) for t in terms}
+        scores = np.zeros(len(texts), dtype="float32")
+        for i, text in enumerate(texts):
+            doc_terms = tokenize(text)
+            counts = Counter(t for t in doc_terms if t in terms)
+            norm = self.k1 * (1 - self.b + self.b * len(doc_terms) / max(self.avg_length, 1e-6))
+            scores[i] = sum(idf[t] * tf * (self.k1 + 1) / (tf + norm) for t, tf in counts.items())
+        matched = np.flatnonzero(scores > 0)
+        return self._top(scores[matched], matched.astype("int64"), top_k)
+
+    @staticmethod
+    def _top(scores: np.ndarray, ids: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if len(scores) > top_k:
+            best = np.argpartition(-scores, top_k - 1)[:top_k]
+            scores, ids = scores[best], ids[best]
+        order = np.argsort(-scores, kind="stable")
+        return scores[order], ids[order]
+
+    def is_lexical(self, query: str, max_terms: int, min_idf: float) -> bool:
+        """Short queries made of known terms, at least one of them rare (drug names,
+        device acronyms), are answered well by keywords alone."""
+        terms = set(tokenize(query))
+        if not terms or len(terms) > max_terms or any(t not in self.vocabulary for t in terms):
+            return False
+        return max(self.idf(t) for t in terms) >= min_idf
+
+    def save(self, path: str) -> None:
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path,
+                 vocabulary=np.frombuffer(json.dumps(list(self.vocabulary)).encode("utf-8"), dtype="uint8"),
+                 offsets=self.offsets, doc_ids=self.doc_ids, weights=self.weights,
+                 stats=np.asarray([self.doc_count, self.avg_length, self.k1, self.b], dtype="float64"))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with np.load(path, allow_pickle=False) as data:
+            terms = json.loads(data["vocabulary"].tobytes().decode("utf-8"))
+            doc_count, avg_length, k1, b = data["stats"].tolist()
+            return cls({term: i for i, term in enumerate(terms)}, data["offsets"], data["doc_ids"],
+                       data["weights"], int(doc_count), avg_length, k1, b)
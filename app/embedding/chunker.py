@@ -0,0 +1,158 @@
+import os
+import re
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+# all-MiniLM-L6-v2 truncates at 256 word pieces, including [CLS] and [SEP]
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "254"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+CHUNK_TOKENIZER = os.getenv("CHUNK_TOKENIZER", "sentence-transformers/all-MiniLM-L6-v2")
+
+HEADING_PATTERN = re.compile(r"^#{1,6}\s+(.*)$")
+PARAGRAPH_PATTERN = re.compile(r"\n\s*\n")
+
+# Sentence boundary splitters; "auto" handles mixed English / Chinese text
+SENTENCE_SPLITTERS: Dict[str, "re.Pattern"] = {
+    "en": re.compile(r"(?<=[.!?])\s+"),
+    "zh": re.compile(r"(?<=[。！？；])"),
+    "auto": re.compile(r"(?<=[.!?])\s+|(?<=[。！？；])"),
+}
+
+CJK_SENTENCE_END = ("。", "！", "？", "；")
+
+_APPROX_TOKEN_PATTERN = re.compile(r"[一-鿿]|[A-Za-z]+|\d+|[^\sA-Za-z\d一-鿿]")
+
+
+def approximate_token_count(text: str) -> int:
+    """Word-piece estimate without a tokenizer: one per word, number, symbol or CJK character."""
+    return len(_APPROX_TOKEN_PATTERN.findall(text))
+
+
+_tokenizers: Dict[str, Callable[[str], int]] = {}
+
+
+def tokenizer_token_count(model_name: str = CHUNK_TOKENIZER) -> Callable[[str], int]:
+    """Exact token counter for the embedding model, or the approximation if transformers is unavailable."""
+    if model_name not in _tokenizers:
+        try:
+            from transformers import AutoTokenizer
+            tokenizer = AutoTokenizer.from_pretrained(model_name)
+            _tokenizers[model_name] = lambda text: len(tokenizer.tokenize(text))
+        except Exception:
+            _tokenizers[model_name] = approximate_token_count
+    return _tokenizers[model_name]
+
+
+class Chunker:
+    """Sentence-aware chunker sized in model tokens.
+
+    Markdown headings start a new section (chunks never span two sections),
+    sections are split into sentences with a pluggable boundary pattern, and
+    sentences are packed into chunks of at most ``max_tokens`` with about
+    ``overlap_tokens`` of trailing sentences repeated at the start of the next
+    chunk. Every sentence is tokenized once and joined once, so construction
+    is linear in the input length.
+    """
+
+    def __init__(self,
+                 max_tokens: int = CHUNK_MAX_TOKENS,
+                 overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+                 language: str = "auto",
+                 token_counter: Optional[Callable[[str], int]] = None,
+                 markdown: bool = True):
+        if language not in SENTENCE_SPLITTERS:
+            raise ValueError(f"Unknown language '{language}', expected one of {list(SENTENCE_SPLITTERS)}")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = min(overlap_tokens, max_tokens // 2)
+        self.splitter = SENTENCE_SPLITTERS[language]
+        self.count_tokens = token_counter or approximate_token_count
+        self.markdown = markdown
+
+    def chunk(self, text: str) -> List[str]:
+        return [content for _, content in self.chunk_sections(text)]
+
+    def chunk_sections(self, text: str) -> List[Tuple[Optional[str], str]]:
+        """Return (section heading or None, chunk text) pairs in document order."""
+        chunks = []
+        for heading, body in self._sections(text):
+            for content in self._pack(self._sentences(body)):
+                chunks.append((heading, content))
+        return chunks
+
+    def _sections(self, text: str) -> List[Tuple[Optional[str], str]]:
+        if not self.markdown:
+            return [(None, text)]
+        sections, heading, lines = [], None, []
+        for line in text.splitlines():
+            match = HEADING_PATTERN.match(line)
+            if match:
+                if any(l.strip() for l in lines):
+                    sections.append((heading, "\n".join(lines)))
+                # The heading is its own paragraph, so it never merges into a sentence
+                heading, lines = match.group(1).strip(), [line, ""]
+            else:
+                lines.append(line)
+        if any(l.strip() for l in lines):
+            sections.append((heading, "\n".join(lines)))
+        return sections
+
+    def _sentences(self, text: str) -> List[Tuple[str, int]]:
+        """Split into (sentence, token count), breaking up sentences longer than a chunk."""
+        sentences = []
+        # Blank lines (paragraphs, list blocks) are boundaries even without punctuation
+        for paragraph in PARAGRAPH_PATTERN.split(text):
+            for sentence in self.splitter.split(" ".join(paragraph.split())):
+                sentence = sentence.strip()
+                if not sentence:
+                    continue
+                tokens = self.count_tokens(sentence)
+                if tokens <= self.max_tokens:
+                    sentences.append((sentence, tokens))
+                else:
+                    sentences.extend(self._hard_split(sentence))
+        return sentences
+
+    def _hard_split(self, sentence: str) -> List[Tuple[str, int]]:
+        # Words for spaced scripts, characters for CJK runs without spaces
+        units = sentence.split(" ") if " " in sentence else list(sentence)
+        joiner = " " if " " in sentence else ""
+        pieces, current, current_tokens = [], [], 0
+        for unit in units:
+            unit_tokens = self.count_tokens(unit) or 1
+            if current and current_tokens + unit_tokens > self.max_tokens:
+                pieces.append((joiner.join(current), current_tokens))
+                current, current_tokens = [], 0
+            current.append(unit)
+            current_tokens += unit_tokens
+        if current:
+            pieces.append((joiner.join(current), current_tokens))
+        return pieces
+
+    def _pack(self, sentences: List[Tuple[str, int]]) -> List[str]:
+        chunks = []
+        window: deque = deque()  # sentences in the current chunk
+        window_tokens = 0
+        fresh = 0  # sentences in the window not yet emitted in a previous chunk
+        for sentence, tokens in sentences:
+            if window and window_tokens + tokens > self.max_tokens:
+                chunks.append(self._join(window))
+                # Carry trailing sentences over as overlap
+                while window and (window_tokens > self.overlap_tokens or window_tokens + tokens > self.max_tokens):
+                    window_tokens -= window.popleft()[1]
+                fresh = 0
+            window.append((sentence, tokens))
+            window_tokens += tokens
+            fresh += 1
+        if fresh:
+            chunks.append(self._join(window))
+        return chunks
+
+    @staticmethod
+    def _join(sentences) -> str:
+        # No space after Chinese sentence punctuation
+        parts = []
+        for sentence, _ in sentences:
+            if parts and not parts[-1].endswith(CJK_SENTENCE_END):
+                parts.append(" ")
+            parts.append(sentence)
+        return "".join(parts)
@@ -0,0 +1,226 @@
+import os
+import sys
+import json
+import mmap
+import pickle
+import struct
+import numpy as np
+from typing import List, Dict, Any, Iterable
+
+MAGIC = b"ALSDOCS1"
+FORMAT_VERSION = 2
+ALIGNMENT = 8
+
+# Columns with a fixed place in the file; any other metadata key goes to "extra" as JSON
+CORE_FIELDS = ("id", "content", "source", "chunk_index")
+# Filterable fields, dictionary-encoded like source when their value is a scalar
+CATEGORY_FIELDS = ("topic", "stage")
+
+
+def _pad(length: int) -> int:
+    return (ALIGNMENT - length % ALIGNMENT) % ALIGNMENT
+
+
+class DocStore:
+    """Read-only, memory-mapped columnar store for index chunk metadata.
+
+    File layout (little endian)::
+
+        MAGIC | uint64 header length | JSON header | padding | column sections
+
+    Text columns (content, id, extra) are one UTF-8 blob plus a uint64 offsets
+    array; source, topic and stage are dictionary-encoded into int32 codes (-1
+    when missing), so filters can be resolved without touching the documents;
+    chunk_index is int32.
+    Opening the file only parses the header, so load time does not depend on the
+    corpus size, and every process mapping the file shares the OS page cache.
+    Documents are materialized as dicts only when indexed.
+
+    Documents appended after loading are kept in memory until the store is
+    rewritten with ``DocStore.write``.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a document store file.")
+        (header_len,) = struct.unpack_from("<Q", self._mmap, len(MAGIC))
+        header_start = len(MAGIC) + 8
+        self.header = json.loads(self._mmap[header_start:header_start + header_len])
+        if self.header["version"] > FORMAT_VERSION:
+            raise ValueError(f"Unsupported document store version {self.header['version']}.")
+
+        self._data_start = header_start + header_len + _pad(header_start + header_len)
+        self._count = self.header["count"]
+        self.sources: List[str] = self.header["sources"]
+        columns = self.header["columns"]
+        self._content_offsets = self._array(columns["content_offsets"])
+        self._id_offsets = self._array(columns["id_offsets"])
+        self._extra_offsets = self._array(columns["extra_offsets"])
+        self.source_codes = self._array(columns["source_codes"])
+        self.chunk_indices = self._array(columns["chunk_index"])
+        # Version 1 files have no category columns
+        self.categories: Dict[str, List[Any]] = self.header.get("categories", {})
+        self.category_codes: Dict[str, np.ndarray] = {
+            field: self._array(columns[f"{field}_codes"]) for field in self.categories
+        }
+        self._blobs = {name: columns[name]["offset"] for name in ("content", "ids", "extra")}
+        self._tail: List[Dict] = []
+
+    def _array(self, column: Dict[str, Any]) -> np.ndarray:
+        return np.frombuffer(self._mmap, dtype=column["dtype"], count=column["length"],
+                             offset=self._data_start + column["offset"])
+
+    def _text(self, blob: str, offsets: np.ndarray, idx: int) -> str:
+        start = self._data_start + self._blobs[blob]
+        return self._mmap[start + int(offsets[idx]):start + int(offsets[idx + 1])].decode("utf-8")
+
+    def __len__(self) -> int:
+        return self._count + len(self._tail)
+
+    def __getitem__(self, idx: int) -> Dict[str, Any]:
+        idx = int(idx)
+        if idx < 0:
+            idx += len(self)
+        if idx >= self._count:
+            return self._tail[idx - self._count]
+        if idx < 0:
+            raise IndexError("document index out of range")
+
+        doc = {
+            "id": self._text("ids", self._id_offsets, idx),
+            "content": self._text("content", self._content_offsets, idx),
+            "source": self.sources[self.source_codes[idx]],
+            "chunk_index": int(self.chunk_indices[idx]),
+        }
+        for field, codes in self.category_codes.items():
+            if codes[idx] >= 0:
+                doc[field] = self.categories[field][codes[idx]]
+        extra = self._text("extra", self._extra_offsets, idx)
+        if extra:
+            doc.update(json.loads(extra))
+        return doc
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def content(self, idx: int) -> str:
+        """Return only the chunk text, without materializing the other fields."""
+        idx = int(idx)
+        if idx >= self._count:
+            return self._tail[idx - self._count]["content"]
+        return self._text("content", self._content_offsets, idx)
+
+    def append(self, document: Dict):
+        self._tail.append(document)
+
+    def extend(self, documents: Iterable[Dict]):
+        self._tail.extend(documents)
+
+    def close(self):
+        # numpy views must be released before the map can be closed
+        self._content_offsets = self._id_offsets = self._extra_offsets = None
+        self.source_codes = self.chunk_indices = None
+        self.category_codes = {}
+        self._mmap.close()
+        self._file.close()
+
+    @staticmethod
+    def write(path: str, documents: Iterable[Dict]) -> None:
+        """Write documents to ``path`` atomically (readers keep the old mapping)."""
+        contents, ids, extras = [], [], []
+        source_table: Dict[str, int] = {}
+        source_codes, chunk_indices = [], []
+        category_tables: Dict[str, Dict[Any, int]] = {field: {} for field in CATEGORY_FIELDS}
+        category_codes: Dict[str, List[int]] = {field: [] for field in CATEGORY_FIELDS}
+        for doc in documents:
+            contents.append(doc.get("content", "").encode("utf-8"))
+            ids.append(str(doc.get("id", "")).encode("utf-8"))
+            source = doc.get("source", "")
+            source_codes.append(source_table.setdefault(source, len(source_table)))
+            chunk_indices.append(doc.get("chunk_index", -1))
+            columnar = set(CORE_FIELDS)
+            for field in CATEGORY_FIELDS:
+                value = doc.get(field)
+                if isinstance(value, (str, int)) and not isinstance(value, bool):
+                    category_codes[field].append(category_tables[field].setdefault(value, len(category_tables[field])))
+                    columnar.add(field)
+                else:
+                    category_codes[field].append(-1)
+            extra = {k: v for k, v in doc.items() if k not in columnar}
+            extras.append(json.dumps(extra, ensure_ascii=False).encode("utf-8") if extra else b"")
+
+        def offsets(blobs: List[bytes]) -> np.ndarray:
+            out = np.zeros(len(blobs) + 1, dtype="<u8")
+            np.cumsum([len(b) for b in blobs], out=out[1:])
+            return out
+
+        sections = [
+            ("content_offsets", offsets(contents)),
+            ("id_offsets", offsets(ids)),
+            ("extra_offsets", offsets(extras)),
+            ("source_codes", np.asarray(source_codes, dtype="<i4")),
+            ("chunk_index", np.asarray(chunk_indices, dtype="<i4")),
+        ] + [
+            (f"{field}_codes", np.asarray(category_codes[field], dtype="<i4")) for field in CATEGORY_FIELDS
+        ] + [
+            ("content", b"".join(contents)),
+            ("ids", b"".join(ids)),
+            ("extra", b"".join(extras)),
+        ]
+
+        columns, position = {}, 0
+        for name, data in sections:
+            columns[name] = {"offset": position}
+            if isinstance(data, np.ndarray):
+                columns[name].update(dtype=data.dtype.str, length=len(data))
+                nbytes = data.nbytes
+            else:
+                nbytes = len(data)
+            columns[name]["nbytes"] = nbytes
+            position += nbytes + _pad(nbytes)
+
+        header = json.dumps({
+            "version": FORMAT_VERSION,
+            "count": len(contents),
+            "sources": list(source_table),
+            "categories": {field: list(category_tables[field]) for field in CATEGORY_FIELDS},
+            "columns": columns,
+        }).encode("utf-8")
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<Q", len(header)))
+            f.write(header)
+            f.write(b"\0" * _pad(len(MAGIC) + 8 + len(header)))
+            for _, data in sections:
+                raw = data.tobytes() if isinstance(data, np.ndarray) else data
+                f.write(raw)
+                f.write(b"\0" * _pad(len(raw)))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+
+def load_metadata(metadata_path: str):
+    """Open index metadata: a DocStore, or a legacy pickled list of dicts."""
+    if metadata_path.endswith(".pkl"):
+        with open(metadata_path, "rb") as f:
+            return pickle.load(f)
+    return DocStore(metadata_path)
+
+
+if __name__ == "__main__":
+    # Convert legacy pickled metadata: python -m app.embedding.doc_store metadata.pkl metadata.docs
+    if len(sys.argv) != 3:
+        print("usage: python -m app.embedding.doc_store <metadata.pkl> <metadata.docs>")
+        sys.exit(1)
+    with open(sys.argv[1], "rb") as f:
+        legacy = pickle.load(f)
+    DocStore.write(sys.argv[2], legacy)
+    print(f"Wrote {len(legacy)} documents to {sys.argv[2]}.")
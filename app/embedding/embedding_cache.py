@@ -0,0 +1,98 @@
+import os
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from typing import Callable, Dict, List, Sequence
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding/faiss_index/embeddings.sqlite")
+
+# SQLite limits the number of bound parameters per statement
+_LOOKUP_BATCH = 500
+
+
+def content_hash(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """Persistent embedding store keyed by (model name, content hash).
+
+    Index rebuilds look every chunk up here and only send texts the model has
+    never seen to the encoder, so rebuild cost follows the diff, not the corpus.
+    Identical chunks (repeated boilerplate, files copied across folders) are
+    encoded once per call even on a cold cache.
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, model_name: str = ""):
+        self.path = path
+        self.model_name = model_name
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL,"
+            " hash BLOB NOT NULL,"
+            " dimension INTEGER NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " PRIMARY KEY (model, hash)"
+            ") WITHOUT ROWID"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "duplicates": 0}
+
+    def get_many(self, hashes: Sequence[bytes]) -> Dict[bytes, np.ndarray]:
+        found: Dict[bytes, np.ndarray] = {}
+        with self._lock:
+            for start in range(0, len(hashes), _LOOKUP_BATCH):
+                batch = list(hashes[start:start + _LOOKUP_BATCH])
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT hash, dimension, vector FROM embeddings WHERE model = ? AND hash IN ({placeholders})",
+                    [self.model_name] + batch
+                )
+                for key, dimension, vector in rows:
+                    found[bytes(key)] = np.frombuffer(vector, dtype="<f4", count=dimension)
+        return found
+
+    def put_many(self, hashes: Sequence[bytes], vectors: np.ndarray) -> None:
+        vectors = np.ascontiguousarray(vectors, dtype="<f4")
+        rows = [(self.model_name, key, vectors.shape[1], vector.tobytes()) for key, vector in zip(hashes, vectors)]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+            self._conn.commit()
+
+    def encode(self, texts: List[str], encode_fn: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """Embed texts, encoding only unique texts missing from the cache."""
+        hashes = [content_hash(text) for text in texts]
+        unique: Dict[bytes, str] = {}
+        for key, text in zip(hashes, texts):
+            unique.setdefault(key, text)
+
+        vectors = self.get_many(list(unique))
+        missing = [key for key in unique if key not in vectors]
+        if missing:
+            encoded = np.asarray(encode_fn([unique[key] for key in missing]), dtype="float32")
+            self.put_many(missing, encoded)
+            vectors.update(zip(missing, encoded))
+
+        self.stats["hits"] += len(unique) - len(missing)
+        self.stats["misses"] += len(missing)
+        self.stats["duplicates"] += len(texts) - len(unique)
+        if not texts:
+            return np.empty((0, 0), dtype="float32")
+        return np.vstack([vectors[key] for key in hashes]).astype("float32")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings WHERE model = ?",
+                                      (self.model_name,)).fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
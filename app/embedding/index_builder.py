@@ -1,28 +1,163 @@
 import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
-import pickle
 import os
-from typing import List, Dict
+import json
+import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from typing import List, Dict, Any, Iterator, Tuple
+
+from app.embedding.bm25_index import BM25Index, bm25_path
+from app.embedding.chunker import Chunker, CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS, tokenizer_token_count
+from app.embedding.doc_store import DocStore, load_metadata
+from app.embedding.embedding_cache import EmbeddingCache, EMBEDDING_CACHE_PATH
+from app.utils import metrics
+from app.utils.inference_backends import EMBEDDING_BACKEND, backend_model_key, load_text_embedder
+
+# flat | ivf_flat | hnsw | ivf_pq
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat")
+FAISS_IVF_NLIST = int(os.getenv("FAISS_IVF_NLIST", "1024"))
+FAISS_IVF_NPROBE = int(os.getenv("FAISS_IVF_NPROBE", "16"))
+FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+FAISS_HNSW_EF_CONSTRUCTION = int(os.getenv("FAISS_HNSW_EF_CONSTRUCTION", "200"))
+FAISS_HNSW_EF_SEARCH = int(os.getenv("FAISS_HNSW_EF_SEARCH", "64"))
+FAISS_PQ_M = int(os.getenv("FAISS_PQ_M", "48"))  # sub-quantizers, must divide the dimension
+FAISS_PQ_NBITS = int(os.getenv("FAISS_PQ_NBITS", "8"))
+
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+
+# Streaming ingestion
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))  # chunks per encode call
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "64"))  # chunked files waiting for the encoder
+INGEST_CHECKPOINT_EVERY = int(os.getenv("INGEST_CHECKPOINT_EVERY", "20"))  # batches
+INGEST_TRAIN_SIZE = int(os.getenv("INGEST_TRAIN_SIZE", "20000"))  # vectors buffered to train IVF indexes
+
+
+def load_file_chunks(filepath: str, max_tokens: int = CHUNK_MAX_TOKENS,
+                     overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> List[Dict]:
+    """Read one txt/md file and return its chunk documents (runs in ingest worker processes)"""
+    filename = os.path.basename(filepath)
+    with open(filepath, "r", encoding="utf-8") as f:
+        content = f.read()
+    chunker = Chunker(max_tokens, overlap_tokens, token_counter=tokenizer_token_count(),
+                      markdown=filename.endswith(".md"))
+    documents = []
+    for i, (section, chunk) in enumerate(chunker.chunk_sections(content)):
+        document = {"id": f"{filename}_{i}", "content": chunk, "source": filename, "chunk_index": i}
+        if section:
+            document["section"] = section
+        documents.append(document)
+    return documents
+
+
+def _list_documents(docs_dir: str) -> List[str]:
+    return sorted(f for f in os.listdir(docs_dir) if f.endswith(".md") or f.endswith(".txt"))
 
 class IndexBuilder:
     """Faiss index builder for semantic search"""
 
-    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
-        self.model = SentenceTransformer(model_name)
+    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2", index_type: str = None,
+                 cache_path: str = None, backend: str = None):
+        self.backend = backend or EMBEDDING_BACKEND
+        self.model = load_text_embedder(model_name, self.backend)
+        self.model_name = model_name
         self.dimension = self.model.get_sentence_embedding_dimension()
+        self.index_type = index_type or FAISS_INDEX_TYPE
+        if self.index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type '{self.index_type}', expected one of {INDEX_TYPES}")
         self.index = None
         self.metadata: List[Dict] = []
+        # An empty EMBEDDING_CACHE_PATH (or cache_path="") disables the embedding cache
+        cache_path = EMBEDDING_CACHE_PATH if cache_path is None else cache_path
+        cache_key = backend_model_key(model_name, self.backend)
+        self.embedding_cache = EmbeddingCache(cache_path, cache_key) if cache_path else None
+
+    def _encode(self, texts: List[str], show_progress_bar: bool = False) -> np.ndarray:
+        """Encode texts, reusing cached embeddings and encoding duplicate texts once"""
+        def encode(batch: List[str]) -> np.ndarray:
+            return self.model.encode(batch, batch_size=64, show_progress_bar=show_progress_bar)
+
+        if self.embedding_cache is None or not texts:
+            return np.asarray(encode(texts), dtype="float32").reshape(len(texts), self.dimension)
+        return self.embedding_cache.encode(texts, encode)
 
-    def build_index(self, documents: List[Dict]) -> None:
+    def build_index(self, documents: List[Dict], report: bool = True) -> None:
         """Build Faiss index from given documents"""
         texts = [doc["content"] for doc in documents]
-        embeddings = self.model.encode(texts, show_progress_bar=True)
+        started = time.perf_counter()
+        embeddings = self._encode(texts, show_progress_bar=True)
+        encode_seconds = time.perf_counter() - started
 
-        self.index = faiss.IndexFlatL2(self.dimension)
-        self.index.add(embeddings.astype("float32"))
+        self.index = self._create_index(embeddings)
+        self.index.add(embeddings)
         self.metadata = documents
-        print(f"Index built successfully with {len(documents)} documents.")
+        print(f"Index built successfully with {len(documents)} documents ({self.index_type}).")
+        if self.embedding_cache is not None:
+            print(f"Embedding cache: {self.embedding_cache.stats}, encoded in {encode_seconds:.2f}s.")
+        if report:
+            self.evaluate_index(embeddings)
+
+    def _create_index(self, embeddings: np.ndarray) -> faiss.Index:
+        """Create (and train, if needed) an empty index of the configured type"""
+        n = len(embeddings)
+        if self.index_type == "flat":
+            return faiss.IndexFlatL2(self.dimension)
+
+        if self.index_type == "hnsw":
+            index = faiss.IndexHNSWFlat(self.dimension, FAISS_HNSW_M)
+            index.hnsw.efConstruction = FAISS_HNSW_EF_CONSTRUCTION
+            index.hnsw.efSearch = FAISS_HNSW_EF_SEARCH
+            return index
+
+        # IVF: ~4*sqrt(N) centroids, and k-means needs at least one training point per centroid
+        nlist = max(1, min(FAISS_IVF_NLIST, int(4 * np.sqrt(n)), n))
+        quantizer = faiss.IndexFlatL2(self.dimension)
+        if self.index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, self.dimension, nlist)
+        else:
+            if self.dimension % FAISS_PQ_M != 0:
+                raise ValueError(f"FAISS_PQ_M={FAISS_PQ_M} must divide the embedding dimension {self.dimension}")
+            # PQ codebooks need at least 2**nbits training points
+            nbits = max(1, min(FAISS_PQ_NBITS, int(np.log2(max(n, 2)))))
+            index = faiss.IndexIVFPQ(quantizer, self.dimension, nlist, FAISS_PQ_M, nbits)
+        index.train(embeddings)
+        index.nprobe = min(FAISS_IVF_NPROBE, nlist)
+        return index
+
+    def evaluate_index(self, embeddings: np.ndarray, k: int = 10, num_queries: int = 200) -> Dict[str, Any]:
+        """Report recall@k against exact (flat) search, query latency and index size"""
+        if self.index is None:
+            raise ValueError("Index not built or loaded.")
+        k = min(k, len(embeddings))
+        rng = np.random.default_rng(0)
+        sample = rng.choice(len(embeddings), size=min(num_queries, len(embeddings)), replace=False)
+        queries = embeddings[sample]
+
+        exact = faiss.IndexFlatL2(self.dimension)
+        exact.add(embeddings)
+        _, truth = exact.search(queries, k)
+
+        latencies_ms, hits = [], 0
+        for query, expected in zip(queries, truth):
+            started = time.perf_counter()
+            _, found = self.index.search(query.reshape(1, -1), k)
+            latencies_ms.append((time.perf_counter() - started) * 1000)
+            hits += len(set(found[0]) & set(expected))
+
+        report = {
+            "index_type": self.index_type,
+            "documents": int(self.index.ntotal),
+            f"recall@{k}": round(hits / (len(queries) * k), 4),
+            "latency_ms": metrics.percentiles(latencies_ms),
+            "index_bytes": int(faiss.serialize_index(self.index).size),
+            "flat_bytes": int(embeddings.nbytes),
+        }
+        print(f"Index report: {report}")
+        return report
 
     def add_to_index(self, new_documents: List[Dict]) -> None:
         """Add new documents to an existing index"""
@@ -30,8 +165,7 @@ class IndexBuilder:
             raise ValueError("Please build or load an index first.")
 
         texts = [doc["content"] for doc in new_documents]
-        embeddings = self.model.encode(texts, show_progress_bar=False)
-        self.index.add(embeddings.astype("float32"))
+        self.index.add(self._encode(texts))
         self.metadata.extend(new_documents)
         print(f"Added {len(new_documents)} new documents to the index.")
 
@@ -40,8 +174,9 @@ class IndexBuilder:
         if self.index is None:
             raise ValueError("No index to save.")
         faiss.write_index(self.index, index_path)
-        with open(metadata_path, "wb") as f:
-            pickle.dump(self.metadata, f)
+        DocStore.write(metadata_path, self.metadata)
+        # Keyword index for hybrid search, built over the same document ids
+        BM25Index.build(doc["content"] for doc in self.metadata).save(bm25_path(index_path))
         print(f"Index saved to {index_path} and metadata saved to {metadata_path}.")
 
     def load_index(self, index_path: str, metadata_path: str) -> None:
@@ -49,8 +184,7 @@ class IndexBuilder:
         if not os.path.exists(index_path) or not os.path.exists(metadata_path):
             raise FileNotFoundError("Index or metadata file not found.")
         self.index = faiss.read_index(index_path)
-        with open(metadata_path, "rb") as f:
-            self.metadata = pickle.load(f)
+        self.metadata = load_metadata(metadata_path)
         print(f"Index loaded with {len(self.metadata)} documents.")
 
     def search(self, query: str, top_k: int = 3) -> List[Dict]:
@@ -70,31 +204,191 @@ class IndexBuilder:
     def load_documents(self, docs_dir: str) -> List[Dict]:
         """Load documents from a directory (txt/md files)"""
         documents = []
-        for filename in os.listdir(docs_dir):
-            if filename.endswith(".md") or filename.endswith(".txt"):
-                filepath = os.path.join(docs_dir, filename)
-                with open(filepath, "r", encoding="utf-8") as f:
-                    content = f.read()
-                chunks = self.split_text(content)
-                for i, chunk in enumerate(chunks):
-                    documents.append({
-                        "id": f"{filename}_{i}",
-                        "content": chunk,
-                        "source": filename,
-                        "chunk_index": i
-                    })
+        for filename in _list_documents(docs_dir):
+            documents.extend(load_file_chunks(os.path.join(docs_dir, filename)))
         return documents
 
-    def split_text(self, text: str, chunk_size: int = 500, overlap: int = 50) -> List[str]:
-        """Split text into overlapping chunks"""
-        chunks, current_chunk = [], ""
-        sentences = text.replace("\n", " ").split("。")
-        for sentence in sentences:
-            if len(current_chunk) + len(sentence) < chunk_size:
-                current_chunk += sentence + "。"
-            else:
-                chunks.append(current_chunk)
-                current_chunk = current_chunk[-overlap:] + sentence + "。"
-        if current_chunk:
-            chunks.append(current_chunk)
-        return chunks
+    def split_text(self, text: str, max_tokens: int = None, overlap_tokens: int = None) -> List[str]:
+        """Split text into overlapping chunks sized in model tokens"""
+        max_tokens = max_tokens or min(CHUNK_MAX_TOKENS, self.model.max_seq_length - 2)
+        overlap_tokens = CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+        return Chunker(max_tokens, overlap_tokens, token_counter=self._count_tokens).chunk(text)
+
+    def _count_tokens(self, text: str) -> int:
+        return len(self.model.tokenizer.tokenize(text))
+
+    def ingest_directory(self, docs_dir: str, index_path: str, metadata_path: str,
+                         batch_size: int = None, workers: int = None) -> Dict[str, Any]:
+        """Stream a directory into a saved index, resuming from a checkpoint if present.
+
+        Files are read and chunked in a process pool, flow through a bounded queue
+        into batched encoding, and vectors are appended to the index as they come.
+        Batches always hold whole files, so a checkpoint (partial index, metadata
+        log and list of finished files) never contains half a file.
+        """
+        batch_size = batch_size or INGEST_BATCH_SIZE
+        checkpoint_path = f"{index_path}.checkpoint.json"
+        partial_index_path = f"{index_path}.partial"
+        partial_metadata_path = f"{index_path}.partial.jsonl"
+
+        done_files = self._resume_ingest(checkpoint_path, partial_index_path, partial_metadata_path)
+        pending_files = [f for f in _list_documents(docs_dir) if f not in done_files]
+        print(f"Ingesting {len(pending_files)} files ({len(done_files)} already done).")
+
+        started = time.perf_counter()
+        stats = {"files": 0, "chunks": 0}
+        batch_docs: List[Dict] = []
+        batch_files: List[str] = []
+        train_vectors: List[np.ndarray] = []  # buffered until an IVF index can be trained
+        train_files: List[str] = []
+        batches = 0
+
+        with open(partial_metadata_path, "a", encoding="utf-8") as metadata_log:
+            def flush_batch():
+                nonlocal batches
+                if not batch_docs:
+                    return
+                vectors = self._encode([d["content"] for d in batch_docs])
+                metadata_log.write("".join(json.dumps(d, ensure_ascii=False) + "\n" for d in batch_docs))
+                self.metadata.extend(batch_docs)
+                stats["chunks"] += len(batch_docs)
+
+                if self.index is None and self.index_type != "flat":
+                    train_vectors.append(vectors)
+                    train_files.extend(batch_files)
+                    if sum(len(v) for v in train_vectors) >= INGEST_TRAIN_SIZE:
+                        self._train_and_add(train_vectors)
+                        done_files.update(train_files)
+                        train_vectors.clear()
+                        train_files.clear()
+                else:
+                    if self.index is None:
+                        self.index = self._create_index(vectors)
+                    self.index.add(vectors)
+                    done_files.update(batch_files)
+
+                batch_docs.clear()
+                batch_files.clear()
+                batches += 1
+                if batches % INGEST_CHECKPOINT_EVERY == 0 and not train_vectors:
+                    metadata_log.flush()
+                    self._write_checkpoint(checkpoint_path, partial_index_path, done_files)
+
+            # Closed explicitly so a failure here stops the producer right away
+            with closing(self._stream_file_chunks(docs_dir, pending_files, workers or INGEST_WORKERS)) as stream:
+                for filename, chunks in stream:
+                    batch_docs.extend(chunks)
+                    batch_files.append(filename)
+                    stats["files"] += 1
+                    if len(batch_docs) >= batch_size:
+                        flush_batch()
+            flush_batch()
+            if train_vectors:
+                self._train_and_add(train_vectors)
+
+        if self.index is None:
+            raise ValueError(f"No documents found in {docs_dir}.")
+        self.save_index(index_path, metadata_path)
+        for path in (checkpoint_path, partial_index_path, partial_metadata_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+        elapsed = time.perf_counter() - started
+        stats.update({
+            "seconds": round(elapsed, 2),
+            "docs_per_second": round(stats["files"] / elapsed, 2) if elapsed else 0.0,
+            "chunks_per_second": round(stats["chunks"] / elapsed, 2) if elapsed else 0.0,
+            "total_documents": int(self.index.ntotal),
+        })
+        if self.embedding_cache is not None:
+            stats["embedding_cache"] = dict(self.embedding_cache.stats)
+        print(f"Ingestion finished: {stats}")
+        return stats
+
+    def _stream_file_chunks(self, docs_dir: str, filenames: List[str], workers: int) -> Iterator[Tuple[str, List[Dict]]]:
+        """Chunk files in a process pool, yielding results in order through a bounded queue"""
+        chunk_queue: "queue.Queue" = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+        sentinel = object()
+        # Set when the consumer stops early (e.g. an encode failure), so the producer never blocks on a full queue
+        stop = threading.Event()
+
+        def put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    chunk_queue.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def produce():
+            try:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    in_flight = deque()
+                    try:
+                        for filename in filenames:
+                            in_flight.append((filename, pool.submit(load_file_chunks, os.path.join(docs_dir, filename))))
+                            # Keep only a few files in flight so memory stays bounded
+                            if len(in_flight) >= workers * 2:
+                                name, future = in_flight.popleft()
+                                if not put((name, future.result())):
+                                    return
+                        while in_flight:
+                            name, future = in_flight.popleft()
+                            if not put((name, future.result())):
+                                return
+                    finally:
+                        for _, future in in_flight:
+                            future.cancel()
+            except Exception as e:
+                put(e)
+            finally:
+                put(sentinel)
+
+        producer = threading.Thread(target=produce, name="ingest-producer", daemon=True)
+        producer.start()
+        try:
+            while True:
+                item = chunk_queue.get()
+                if item is sentinel:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            producer.join()
+
+    def _train_and_add(self, vector_batches: List[np.ndarray]) -> None:
+        vectors = np.vstack(vector_batches)
+        self.index = self._create_index(vectors)
+        self.index.add(vectors)
+
+    def _write_checkpoint(self, checkpoint_path: str, partial_index_path: str, done_files: set) -> None:
+        faiss.write_index(self.index, f"{partial_index_path}.tmp")
+        os.replace(f"{partial_index_path}.tmp", partial_index_path)
+        with open(f"{checkpoint_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump({"done_files": sorted(done_files), "ntotal": int(self.index.ntotal)}, f)
+        os.replace(f"{checkpoint_path}.tmp", checkpoint_path)
+
+    def _resume_ingest(self, checkpoint_path: str, partial_index_path: str, partial_metadata_path: str) -> set:
+        """Restore index and metadata from the last checkpoint; return the finished files"""
+        self.index, self.metadata = None, []
+        if not os.path.exists(checkpoint_path):
+            if os.path.exists(partial_metadata_path):
+                os.remove(partial_metadata_path)
+            return set()
+
+        with open(checkpoint_path, "r", encoding="utf-8") as f:
+            checkpoint = json.load(f)
+        self.index = faiss.read_index(partial_index_path)
+        # The metadata log may run ahead of the last checkpoint; keep only checkpointed rows
+        with open(partial_metadata_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if len(self.metadata) == checkpoint["ntotal"]:
+                    break
+                self.metadata.append(json.loads(line))
+        with open(partial_metadata_path, "w", encoding="utf-8") as f:
+            f.write("".join(json.dumps(d, ensure_ascii=False) + "\n" for d in self.metadata))
+        print(f"Resuming ingestion from checkpoint with {len(self.metadata)} chunks.")
+        return set(checkpoint["done_files"])
@@ -0,0 +1,116 @@
+import numpy as np
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.embedding.doc_store import DocStore, CATEGORY_FIELDS
+
+# Categorical fields matched by equality (a list of values matches any of them)
+FILTER_FIELDS = ("source", "topic", "stage")
+# Inclusive [first, last] chunk_index range; either end may be null
+RANGE_FIELD = "chunk_range"
+
+
+def normalize_filters(filters: Optional[Dict[str, Any]]) -> Optional[Tuple]:
+    """Validate filters and return a hashable, order-insensitive form (None for no filters)."""
+    if not filters:
+        return None
+    normalized = []
+    for field, value in filters.items():
+        if field in FILTER_FIELDS:
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            normalized.append((field, tuple(sorted({str(v) for v in values}))))
+        elif field == RANGE_FIELD:
+            if not isinstance(value, (list, tuple)) or len(value) != 2:
+                raise ValueError(f"'{RANGE_FIELD}' must be a [first, last] pair.")
+            first, last = (None if v is None else int(v) for v in value)
+            normalized.append((field, (first, last)))
+        else:
+            raise ValueError(f"Unknown filter '{field}', expected one of {FILTER_FIELDS + (RANGE_FIELD,)}")
+    return tuple(sorted(normalized))
+
+
+def matches(document: Dict, filters: Tuple) -> bool:
+    """Check one document against normalized filters."""
+    for field, value in filters:
+        if field == RANGE_FIELD:
+            chunk_index = document.get("chunk_index", -1)
+            if (value[0] is not None and chunk_index < value[0]) or (value[1] is not None and chunk_index > value[1]):
+                return False
+        elif str(document.get(field)) not in value:
+            return False
+    return True
+
+
+class FilterIndex:
+    """Inverted ID sets over index metadata, used to pre-filter vector search.
+
+    Built once per main index generation: for each filterable field, every
+    value maps to the sorted array of document ids carrying it. With a
+    DocStore this reads only the dictionary-encoded columns, never the
+    documents themselves. A filter resolves to the intersection of its
+    fields' ID sets, which is handed to FAISS as an ID selector.
+    """
+
+    def __init__(self, metadata):
+        self.size = len(metadata)
+        self.postings: Dict[str, Dict[str, np.ndarray]] = {field: {} for field in FILTER_FIELDS}
+        if isinstance(metadata, DocStore):
+            count = self.size - len(metadata._tail)
+            columns = {"source": (metadata.sources, metadata.source_codes[:count])}
+            for field, values in metadata.categories.items():
+                columns[field] = (values, metadata.category_codes[field][:count])
+            for field, (values, codes) in columns.items():
+                self._add_column(field, values, codes)
+            self.chunk_indices = np.asarray(metadata.chunk_indices[:count], dtype="int64")
+            # Stores written before category columns existed keep these fields in "extra"
+            legacy_fields = tuple(f for f in CATEGORY_FIELDS if f not in metadata.categories)
+            if legacy_fields and count:
+                self._add_documents(enumerate(metadata[i] for i in range(count)), legacy_fields)
+            tail = list(enumerate(metadata._tail, start=count))
+        else:
+            self.chunk_indices = np.empty(0, dtype="int64")
+            tail = list(enumerate(metadata))
+        if tail:
+            self._add_documents(tail, FILTER_FIELDS)
+            self.chunk_indices = np.concatenate([
+                self.chunk_indices, np.asarray([doc.get("chunk_index", -1) for _, doc in tail], dtype="int64")
+            ])
+
+    def _add_column(self, field: str, values: List[Any], codes: np.ndarray) -> None:
+        # One stable sort groups ids by code; each group is already sorted by id
+        order = np.argsort(codes, kind="stable")
+        boundaries = np.searchsorted(codes[order], np.arange(len(values) + 1))
+        for code, value in enumerate(values):
+            ids = order[boundaries[code]:boundaries[code + 1]].astype("int64")
+            if len(ids):
+                self.postings[field][str(value)] = ids
+
+    def _add_documents(self, documents: Iterable[Tuple[int, Dict]], fields: Tuple[str, ...]) -> None:
+        grouped: Dict[str, Dict[str, List[int]]] = {field: {} for field in fields}
+        for idx, doc in documents:
+            for field in fields:
+                if doc.get(field) is not None:
+                    grouped[field].setdefault(str(doc[field]), []).append(idx)
+        for field, values in grouped.items():
+            for value, ids in values.items():
+                existing = self.postings[field].get(value, np.empty(0, dtype="int64"))
+                self.postings[field][value] = np.concatenate([existing, np.asarray(ids, dtype="int64")])
+
+    def select(self, filters: Tuple) -> np.ndarray:
+        """Sorted ids of the documents matching normalized filters."""
+        selected: Optional[np.ndarray] = None
+        for field, value in filters:
+            if field == RANGE_FIELD:
+                first, last = value
+                mask = np.ones(self.size, dtype=bool)
+                if first is not None:
+                    mask &= self.chunk_indices >= first
+                if last is not None:
+                    mask &= self.chunk_indices <= last
+                ids = np.flatnonzero(mask)
+            else:
+                sets = [self.postings[field][v] for v in value if v in self.postings[field]]
+                ids = np.unique(np.concatenate(sets)) if len(sets) > 1 else (sets[0] if sets else np.empty(0, dtype="int64"))
+            selected = ids if selected is None else np.intersect1d(selected, ids, assume_unique=True)
+            if not len(selected):
+                break
+        return selected.astype("int64")
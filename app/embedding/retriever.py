@@ -1,54 +1,612 @@
+import os
+import copy
+import time
+import asyncio
+import itertools
+from contextlib import contextmanager
 import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
-import pickle
-from typing import List, Dict
+from typing import Iterator, List, Dict, Optional, Tuple
+
+from app.embedding.bm25_index import BM25Index, bm25_path
+from app.embedding.doc_store import DocStore, load_metadata
+from app.embedding.metadata_filter import FilterIndex, matches, normalize_filters
+from app.embedding.shared_index import load_shared_index, load_private_index, release_shared_index
+from app.embedding.write_ahead_log import WriteAheadLog
+from app.utils.batcher import MicroBatcher
+from app.utils.cache import TTLCache
+from app.utils.inference_backends import EMBEDDING_BACKEND, load_text_embedder
+from app.utils.inference_pool import InferenceExecutor
+
+RETRIEVER_BATCH_SIZE = int(os.getenv("RETRIEVER_BATCH_SIZE", "32"))
+RETRIEVER_BATCH_WAIT_MS = float(os.getenv("RETRIEVER_BATCH_WAIT_MS", "5"))
+RETRIEVER_EMBED_CACHE_SIZE = int(os.getenv("RETRIEVER_EMBED_CACHE_SIZE", "4096"))
+RETRIEVER_EMBED_CACHE_TTL = float(os.getenv("RETRIEVER_EMBED_CACHE_TTL", "86400"))
+RETRIEVER_RESULT_CACHE_SIZE = int(os.getenv("RETRIEVER_RESULT_CACHE_SIZE", "1024"))
+RETRIEVER_RESULT_CACHE_TTL = float(os.getenv("RETRIEVER_RESULT_CACHE_TTL", "600"))
+# Optional search-time overrides for approximate indexes (0 keeps the value saved with the index)
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "0"))
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "0"))
+# Write path: WAL location (default: "wal" next to the index) and compaction triggers
+RETRIEVER_WAL_DIR = os.getenv("RETRIEVER_WAL_DIR")
+RETRIEVER_COMPACT_INTERVAL = float(os.getenv("RETRIEVER_COMPACT_INTERVAL", "300"))
+RETRIEVER_COMPACT_THRESHOLD = int(os.getenv("RETRIEVER_COMPACT_THRESHOLD", "1000"))
+# Seconds between checks, in workers other than the WAL writer, for documents the
+# writer added or compacted since (0: before every search)
+RETRIEVER_WAL_POLL_INTERVAL = float(os.getenv("RETRIEVER_WAL_POLL_INTERVAL", "1.0"))
+# Resolved filter ID sets kept per index generation
+RETRIEVER_FILTER_CACHE_SIZE = int(os.getenv("RETRIEVER_FILTER_CACHE_SIZE", "256"))
+# Filters matching at most this fraction of the index skip the ANN structure and
+# scan the matching vectors directly (graph/list traversal rarely reaches them)
+RETRIEVER_FILTER_EXACT_FRACTION = float(os.getenv("RETRIEVER_FILTER_EXACT_FRACTION", "0.05"))
+# dense: vectors only; keyword: BM25 only (no encoder); hybrid: reciprocal-rank fusion of
+# both; auto: keyword for short queries of rare known terms, hybrid otherwise
+SEARCH_MODES = ("dense", "keyword", "hybrid", "auto")
+RETRIEVER_SEARCH_MODE = os.getenv("RETRIEVER_SEARCH_MODE", "dense")
+RETRIEVER_RRF_K = int(os.getenv("RETRIEVER_RRF_K", "60"))
+RETRIEVER_HYBRID_DEPTH = int(os.getenv("RETRIEVER_HYBRID_DEPTH", "4"))  # candidates per ranking = depth * top_k
+RETRIEVER_LEXICAL_MAX_TERMS = int(os.getenv("RETRIEVER_LEXICAL_MAX_TERMS", "3"))
+RETRIEVER_LEXICAL_MIN_IDF = float(os.getenv("RETRIEVER_LEXICAL_MIN_IDF", "3.0"))
+
+
+def normalize_query(query: str) -> str:
+    """Case- and whitespace-insensitive form of a query, used as cache key."""
+    return " ".join(query.lower().split())
+
+
+def _contents(metadata) -> Iterator[str]:
+    if isinstance(metadata, DocStore):
+        return (metadata.content(i) for i in range(len(metadata)))
+    return (doc["content"] for doc in metadata)
+
+
+class MainGeneration:
+    """The main index documents shared by every snapshot until the next compaction.
+
+    Counts the searches reading it, so that once a compaction retires it the
+    memory-mapped DocStore is closed as soon as the last of them finishes.
+    """
+
+    def __init__(self, metadata):
+        self.metadata = metadata
+        self.readers = 0
+        self.retired = False
+
+    def acquire(self):
+        self.readers += 1
+
+    def release(self):
+        self.readers -= 1
+        self._close_if_unused()
+
+    def retire(self):
+        self.retired = True
+        self._close_if_unused()
+
+    def _close_if_unused(self):
+        if self.retired and self.readers == 0 and isinstance(self.metadata, DocStore):
+            try:
+                self.metadata.close()
+            except BufferError:
+                # A column view is still referenced somewhere; the mapping goes with it
+                pass
+
+
+class IndexSnapshot:
+    """Immutable view of everything searchable: the main index plus the WAL delta.
+
+    Writers never mutate a snapshot; they build a new one and swap the
+    retriever's reference, so in-flight searches keep a consistent view.
+    """
+
+    def __init__(self, index: faiss.Index, metadata, delta_vectors: np.ndarray,
+                 delta_documents: List[Dict], wal_seq: int, bm25: Optional[BM25Index] = None,
+                 generation: Optional[MainGeneration] = None):
+        self.index = index
+        self.metadata = metadata
+        self.generation = generation or MainGeneration(metadata)
+        self.bm25 = bm25
+        self.delta_vectors = delta_vectors
+        self.delta_documents = delta_documents
+        self.wal_seq = wal_seq
+        self.delta_index = None
+        if len(delta_documents):
+            self.delta_index = faiss.IndexFlatL2(delta_vectors.shape[1])
+            self.delta_index.add(delta_vectors)
+        # Built on the first filtered search and shared by snapshots of the same main index
+        self.filter_index: Optional[FilterIndex] = None
+        self.selections = TTLCache(RETRIEVER_FILTER_CACHE_SIZE, RETRIEVER_RESULT_CACHE_TTL)
+
+    def with_delta(self, vectors: np.ndarray, documents: List[Dict], wal_seq: int) -> "IndexSnapshot":
+        snapshot = IndexSnapshot(self.index, self.metadata,
+                                 np.vstack([self.delta_vectors, vectors]),
+                                 self.delta_documents + list(documents), wal_seq, self.bm25,
+                                 self.generation)
+        # The main index is unchanged, so are its ID sets
+        snapshot.filter_index, snapshot.selections = self.filter_index, self.selections
+        return snapshot
+
+    def __len__(self) -> int:
+        return len(self.metadata) + len(self.delta_documents)
+
+    def document(self, idx: int) -> Dict:
+        main_size = len(self.metadata)
+        return self.metadata[idx] if idx < main_size else self.delta_documents[idx - main_size]
+
+    def search(self, query_matrix: np.ndarray, top_k: int,
+               filters: Optional[Tuple] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Search main and delta, merging to the overall top_k (delta ids follow main ids).
+
+        With normalized ``filters``, only matching documents are considered: the
+        main index is searched with a FAISS ID selector over the precomputed ID
+        set, and the (small, flat) delta is filtered exhaustively.
+        """
+        if filters is None:
+            distances, indices = self.index.search(query_matrix, top_k)
+            delta_params = None
+        else:
+            distances, indices = self._filtered_search(query_matrix, top_k, self.select(filters))
+            delta_ids = [i for i, doc in enumerate(self.delta_documents) if matches(doc, filters)]
+            if not delta_ids:
+                return distances, indices
+            delta_params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(np.asarray(delta_ids, dtype="int64")))
+        if self.delta_index is None:
+            return distances, indices
+
+        delta_k = min(top_k, self.delta_index.ntotal)
+        delta_distances, delta_indices = self.delta_index.search(query_matrix, delta_k, params=delta_params)
+        delta_indices = np.where(delta_indices == -1, -1, delta_indices + len(self.metadata))
+        distances = np.hstack([np.where(indices == -1, np.inf, distances),
+                               np.where(delta_indices == -1, np.inf, delta_distances)])
+        indices = np.hstack([indices, delta_indices])
+        order = np.argsort(distances, axis=1)[:, :top_k]
+        return np.take_along_axis(distances, order, axis=1), np.take_along_axis(indices, order, axis=1)
+
+    def keyword_search(self, queries: List[str], top_k: int,
+                       filters: Optional[Tuple] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """BM25 (scores, ids) per query over main and delta, padded with -1 ids."""
+        allowed = self.select(filters) if filters is not None else None
+        delta_ids = [i for i, doc in enumerate(self.delta_documents) if filters is None or matches(doc, filters)]
+        delta_texts = [self.delta_documents[i]["content"] for i in delta_ids]
+        scores = np.zeros((len(queries), top_k), dtype="float32")
+        indices = np.full((len(queries), top_k), -1, dtype="int64")
+        for row, query in enumerate(queries):
+            row_scores, row_ids = self.bm25.search(query, top_k, allowed)
+            if delta_texts:
+                extra_scores, extra_ids = self.bm25.score_texts(query, delta_texts, top_k)
+                row_scores = np.concatenate([row_scores, extra_scores])
+                row_ids = np.concatenate([row_ids, np.asarray(delta_ids, dtype="int64")[extra_ids] + len(self.metadata)])
+                order = np.argsort(-row_scores, kind="stable")[:top_k]
+                row_scores, row_ids = row_scores[order], row_ids[order]
+            scores[row, :len(row_ids)] = row_scores
+            indices[row, :len(row_ids)] = row_ids
+        return scores, indices
+
+    def hybrid_search(self, query_matrix: np.ndarray, queries: List[str], top_k: int,
+                      filters: Optional[Tuple] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Fuse dense and BM25 rankings with reciprocal-rank fusion: sum of 1 / (k + rank)."""
+        depth = top_k * RETRIEVER_HYBRID_DEPTH
+        _, dense_ids = self.search(query_matrix, depth, filters)
+        _, keyword_ids = self.keyword_search(queries, depth, filters)
+        scores = np.zeros((len(queries), top_k), dtype="float32")
+        indices = np.full((len(queries), top_k), -1, dtype="int64")
+        for row in range(len(queries)):
+            fused: Dict[int, float] = {}
+            for ranking in (dense_ids[row], keyword_ids[row]):
+                for rank, idx in enumerate(ranking):
+                    if idx != -1:
+                        fused[int(idx)] = fused.get(int(idx), 0.0) + 1.0 / (RETRIEVER_RRF_K + rank + 1)
+            best = sorted(fused.items(), key=lambda item: -item[1])[:top_k]
+            for col, (idx, score) in enumerate(best):
+                scores[row, col], indices[row, col] = score, idx
+        return scores, indices
+
+    def select(self, filters: Tuple) -> np.ndarray:
+        """Main-index ids matching normalized filters, cached per filter."""
+        selected = self.selections.get(filters)
+        if selected is None:
+            if self.filter_index is None:
+                self.filter_index = FilterIndex(self.metadata)
+            selected = self.filter_index.select(filters)
+            self.selections.set(filters, selected)
+        return selected
+
+    def _filtered_search(self, query_matrix: np.ndarray, top_k: int,
+                         ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        if not len(ids):
+            shape = (len(query_matrix), top_k)
+            return np.full(shape, np.inf, dtype="float32"), np.full(shape, -1, dtype="int64")
+        selector = faiss.IDSelectorBatch(ids)
+        exhaustive = len(ids) <= RETRIEVER_FILTER_EXACT_FRACTION * self.index.ntotal
+        index, params = self._selector_params(selector, exhaustive)
+        distances, indices = index.search(query_matrix, top_k, params=params)
+        # Approximate indexes may still visit too few matching vectors; search
+        # every matching vector rather than return short results
+        found = (indices != -1).sum(axis=1)
+        if not exhaustive and (found < min(top_k, len(ids))).any():
+            index, params = self._selector_params(selector, exhaustive=True)
+            distances, indices = index.search(query_matrix, top_k, params=params)
+        return distances, indices
+
+    def _selector_params(self, selector, exhaustive: bool):
+        """(index to search, search parameters) restricted to the selected ids."""
+        if hasattr(self.index, "hnsw"):
+            if exhaustive:
+                # The HNSW storage is a flat index over the same ids
+                return faiss.downcast_index(self.index.storage), faiss.SearchParameters(sel=selector)
+            return self.index, faiss.SearchParametersHNSW(sel=selector, efSearch=self.index.hnsw.efSearch)
+        try:
+            ivf = faiss.extract_index_ivf(self.index)
+        except RuntimeError:
+            return self.index, faiss.SearchParameters(sel=selector)
+        return self.index, faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nlist if exhaustive else ivf.nprobe)
+
 
 class SemanticRetriever:
-    """Semantic search module using Faiss and SentenceTransformer."""
+    """Semantic search module using Faiss and a sentence embedder (see EMBEDDING_BACKEND)."""
 
     def __init__(self,
                  index_path: str = "embedding/faiss_index/qol_vector.index",
-                 metadata_path: str = "embedding/faiss_index/metadata.pkl",
-                 model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
-        self.model = SentenceTransformer(model_name)
-        self.index = None
-        self.metadata: List[Dict] = []
+                 metadata_path: str = "embedding/faiss_index/metadata.docs",
+                 model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+                 backend: str = None):
+        # Must match the backend the index was built with (IndexBuilder uses the same default)
+        self.model = load_text_embedder(model_name, backend or EMBEDDING_BACKEND)
+        self.snapshot: Optional[IndexSnapshot] = None
+        self.wal: Optional[WriteAheadLog] = None
+        self.main_index_path = index_path
+        # Bumped on every index mutation; part of the result cache key
+        self.index_version = 0
+        # Query embeddings depend only on the model; results also on the index
+        self.embedding_cache = TTLCache(
+            RETRIEVER_EMBED_CACHE_SIZE, RETRIEVER_EMBED_CACHE_TTL, name="query_embedding_cache"
+        )
+        self.result_cache = TTLCache(
+            RETRIEVER_RESULT_CACHE_SIZE, RETRIEVER_RESULT_CACHE_TTL, name="search_result_cache"
+        )
+        # Concurrent single-query searches share one encode forward pass
+        self.encode_batcher = MicroBatcher(
+            self._encode,
+            max_batch_size=RETRIEVER_BATCH_SIZE,
+            max_wait_ms=RETRIEVER_BATCH_WAIT_MS,
+            name="query_encode_batcher"
+        )
+        self._write_lock = asyncio.Lock()
+        self._compact_lock = asyncio.Lock()
+        self._compact_requested = asyncio.Event()
+        self._compactor: Optional[asyncio.Task] = None
+        self._next_poll = 0.0
         self.load_index(index_path, metadata_path)
 
+    @property
+    def index(self) -> Optional[faiss.Index]:
+        return self.snapshot.index if self.snapshot else None
+
+    @property
+    def metadata(self):
+        return self.snapshot.metadata if self.snapshot else []
+
     def load_index(self, index_path: str, metadata_path: str):
-        """Load Faiss index and metadata."""
-        self.index = faiss.read_index(index_path)
-        with open(metadata_path, "rb") as f:
-            self.metadata = pickle.load(f)
-        print(f"Index loaded with {len(self.metadata)} documents.")
-
-    async def search(self, query: str, top_k: int = 5) -> List[Dict]:
-        """Search for the most relevant documents."""
-        if self.index is None:
+        """Load Faiss index and metadata (memory-mapped DocStore, or legacy .pkl),
+        then replay documents from the write-ahead log that were not yet compacted."""
+        wal_dir = RETRIEVER_WAL_DIR or os.path.join(os.path.dirname(os.path.abspath(index_path)), "wal")
+        self.wal = WriteAheadLog(wal_dir)
+        # After a compaction the manifest points at a newer main generation
+        main_index_path, main_metadata_path = self.wal.main_paths(index_path, metadata_path)
+        index = load_shared_index(main_index_path)
+        self.main_index_path = main_index_path
+        self._apply_search_params(index)
+
+        wal_seq, delta_vectors, delta_documents = self.wal.replay(index.d)
+        self.snapshot = IndexSnapshot(index, load_metadata(main_metadata_path),
+                                      delta_vectors, delta_documents, wal_seq,
+                                      self._load_bm25(main_index_path))
+        self._invalidate_results()
+        print(f"Index loaded with {len(self.snapshot)} documents "
+              f"({len(delta_documents)} replayed from the write-ahead log).")
+
+    @staticmethod
+    def _load_bm25(index_path: str) -> Optional[BM25Index]:
+        path = bm25_path(index_path)
+        if not os.path.exists(path):
+            print(f"No keyword index at {path}; rebuild the index for hybrid search. Using dense search.")
+            return None
+        return BM25Index.load(path)
+
+    def _apply_search_params(self, index: faiss.Index):
+        """Apply nprobe / efSearch overrides to IVF and HNSW indexes."""
+        if FAISS_NPROBE:
+            try:
+                faiss.extract_index_ivf(index).nprobe = FAISS_NPROBE
+            except RuntimeError:
+                pass  # not an IVF index
+        if FAISS_EF_SEARCH and hasattr(index, "hnsw"):
+            index.hnsw.efSearch = FAISS_EF_SEARCH
+
+    async def search(self, query: str, top_k: int = 5, filters: Optional[Dict] = None,
+                     mode: Optional[str] = None) -> List[Dict]:
+        """Search for the most relevant documents.
+
+        ``filters`` restricts results by source, topic, stage (a value or a list
+        of values) and ``chunk_range`` ([first, last] chunk_index, inclusive).
+        ``mode`` is one of SEARCH_MODES (default RETRIEVER_SEARCH_MODE).
+        """
+        return (await self._search_queries([query], top_k, filters, mode, use_batcher=True))[0]
+
+    async def search_many(self, queries: List[str], top_k: int = 5, filters: Optional[Dict] = None,
+                          mode: Optional[str] = None) -> List[List[Dict]]:
+        """Search several queries with one encode call and one 2-D index search.
+
+        Returns one result list per query, in the same order as ``queries``;
+        ``filters`` and ``mode`` apply to every query (see ``search``).
+        """
+        return await self._search_queries(queries, top_k, filters, mode, use_batcher=False)
+
+    async def _search_queries(self, queries: List[str], top_k: int, filters: Optional[Dict],
+                              mode: Optional[str], use_batcher: bool) -> List[List[Dict]]:
+        if self.snapshot is None:
             raise ValueError("Index not loaded.")
+        if not queries:
+            return []
+        mode = mode or RETRIEVER_SEARCH_MODE
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode '{mode}', expected one of {SEARCH_MODES}")
+
+        normalized = [normalize_query(q) for q in queries]
+        filter_key = normalize_filters(filters)
+        await self._poll_log()
+        version = self.index_version
+        results: List[Optional[List[Dict]]] = [
+            self.result_cache.get((q, top_k, filter_key, mode, version)) for q in normalized
+        ]
+        pending = [i for i, r in enumerate(results) if r is None]
+        if not pending:
+            return copy.deepcopy(results)  # callers may modify results and their metadata
+
+        with self._reading() as snapshot:
+            groups: Dict[str, List[int]] = {}
+            for i in pending:
+                groups.setdefault(self._resolve_mode(mode, snapshot, normalized[i]), []).append(i)
+
+            # Keyword queries are answered without the encoder
+            rows = {}
+            if "keyword" in groups:
+                texts = [normalized[i] for i in groups["keyword"]]
+                scores, indices = await InferenceExecutor.run(snapshot.keyword_search, texts, top_k, filter_key)
+                rows.update(zip(groups["keyword"], zip(scores, indices)))
+
+            vector_rows = groups.get("dense", []) + groups.get("hybrid", [])
+            if vector_rows:
+                vectors = await self._query_vectors([normalized[i] for i in vector_rows], use_batcher)
+                for group_mode in ("dense", "hybrid"):
+                    members = groups.get(group_mode)
+                    if not members:
+                        continue
+                    query_matrix = np.stack([vectors[normalized[i]] for i in members])
+                    scores, indices = await InferenceExecutor.run(
+                        self._vector_search, snapshot, group_mode, query_matrix,
+                        [normalized[i] for i in members], top_k, filter_key
+                    )
+                    rows.update(zip(members, zip(scores, indices)))
+
+            for i, (scores, indices) in rows.items():
+                results[i] = self._format_results(snapshot, scores, indices)
+                self.result_cache.set((normalized[i], top_k, filter_key, mode, version), results[i])
+        return copy.deepcopy(results)
+
+    @contextmanager
+    def _reading(self) -> Iterator[IndexSnapshot]:
+        """The current snapshot, whose documents stay open until the block ends."""
+        snapshot = self.snapshot
+        snapshot.generation.acquire()
+        try:
+            yield snapshot
+        finally:
+            snapshot.generation.release()
+
+    @staticmethod
+    def _resolve_mode(mode: str, snapshot: IndexSnapshot, query: str) -> str:
+        if mode == "dense" or snapshot.bm25 is None:
+            return "dense"
+        if mode == "auto":
+            lexical = snapshot.bm25.is_lexical(query, RETRIEVER_LEXICAL_MAX_TERMS, RETRIEVER_LEXICAL_MIN_IDF)
+            return "keyword" if lexical else "hybrid"
+        return mode
+
+    async def embed_query(self, query: str) -> np.ndarray:
+        """Embedding of one query, shared with search through the query cache and batcher."""
+        normalized = normalize_query(query)
+        return (await self._query_vectors([normalized], use_batcher=True))[normalized]
+
+    async def _query_vectors(self, queries: List[str], use_batcher: bool) -> Dict[str, np.ndarray]:
+        """Embeddings for normalized queries, encoding only uncached ones, once each.
 
-        query_vector = self.model.encode([query]).astype("float32")
-        distances, indices = self.index.search(query_vector, top_k)
+        Single searches go through the micro-batcher so concurrent requests share
+        one forward pass; search_many already holds a batch.
+        """
+        vectors = {q: self.embedding_cache.get(q) for q in queries}
+        to_encode = [q for q, v in vectors.items() if v is None]
+        if to_encode:
+            if use_batcher and len(to_encode) == 1:
+                encoded = [await self.encode_batcher.submit(to_encode[0])]
+            else:
+                encoded = await InferenceExecutor.run(self._encode, to_encode)
+            for q, vector in zip(to_encode, encoded):
+                vectors[q] = vector
+                self.embedding_cache.set(q, vector)
+        return vectors
 
+    @staticmethod
+    def _vector_search(snapshot: IndexSnapshot, mode: str, query_matrix: np.ndarray, queries: List[str],
+                       top_k: int, filter_key: Optional[Tuple]) -> Tuple[np.ndarray, np.ndarray]:
+        """(similarity scores, ids) for dense or hybrid search."""
+        if mode == "hybrid":
+            return snapshot.hybrid_search(query_matrix, queries, top_k, filter_key)
+        distances, indices = snapshot.search(query_matrix, top_k, filter_key)
+        return 1 / (1 + distances), indices  # Convert L2 distance to similarity score
+
+    def _format_results(self, snapshot: IndexSnapshot, scores: np.ndarray, indices: np.ndarray) -> List[Dict]:
         results = []
-        for rank, (dist, idx) in enumerate(zip(distances[0], indices[0])):
-            if idx == -1 or idx >= len(self.metadata):
+        for rank, (score, idx) in enumerate(zip(scores, indices)):
+            if idx == -1 or idx >= len(snapshot):
                 continue
+            document = snapshot.document(int(idx))  # materialized only for hits
             result = {
-                "content": self.metadata[idx]["content"],
-                "score": float(1 / (1 + dist)),  # Convert L2 distance to similarity score
-                "metadata": self.metadata[idx],
+                "content": document["content"],
+                "score": float(score),
+                "metadata": document,
                 "rank": rank + 1
             }
             results.append(result)
         return results
 
     async def add_document(self, document: Dict):
-        """Add a new document to the current index (memory only, not auto-save)."""
-        if self.index is None:
+        """Add a single document; see add_documents."""
+        await self.add_documents([document])
+
+    async def add_documents(self, documents: List[Dict]) -> int:
+        """Add a batch of documents durably without blocking searches.
+
+        Vectors and metadata are appended to the write-ahead log and become
+        searchable immediately through the in-memory delta; a background task
+        later compacts the delta into a new main index generation.
+        """
+        if self.snapshot is None:
             raise ValueError("Index not loaded.")
-        embedding = self.model.encode([document["content"]]).astype("float32")
-        self.index.add(embedding)
-        self.metadata.append(document)
-        print("Document added. Remember to save the index afterwards.")
+        if not documents:
+            return 0
+        vectors = await InferenceExecutor.run(self._encode, [doc["content"] for doc in documents])
+
+        async with self._write_lock:
+            if not self.wal.is_writer:
+                await asyncio.to_thread(self.wal.acquire_writer)
+                # Start from everything the previous writer logged
+                await self._follow_log()
+            wal_seq = await asyncio.to_thread(self.wal.append, vectors, documents)
+            self.snapshot = self.snapshot.with_delta(vectors, documents, wal_seq)
+            self._invalidate_results()
+
+        self._ensure_compactor()
+        if len(self.snapshot.delta_documents) >= RETRIEVER_COMPACT_THRESHOLD:
+            self._compact_requested.set()
+        return len(documents)
+
+    def _ensure_compactor(self):
+        if self._compactor is None or self._compactor.done():
+            self._compactor = asyncio.get_running_loop().create_task(self._compaction_loop())
+
+    async def _compaction_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._compact_requested.wait(), RETRIEVER_COMPACT_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._compact_requested.clear()
+            try:
+                await self.compact()
+            except Exception as e:
+                # The WAL still holds every document; the next round retries
+                print(f"Index compaction failed: {e}")
+
+    async def compact(self):
+        """Fold the current delta into a new main index generation and swap it in."""
+        async with self._compact_lock:
+            base = self.snapshot
+            if not base.delta_documents:
+                return
+            index_path, metadata_path = await asyncio.to_thread(self._write_generation, base)
+            index = load_shared_index(index_path)
+            self._apply_search_params(index)
+            metadata = load_metadata(metadata_path)
+            bm25 = await asyncio.to_thread(BM25Index.load, bm25_path(index_path))
+
+            previous_path = self.main_index_path
+            async with self._write_lock:
+                # Keep documents that were added while the generation was being written
+                current = self.snapshot
+                folded = len(base.delta_documents)
+                self.snapshot = IndexSnapshot(index, metadata,
+                                              current.delta_vectors[folded:],
+                                              current.delta_documents[folded:],
+                                              current.wal_seq, bm25)
+                self.main_index_path = index_path
+                self._invalidate_results()
+            await asyncio.to_thread(self.wal.commit_compaction, index_path, metadata_path, base.wal_seq)
+            # The old generation's files are gone; drop the cached index and close
+            # its documents once no search reads them
+            release_shared_index(previous_path)
+            base.generation.retire()
+            print(f"Compacted {folded} documents into {index_path}.")
+
+    async def _poll_log(self):
+        """Pick up documents added or compacted by the WAL writer, when that is another process.
+
+        Uvicorn workers each load the index; only the one holding the WAL
+        writer lock ingests documents. The others check the manifest and the
+        segment list at most every RETRIEVER_WAL_POLL_INTERVAL seconds, so a
+        document is searchable in every worker within that interval.
+        """
+        if self.wal.is_writer or time.monotonic() < self._next_poll:
+            return
+        self._next_poll = time.monotonic() + RETRIEVER_WAL_POLL_INTERVAL
+        async with self._write_lock:
+            if self.wal.is_writer:
+                return
+            try:
+                await self._follow_log()
+            except (OSError, ValueError) as e:
+                # A compaction removed files while they were read; the next check retries
+                print(f"Reading the write-ahead log failed: {e}")
+
+    async def _follow_log(self):
+        """Apply the log's changes since the current snapshot; the caller holds the write lock."""
+        manifest, seqs = await asyncio.to_thread(self.wal.read_state)
+        if manifest["generation"] != self.wal.manifest["generation"]:
+            previous_path, previous = self.main_index_path, self.snapshot
+            index_path, metadata_path = manifest["index_path"], manifest["metadata_path"]
+            index = load_shared_index(index_path)
+            self._apply_search_params(index)
+            metadata = await asyncio.to_thread(load_metadata, metadata_path)
+            bm25 = await asyncio.to_thread(self._load_bm25, index_path)
+            wal_seq, vectors, documents = await asyncio.to_thread(
+                self.wal.replay, index.d, manifest["compacted_through"]
+            )
+            self.wal.adopt(manifest)
+            self.snapshot = IndexSnapshot(index, metadata, vectors, documents, wal_seq, bm25)
+            self.main_index_path = index_path
+            release_shared_index(previous_path)
+            previous.generation.retire()
+        elif seqs and seqs[-1] > self.snapshot.wal_seq:
+            wal_seq, vectors, documents = await asyncio.to_thread(
+                self.wal.replay, self.index.d, self.snapshot.wal_seq
+            )
+            self.snapshot = self.snapshot.with_delta(vectors, documents, wal_seq)
+        else:
+            return
+        self._invalidate_results()
+
+    def _write_generation(self, base: IndexSnapshot) -> Tuple[str, str]:
+        index_path, metadata_path = self.wal.next_generation_paths()
+        index = load_private_index(self.main_index_path)
+        index.add(base.delta_vectors)
+        faiss.write_index(index, f"{index_path}.tmp")
+        os.replace(f"{index_path}.tmp", index_path)
+        DocStore.write(metadata_path, itertools.chain(iter(base.metadata), base.delta_documents))
+        # BM25 statistics (idf, average length) cover the whole generation, so rebuild it
+        BM25Index.build(itertools.chain(_contents(base.metadata),
+                                        (doc["content"] for doc in base.delta_documents))).save(bm25_path(index_path))
+        return index_path, metadata_path
+
+    def close(self):
+        """Stop background compaction; un-compacted documents stay in the WAL."""
+        if self._compactor is not None:
+            self._compactor.cancel()
+            self._compactor = None
+
+    def _invalidate_results(self):
+        """Make cached search results unreachable after the index changes."""
+        self.index_version += 1
+        self.result_cache.clear()
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(texts).astype("float32")
@@ -0,0 +1,63 @@
+import os
+import threading
+import faiss
+from typing import Dict, Tuple
+
+# Map index files read-only instead of copying them into private memory
+FAISS_MMAP = os.getenv("FAISS_MMAP", "0").lower() in ("1", "true", "yes")
+
+_lock = threading.Lock()
+_indexes: Dict[Tuple[str, int, int, bool], faiss.Index] = {}
+
+
+def mmap_flags() -> int:
+    """FAISS IO flags for a read-only shared mapping.
+
+    IO_FLAG_MMAP_IFC (newer faiss) maps flat codes and IVF lists in place;
+    older releases only support IO_FLAG_MMAP, which maps IVF inverted lists and
+    still reads flat/HNSW storage into private memory.
+    """
+    if hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+        return faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+    return faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+
+
+def load_shared_index(index_path: str, use_mmap: bool = None) -> faiss.Index:
+    """Load an index at most once per process and file version.
+
+    With mmap every uvicorn worker maps the same file, so vector pages live once
+    in the host page cache and a new worker does not re-read the file. Indexes
+    returned here are shared and must not be mutated; use load_private_index
+    to get a writable copy.
+    """
+    use_mmap = FAISS_MMAP if use_mmap is None else use_mmap
+    path = os.path.realpath(index_path)
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size, use_mmap)
+
+    with _lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = faiss.read_index(path, mmap_flags() if use_mmap else 0)
+            # A replaced file gets a new key; drop mappings of older versions
+            for old_key in [k for k in _indexes if k[0] == path]:
+                del _indexes[old_key]
+            _indexes[key] = index
+        return index
+
+
+def load_private_index(index_path: str) -> faiss.Index:
+    """Read a writable, process-private copy of an index."""
+    return faiss.read_index(index_path)
+
+
+def release_shared_index(index_path: str) -> None:
+    """Forget every cached version of an index file, e.g. once compaction replaced it.
+
+    Snapshots still holding the index keep it alive; its memory (or mapping of
+    the possibly deleted file) is freed when the last of them goes away.
+    """
+    path = os.path.realpath(index_path)
+    with _lock:
+        for key in [k for k in _indexes if k[0] == path]:
+            del _indexes[key]
@@ -0,0 +1,153 @@
+import os
+import re
+import json
+import fcntl
+import numpy as np
+from typing import List, Dict, Tuple
+
+SEGMENT_PATTERN = re.compile(r"^segment-(\d{10})\.jsonl$")
+
+
+def _fsync_write(path: str, data: bytes) -> None:
+    """Write a file durably under a temporary name, then rename it into place."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class WriteAheadLog:
+    """Append-only segment log for documents added to a live index.
+
+    Every batch becomes one immutable segment: ``segment-N.vec`` (raw float32
+    vectors) and ``segment-N.jsonl`` (one document per line). The .jsonl file is
+    renamed into place last, so a segment without it was never acknowledged and
+    is ignored on replay.
+
+    ``manifest.json`` is the single commit point for compaction: it names the
+    current main index / document store generation and the last segment folded
+    into it. Segments up to that number are skipped on replay and deleted.
+
+    Only one process per directory may write; it holds an exclusive flock on
+    the ``LOCK`` file from its first append. Other processes read the log and
+    follow the writer through ``read_state`` and ``adopt``.
+    """
+
+    def __init__(self, wal_dir: str):
+        self.wal_dir = wal_dir
+        os.makedirs(wal_dir, exist_ok=True)
+        self.manifest_path = os.path.join(wal_dir, "manifest.json")
+        self.manifest = self._load_manifest()
+        self._next_seq = max([self.manifest["compacted_through"]] + self._segment_seqs()) + 1
+        self._lock_file = None
+
+    def _load_manifest(self) -> Dict:
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        return {"index_path": None, "metadata_path": None, "compacted_through": 0, "generation": 0}
+
+    def _segment_seqs(self) -> List[int]:
+        seqs = []
+        for filename in os.listdir(self.wal_dir):
+            match = SEGMENT_PATTERN.match(filename)
+            if match:
+                seqs.append(int(match.group(1)))
+        return sorted(seqs)
+
+    def _segment_path(self, seq: int, ext: str) -> str:
+        return os.path.join(self.wal_dir, f"segment-{seq:010d}.{ext}")
+
+    @property
+    def is_writer(self) -> bool:
+        return self._lock_file is not None
+
+    def read_state(self) -> Tuple[Dict, List[int]]:
+        """The manifest and acknowledged segment numbers as currently on disk."""
+        return self._load_manifest(), self._segment_seqs()
+
+    def adopt(self, manifest: Dict) -> None:
+        """Switch to a manifest read from disk once its main generation is loaded."""
+        self.manifest = manifest
+
+    def main_paths(self, default_index_path: str, default_metadata_path: str) -> Tuple[str, str]:
+        """Paths of the current main index and document store."""
+        return (self.manifest["index_path"] or default_index_path,
+                self.manifest["metadata_path"] or default_metadata_path)
+
+    def acquire_writer(self) -> None:
+        """Become the single writer for this log, or raise if another process is."""
+        if self._lock_file is not None:
+            return
+        lock_file = open(os.path.join(self.wal_dir, "LOCK"), "a")
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            raise RuntimeError(f"Another process is writing to {self.wal_dir}.")
+        self._lock_file = lock_file
+        # Segments may have been added by a previous writer since we started
+        self._next_seq = max([self._next_seq] + [s + 1 for s in self._segment_seqs()])
+
+    def append(self, vectors: np.ndarray, documents: List[Dict]) -> int:
+        """Durably log one batch and return its segment number."""
+        self.acquire_writer()
+        seq = self._next_seq
+        self._next_seq += 1
+        _fsync_write(self._segment_path(seq, "vec"), np.ascontiguousarray(vectors, dtype="<f4").tobytes())
+        lines = "".join(json.dumps(doc, ensure_ascii=False) + "\n" for doc in documents)
+        _fsync_write(self._segment_path(seq, "jsonl"), lines.encode("utf-8"))
+        return seq
+
+    def replay(self, dimension: int, after_seq: int = 0) -> Tuple[int, np.ndarray, List[Dict]]:
+        """Return (last segment number, vectors, documents) not yet compacted,
+        from the segments after ``after_seq``."""
+        last_seq = max(self.manifest["compacted_through"], after_seq)
+        vectors, documents = [], []
+        for seq in self._segment_seqs():
+            if seq <= last_seq:
+                continue
+            with open(self._segment_path(seq, "jsonl"), "r", encoding="utf-8") as f:
+                segment_docs = [json.loads(line) for line in f if line.strip()]
+            segment_vecs = np.fromfile(self._segment_path(seq, "vec"), dtype="<f4").reshape(-1, dimension)
+            vectors.append(segment_vecs[:len(segment_docs)])
+            documents.extend(segment_docs)
+            last_seq = seq
+        stacked = np.vstack(vectors) if vectors else np.empty((0, dimension), dtype="float32")
+        return last_seq, stacked, documents
+
+    def next_generation_paths(self) -> Tuple[str, str]:
+        generation = self.manifest["generation"] + 1
+        return (os.path.join(self.wal_dir, f"main-{generation:06d}.index"),
+                os.path.join(self.wal_dir, f"main-{generation:06d}.docs"))
+
+    def commit_compaction(self, index_path: str, metadata_path: str, through_seq: int) -> None:
+        """Atomically switch the manifest to a new main generation, then clean up."""
+        previous = dict(self.manifest)
+        self.manifest = {
+            "index_path": index_path,
+            "metadata_path": metadata_path,
+            "compacted_through": through_seq,
+            "generation": previous["generation"] + 1,
+        }
+        _fsync_write(self.manifest_path, json.dumps(self.manifest).encode("utf-8"))
+
+        for seq in self._segment_seqs():
+            if seq <= through_seq:
+                for ext in ("jsonl", "vec"):
+                    try:
+                        os.remove(self._segment_path(seq, ext))
+                    except FileNotFoundError:
+                        pass
+        # Files of the old generation written by compaction (index, documents and any
+        # companion files sharing its name); never the original build output
+        if previous["generation"]:
+            prefix = f"main-{previous['generation']:06d}."
+            for filename in os.listdir(self.wal_dir):
+                if filename.startswith(prefix):
+                    try:
+                        os.remove(os.path.join(self.wal_dir, filename))
+                    except FileNotFoundError:
+                        pass
@@ -1,9 +1,11 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 import os
 import pathlib
-from app.api import chat_light
+from app.api import chat_light, metrics
+from app.utils.http_client import HTTPClientPool
 
 BASE_DIR = pathlib.Path(__file__).resolve().parent.parent 
 load_dotenv(BASE_DIR / ".env")
@@ -11,10 +13,20 @@ load_dotenv(BASE_DIR / ".env")
 print("HF_API_TOKEN Loaded:", os.getenv("HF_API_TOKEN"))
 print("HF_MODEL_NAME Loaded:", os.getenv("HF_MODEL_NAME", "mistralai/Mistral-7B-Instruct-v0.2"))
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Pooled keep-alive HTTP session for the LLM API
+    await HTTPClientPool.initialize()
+    yield
+    await HTTPClientPool.shutdown()
+
+
 app = FastAPI(
     title="ALS Chatbot (Light Version)",
     version="0.1",
-    description="Simple testable chat interface with Hugging Face or mock response."
+    description="Simple testable chat interface with Hugging Face or mock response.",
+    lifespan=lifespan
 )
 
 
@@ -28,6 +40,7 @@ app.add_middleware(
 
   # use light version for now
 app.include_router(chat_light.router, prefix="/api/chat", tags=["Chat"])
+app.include_router(metrics.router, prefix="/api/metrics", tags=["Metrics"])
 
 
 @app.get("/")
@@ -49,42 +62,41 @@ from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import structlog
 
-from app.api import chat, user, profile, query, feedback
+from app.api import chat, user, profile, query, feedback, metrics
 from app.core.context_memory import ContextMemory
+from app.core.model_registry import ModelRegistry
+from app.utils.http_client import HTTPClientPool
+from app.utils.inference_pool import InferenceExecutor
 from app.utils.config import settings
 from app.utils.logger import setup_logging
 
-from app.core.prompt_builder import PromptBuilder
-from app.utils.ibm_client import IBMClient 
-
 # Set up structured logging
 setup_logging()
 logger = structlog.get_logger()
 
-# Global singleton instances
-prompt_builder: PromptBuilder = None
-ibm_client: IBMClient = None
-
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global prompt_builder, ibm_client
-
     logger.info("🔁 Initializing ALS Semantic Assistant...", version=settings.APP_VERSION)
 
     # 1. Context memory module
     ContextMemory.initialize()
 
-    # 2. Load and cache prompt templates
-    prompt_builder = PromptBuilder(prompt_dir=settings.PROMPT_PATH, language=settings.DEFAULT_LANGUAGE)
-    logger.info("✅ PromptBuilder loaded", prompt_templates=prompt_builder.templates.keys())
+    # 2. CPU inference pool shared by the emotion classifier and the retriever encoder
+    InferenceExecutor.initialize()
+
+    # 3. Pooled keep-alive HTTP session for the LLM APIs
+    await HTTPClientPool.initialize()
 
-    # 3. Initialize IBM Watson client (or Granite model endpoint)
-    ibm_client = IBMClient(api_key=settings.IBM_API_KEY, base_url=settings.IBM_API_URL)
-    logger.info("✅ IBM Client initialized", base_url=settings.IBM_API_URL)
+    # 4. Load shared models and clients once (emotion, retriever, prompts, LLM client)
+    load_report = ModelRegistry.initialize()
+    logger.info("✅ Model registry loaded", components=list(load_report.keys()))
 
     yield
 
     logger.info("🧹 Cleaning up resources before shutdown...")
+    ModelRegistry.cleanup()
+    InferenceExecutor.shutdown()
+    await HTTPClientPool.shutdown()
     await ContextMemory.cleanup()
     logger.info("👋 ALS Semantic Assistant shutdown complete.")
 
@@ -110,6 +122,7 @@ app.include_router(user.router, prefix="/api/user", tags=["user"])
 app.include_router(profile.router, prefix="/api/profile", tags=["profile"])
 app.include_router(query.router, prefix="/api/query", tags=["query"])
 app.include_router(feedback.router, prefix="/api/feedback", tags=["feedback"])
+app.include_router(metrics.router, prefix="/api/metrics", tags=["metrics"])
 
 # Root endpoint
 @app.get("/")
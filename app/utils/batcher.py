@@ -0,0 +1,109 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from collections import deque
+import asyncio
+
+from app.utils import metrics
+from app.utils.inference_pool import InferenceExecutor
+
+
+class MicroBatcher:
+    """Dynamic micro-batching in front of a batched model call.
+
+    Items submitted concurrently are collected for at most ``max_wait_ms`` (or
+    until ``max_batch_size`` items are waiting), run through ``batch_fn`` in a
+    single call on the inference pool, and each caller gets its own result back.
+    ``batch_fn`` takes a list of items and returns a list of results in order.
+    """
+
+    def __init__(self,
+                 batch_fn: Callable[[List[Any]], List[Any]],
+                 max_batch_size: int = 16,
+                 max_wait_ms: float = 5.0,
+                 max_inflight_batches: int = 2,
+                 name: str = "batcher"):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.max_inflight_batches = max_inflight_batches
+
+        self._pending: deque = deque()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._has_items: Optional[asyncio.Event] = None
+        self._full: Optional[asyncio.Event] = None
+        self._inflight: Optional[asyncio.Semaphore] = None
+
+        self._batches = 0
+        self._items = 0
+        self._batch_sizes = deque(maxlen=1024)
+        metrics.register(name, self.stats)
+
+    async def submit(self, item: Any) -> Any:
+        """Queue one item and wait for its result from the next batch."""
+        self._ensure_worker()
+        future = self._loop.create_future()
+        self._pending.append((item, future))
+        self._has_items.set()
+        if len(self._pending) >= self.max_batch_size:
+            self._full.set()
+        return await future
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._worker is not None and not self._worker.done() and self._loop is loop:
+            return
+        self._loop = loop
+        self._has_items = asyncio.Event()
+        self._full = asyncio.Event()
+        self._inflight = asyncio.Semaphore(self.max_inflight_batches)
+        self._worker = loop.create_task(self._collect())
+
+    async def _collect(self):
+        while True:
+            await self._has_items.wait()
+            if len(self._pending) < self.max_batch_size:
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.max_wait_ms / 1000)
+                except asyncio.TimeoutError:
+                    pass
+
+            batch = [self._pending.popleft() for _ in range(min(self.max_batch_size, len(self._pending)))]
+            self._full.clear()
+            if not self._pending:
+                self._has_items.clear()
+            elif len(self._pending) >= self.max_batch_size:
+                self._full.set()
+
+            # Callers that were cancelled (e.g. stage timeout) are dropped from the batch
+            batch = [(item, future) for item, future in batch if not future.done()]
+            if batch:
+                await self._inflight.acquire()
+                self._loop.create_task(self._dispatch(batch))
+
+    async def _dispatch(self, batch: List[Tuple[Any, asyncio.Future]]):
+        try:
+            results = await InferenceExecutor.run(self.batch_fn, [item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self._inflight.release()
+            self._batches += 1
+            self._items += len(batch)
+            self._batch_sizes.append(len(batch))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "pending": len(self._pending),
+            "batches": self._batches,
+            "items": self._items,
+            "mean_batch_size": round(self._items / self._batches, 2) if self._batches else 0.0,
+            "batch_size": metrics.percentiles(self._batch_sizes),
+        }
@@ -0,0 +1,128 @@
+"""Binary encoding of stored conversation messages.
+
+Every value starts with a format byte, so values written in different
+formats can live side by side and be rewritten lazily:
+
+    0x01  JSON object (stdlib json or orjson)
+    0x02  msgpack array [role, content, timestamp in microseconds, extra fields]
+    +0x10 the payload after the format byte is zstd-compressed
+
+Values without a format byte (they start with "{") are plain JSON written
+before this layer existed, or by the Redis script converting legacy blobs.
+Format bytes are below 0x20, so they can never be the first byte of JSON.
+"""
+from typing import Any, Dict, Optional
+import os
+import json
+from datetime import datetime, timedelta
+
+CONTEXT_CODECS = ("json", "orjson", "msgpack")
+CONTEXT_CODEC = os.getenv("CONTEXT_CODEC", "json")
+# Values at least this large are zstd-compressed (0 disables; needs the zstandard package)
+CONTEXT_COMPRESS_THRESHOLD = int(os.getenv("CONTEXT_COMPRESS_THRESHOLD", "0"))
+CONTEXT_COMPRESS_LEVEL = int(os.getenv("CONTEXT_COMPRESS_LEVEL", "3"))
+
+FORMAT_JSON = 0x01
+FORMAT_MSGPACK = 0x02
+FLAG_ZSTD = 0x10
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+_FIXED_FIELDS = ("role", "content", "timestamp")
+# Non-default json.dumps arguments would build a new encoder on every call
+_json_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+
+def _to_micros(timestamp: Any) -> Optional[int]:
+    """ISO timestamp (naive UTC, as written by ContextMemory) to integer microseconds."""
+    if not isinstance(timestamp, str):
+        return None
+    try:
+        parsed = datetime.fromisoformat(timestamp)
+    except ValueError:
+        return None
+    # Only naive timestamps in isoformat()'s own layout round-trip exactly
+    if parsed.tzinfo is not None or len(timestamp) != (26 if parsed.microsecond else 19):
+        return None
+    return (parsed - _EPOCH) // _MICROSECOND
+
+
+class ContextCodec:
+    """Encode / decode conversation messages in the configured format.
+
+    Decoding accepts every format regardless of the configured one (given the
+    library it needs is installed); ``needs_migration`` tells whether a stored
+    value should be rewritten in the current format.
+    """
+
+    def __init__(self, name: str = CONTEXT_CODEC, compress_threshold: int = CONTEXT_COMPRESS_THRESHOLD,
+                 compress_level: int = CONTEXT_COMPRESS_LEVEL):
+        if name not in CONTEXT_CODECS:
+            raise ValueError(f"Unknown context codec {name!r}; expected one of {CONTEXT_CODECS}")
+        self.name = name
+        self.format = FORMAT_MSGPACK if name == "msgpack" else FORMAT_JSON
+        self.compress_threshold = compress_threshold
+        self._orjson = self._import("orjson") if name == "orjson" else None
+        self._msgpack = self._import("msgpack") if name == "msgpack" else None
+        self._zstd = self._import("zstandard") if compress_threshold > 0 else None
+        if self._zstd is not None:
+            self._compressor = self._zstd.ZstdCompressor(level=compress_level)
+            self._decompressor = self._zstd.ZstdDecompressor()
+
+    @staticmethod
+    def _import(module: str):
+        try:
+            return __import__(module)
+        except ImportError as e:
+            raise ImportError(f"{module} is required for this context codec setting; pip install {module}") from e
+
+    def encode(self, message: Dict[str, Any]) -> bytes:
+        if self.format == FORMAT_MSGPACK:
+            micros = _to_micros(message.get("timestamp"))
+            extra = {k: v for k, v in message.items() if k not in _FIXED_FIELDS}
+            if micros is None and "timestamp" in message:
+                extra["timestamp"] = message["timestamp"]
+            payload = self._msgpack.packb(
+                [message.get("role"), message.get("content"), micros, extra or None], use_bin_type=True
+            )
+        elif self._orjson is not None:
+            payload = self._orjson.dumps(message)
+        else:
+            payload = _json_encoder.encode(message).encode("utf-8")
+
+        header = self.format
+        if 0 < self.compress_threshold <= len(payload):
+            payload = self._compressor.compress(payload)
+            header |= FLAG_ZSTD
+        return bytes((header,)) + payload
+
+    def decode(self, data: bytes) -> Dict[str, Any]:
+        header = data[0]
+        if header >= 0x20:
+            return json.loads(data)  # no format byte: plain JSON
+
+        payload = data[1:]
+        if header & FLAG_ZSTD:
+            payload = self._zstd_decompressor().decompress(payload)
+        if header & ~FLAG_ZSTD == FORMAT_JSON:
+            return self._orjson.loads(payload) if self._orjson is not None else json.loads(payload.decode("utf-8"))
+        if header & ~FLAG_ZSTD == FORMAT_MSGPACK:
+            role, content, micros, extra = (self._msgpack or self._import("msgpack")).unpackb(payload, raw=False)
+            message = {"role": role, "content": content}
+            if micros is not None:
+                message["timestamp"] = (_EPOCH + micros * _MICROSECOND).isoformat()
+            if extra:
+                message.update(extra)
+            return message
+        raise ValueError(f"Unknown context value format byte 0x{header:02x}")
+
+    def needs_migration(self, data: bytes) -> bool:
+        """True for values not in the configured format (compression changes alone don't count)."""
+        return data[0] & ~FLAG_ZSTD != self.format
+
+    def _zstd_decompressor(self):
+        if self._zstd is None:
+            self._zstd = self._import("zstandard")
+            self._compressor = self._zstd.ZstdCompressor(level=CONTEXT_COMPRESS_LEVEL)
+            self._decompressor = self._zstd.ZstdDecompressor()
+        return self._decompressor
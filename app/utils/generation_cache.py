@@ -0,0 +1,175 @@
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from collections import OrderedDict
+import os
+import json
+import hashlib
+import numpy as np
+
+from app.utils import metrics
+from app.utils.cache import TTLCache
+
+GENERATION_CACHE_MODES = ("off", "exact", "semantic")
+GENERATION_CACHE = os.getenv("GENERATION_CACHE", "off")  # opt-in: exact or semantic
+GENERATION_CACHE_SIZE = int(os.getenv("GENERATION_CACHE_SIZE", "2048"))
+GENERATION_CACHE_TTL = float(os.getenv("GENERATION_CACHE_TTL", "3600"))
+# Cosine similarity between messages above which a cached reply is reused (semantic mode)
+GENERATION_CACHE_SIMILARITY = float(os.getenv("GENERATION_CACHE_SIMILARITY", "0.95"))
+GENERATION_CACHE_BUCKET_SIZE = int(os.getenv("GENERATION_CACHE_BUCKET_SIZE", "256"))  # messages compared per prompt shape
+
+
+def normalize_message(message: str) -> str:
+    """Case-, whitespace- and trailing-punctuation-insensitive form of a user message."""
+    return " ".join(message.lower().split()).strip(" .!?")
+
+
+class GenerationCache:
+    """Cache of LLM replies keyed on the parts the prompt is built from.
+
+    The key is a hash of (template, stage, strategy, sorted needs, the
+    conversation history as rendered into the prompt, normalized message,
+    model, generation parameters). A reply is therefore only reused for the
+    same history: repeated questions (greetings, FAQ-style requests) hit
+    across sessions when they open a conversation, but a reply written from
+    one user's history is never served to another. In semantic mode a miss
+    falls back to the closest earlier message with the same prompt shape
+    (everything but the message), reusing its reply when the embeddings'
+    cosine similarity reaches the threshold.
+
+    ``embed_fn`` is an async callable returning the embedding of one text
+    (SemanticRetriever.embed_query); it is only needed in semantic mode.
+    """
+
+    def __init__(self,
+                 mode: str = GENERATION_CACHE,
+                 embed_fn: Optional[Callable[[str], Awaitable[np.ndarray]]] = None,
+                 max_entries: int = GENERATION_CACHE_SIZE,
+                 ttl_seconds: float = GENERATION_CACHE_TTL,
+                 similarity: float = GENERATION_CACHE_SIMILARITY,
+                 name: str = "generation_cache"):
+        if mode not in GENERATION_CACHE_MODES:
+            raise ValueError(f"Unknown generation cache mode {mode!r}; expected one of {GENERATION_CACHE_MODES}")
+        if mode == "semantic" and embed_fn is None:
+            raise ValueError("Semantic generation cache needs an embed_fn")
+        self.mode = mode
+        self.embed_fn = embed_fn
+        self.similarity = similarity
+        # key -> (reply, seconds the generation took)
+        self._entries = TTLCache(max_entries, ttl_seconds)
+        # prompt shape -> {key: unit message vector}, for near-duplicate lookups
+        self._buckets: Dict[str, "OrderedDict[str, np.ndarray]"] = {}
+        # key -> prompt shape of every stored vector, least recently used first;
+        # capped like the entries so the buckets stay bounded too
+        self._vectors: "OrderedDict[str, str]" = OrderedDict()
+        self.max_vectors = max_entries
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.saved_seconds = 0.0
+        metrics.register(name, self.stats)
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    @staticmethod
+    def key(template: str, stage: str, strategy: str, needs: List[str], context: str, message: str,
+            model: str, params: Dict[str, Any]) -> Tuple[str, str]:
+        """(exact key, prompt-shape key) for one generation; ``context`` is the rendered history."""
+        shape = json.dumps([template, stage, strategy, sorted(needs), context, model, params],
+                           sort_keys=True, ensure_ascii=False, default=str)
+        exact = json.dumps([shape, normalize_message(message)], ensure_ascii=False)
+        return hashlib.sha256(exact.encode("utf-8")).hexdigest(), hashlib.sha256(shape.encode("utf-8")).hexdigest()
+
+    async def get(self, key: Tuple[str, str], message: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        exact, shape = key
+        entry = self._entries.get(exact)
+        if entry is not None:
+            self._touch(exact)
+            self.exact_hits += 1
+            self.saved_seconds += entry[1]
+            return entry[0]
+
+        if self.mode == "semantic":
+            entry = await self._nearest(shape, message)
+            if entry is not None:
+                self.semantic_hits += 1
+                self.saved_seconds += entry[1]
+                return entry[0]
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: Tuple[str, str], message: str, reply: str, generation_seconds: float = 0.0):
+        if not self.enabled:
+            return
+        exact, shape = key
+        self._entries.set(exact, (reply, generation_seconds))
+        self.stores += 1
+        if self.mode == "semantic":
+            vector = await self._embed(message)
+            bucket = self._buckets.setdefault(shape, OrderedDict())
+            bucket[exact] = vector
+            bucket.move_to_end(exact)
+            self._vectors[exact] = shape
+            self._touch(exact)
+            while len(bucket) > GENERATION_CACHE_BUCKET_SIZE:
+                self._drop_vector(next(iter(bucket)))
+            while len(self._vectors) > self.max_vectors:
+                self._drop_vector(next(iter(self._vectors)))
+
+    async def _nearest(self, shape: str, message: str) -> Optional[Tuple[str, float]]:
+        bucket = self._buckets.get(shape)
+        if not bucket:
+            return None
+        vector = await self._embed(message)
+        keys = list(bucket)
+        similarities = np.stack([bucket[k] for k in keys]) @ vector
+        for i in np.argsort(-similarities):
+            if similarities[i] < self.similarity:
+                break
+            entry = self._entries.get(keys[i])
+            if entry is not None:
+                self._touch(keys[i])
+                return entry
+            self._drop_vector(keys[i])  # expired or evicted
+        return None
+
+    def _touch(self, exact: str) -> None:
+        if exact in self._vectors:
+            self._vectors.move_to_end(exact)
+
+    def _drop_vector(self, exact: str) -> None:
+        shape = self._vectors.pop(exact)
+        bucket = self._buckets[shape]
+        del bucket[exact]
+        if not bucket:
+            del self._buckets[shape]
+
+    async def _embed(self, message: str) -> np.ndarray:
+        vector = np.asarray(await self.embed_fn(normalize_message(message)), dtype="float32").ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def clear(self):
+        self._entries.clear()
+        self._buckets.clear()
+        self._vectors.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "mode": self.mode,
+            "entries": len(self._entries),
+            "vectors": len(self._vectors),
+            "evictions": self._entries.evictions,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "hit_rate": round((self.exact_hits + self.semantic_hits) / lookups, 4) if lookups else 0.0,
+            "saved_seconds": round(self.saved_seconds, 3),
+        }
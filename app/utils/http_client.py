@@ -0,0 +1,148 @@
+from typing import Dict, Any, Optional
+from collections import deque
+import os
+import time
+import asyncio
+import aiohttp
+import structlog
+
+from app.utils import metrics
+
+logger = structlog.get_logger()
+
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "100"))  # open connections in total
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", "20"))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "60"))  # idle seconds before closing
+HTTP_DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", "300"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))  # pool wait + TCP/TLS handshake
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "60"))  # between reads on the socket
+HTTP_TOTAL_TIMEOUT = float(os.getenv("HTTP_TOTAL_TIMEOUT", "120"))
+
+
+class HTTPClientPool:
+    """Process-wide aiohttp session shared by every outbound API client.
+
+    Created in the FastAPI lifespan and closed on shutdown, so connections to
+    the LLM APIs stay open across chat turns instead of paying a TCP + TLS
+    handshake per request. A trace config counts new versus reused
+    connections, pool waits and DNS cache hits (see /api/metrics).
+    """
+
+    _session: Optional[aiohttp.ClientSession] = None
+    _requests = 0
+    _errors = 0
+    _new_connections = 0
+    _reused_connections = 0
+    _dns_cache_hits = 0
+    _dns_cache_misses = 0
+    _request_ms = deque(maxlen=1024)
+    _connect_ms = deque(maxlen=1024)
+    _pool_wait_ms = deque(maxlen=1024)
+
+    @classmethod
+    async def initialize(cls) -> aiohttp.ClientSession:
+        if cls._session is not None and not cls._session.closed:
+            return cls._session
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_LIMIT,
+            limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+            use_dns_cache=True,
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+            enable_cleanup_closed=True
+        )
+        timeout = aiohttp.ClientTimeout(
+            total=HTTP_TOTAL_TIMEOUT,
+            connect=HTTP_CONNECT_TIMEOUT,
+            sock_read=HTTP_READ_TIMEOUT
+        )
+        cls._session = aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                             trace_configs=[cls._trace_config()])
+        logger.info("HTTP client pool started", limit=HTTP_POOL_LIMIT,
+                    limit_per_host=HTTP_POOL_LIMIT_PER_HOST, keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT)
+        return cls._session
+
+    @classmethod
+    async def session(cls) -> aiohttp.ClientSession:
+        """The shared session; created on first use outside the lifespan (scripts, tests)."""
+        if cls._session is None or cls._session.closed:
+            await cls.initialize()
+        return cls._session
+
+    @classmethod
+    async def shutdown(cls):
+        session, cls._session = cls._session, None
+        if session is not None and not session.closed:
+            await session.close()
+            # Let SSL transports finish closing before the loop stops
+            await asyncio.sleep(0.25)
+            logger.info("HTTP client pool closed", **cls.stats())
+
+    @classmethod
+    def _trace_config(cls) -> aiohttp.TraceConfig:
+        trace = aiohttp.TraceConfig()
+
+        async def on_request_start(session, ctx, params):
+            ctx.started = time.perf_counter()
+
+        async def on_request_end(session, ctx, params):
+            cls._requests += 1
+            cls._request_ms.append((time.perf_counter() - ctx.started) * 1000)
+
+        async def on_request_exception(session, ctx, params):
+            cls._requests += 1
+            cls._errors += 1
+
+        async def on_queued_start(session, ctx, params):
+            ctx.queued = time.perf_counter()
+
+        async def on_queued_end(session, ctx, params):
+            cls._pool_wait_ms.append((time.perf_counter() - ctx.queued) * 1000)
+
+        async def on_connection_create_start(session, ctx, params):
+            ctx.connecting = time.perf_counter()
+
+        async def on_connection_create_end(session, ctx, params):
+            cls._new_connections += 1
+            cls._connect_ms.append((time.perf_counter() - ctx.connecting) * 1000)
+
+        async def on_connection_reuseconn(session, ctx, params):
+            cls._reused_connections += 1
+
+        async def on_dns_cache_hit(session, ctx, params):
+            cls._dns_cache_hits += 1
+
+        async def on_dns_cache_miss(session, ctx, params):
+            cls._dns_cache_misses += 1
+
+        trace.on_request_start.append(on_request_start)
+        trace.on_request_end.append(on_request_end)
+        trace.on_request_exception.append(on_request_exception)
+        trace.on_connection_queued_start.append(on_queued_start)
+        trace.on_connection_queued_end.append(on_queued_end)
+        trace.on_connection_create_start.append(on_connection_create_start)
+        trace.on_connection_create_end.append(on_connection_create_end)
+        trace.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace.on_dns_cache_hit.append(on_dns_cache_hit)
+        trace.on_dns_cache_miss.append(on_dns_cache_miss)
+        return trace
+
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        connections = cls._new_connections + cls._reused_connections
+        return {
+            "open": cls._session is not None and not cls._session.closed,
+            "requests": cls._requests,
+            "errors": cls._errors,
+            "new_connections": cls._new_connections,
+            "reused_connections": cls._reused_connections,
+            "reuse_ratio": round(cls._reused_connections / connections, 3) if connections else 0.0,
+            "dns_cache_hits": cls._dns_cache_hits,
+            "dns_cache_misses": cls._dns_cache_misses,
+            "request_ms": metrics.percentiles(cls._request_ms),
+            "connect_ms": metrics.percentiles(cls._connect_ms),
+            "pool_wait_ms": metrics.percentiles(cls._pool_wait_ms),
+        }
+
+
+metrics.register("http_client", HTTPClientPool.stats)
@@ -1,10 +1,18 @@
 # app/utils/ibm_client.py
-import aiohttp
 import os
+import json
 import structlog
+from typing import AsyncIterator, Dict
+
+from app.utils.http_client import HTTPClientPool
+from app.utils.llm_client import LLMHTTPError
+from app.utils.sse import read_events
 
 logger = structlog.get_logger()
 
+# Streaming endpoint under the deployment URL; returns server-sent events
+IBM_STREAM_PATH = os.getenv("IBM_STREAM_PATH", "text/generation_stream")
+
 class IBMClient:
     """IBM Watson / Granite async API wrapper."""
 
@@ -17,35 +25,63 @@ class IBMClient:
         self.base_url = base_url or os.getenv("IBM_API_URL")
         self.project_id = project_id or os.getenv("IBM_PROJECT_ID")
         self.model = model or os.getenv("IBM_MODEL_NAME", "granite-13b-chat-v2")
+        self.parameters = {"temperature": 0.6}
 
         if not self.api_key or not self.base_url:
             raise ValueError("IBM API credentials are missing.")
 
-    async def generate(self, prompt: str, max_tokens: int = 512) -> str:
-        """Generate response using IBM Watsonx LLM (Granite)."""
-        url = f"{self.base_url}/v1/projects/{self.project_id}/deployments/{self.model}/predictions"
+    def _deployment_url(self) -> str:
+        return f"{self.base_url}/v1/projects/{self.project_id}/deployments/{self.model}"
 
-        headers = {
+    def _headers(self) -> Dict[str, str]:
+        return {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
 
-        payload = {
+    def _payload(self, prompt: str, max_tokens: int) -> Dict:
+        return {
             "input": {
                 "prompt": prompt,
-                "parameters": {
-                    "max_new_tokens": max_tokens,
-                    "temperature": 0.6
-                }
+                "parameters": dict(self.parameters, max_new_tokens=max_tokens)
             }
         }
 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=headers, json=payload) as resp:
-                if resp.status != 200:
-                    error_text = await resp.text()
-                    logger.error("IBM LLM API error", status=resp.status, detail=error_text)
-                    raise RuntimeError(f"IBM LLM API error: {resp.status}")
+    @staticmethod
+    async def _error(resp) -> LLMHTTPError:
+        error_text = await resp.text()
+        logger.error("IBM LLM API error", status=resp.status, detail=error_text)
+        retry_after = resp.headers.get("Retry-After", "")
+        return LLMHTTPError(resp.status, error_text,
+                            retry_after=float(retry_after) if retry_after.isdigit() else None)
+
+    async def generate(self, prompt: str, max_tokens: int = 512) -> str:
+        """Generate response using IBM Watsonx LLM (Granite)."""
+        url = f"{self._deployment_url()}/predictions"
+
+        # Shared pooled session: keep-alive connections are reused across turns
+        session = await HTTPClientPool.session()
+        async with session.post(url, headers=self._headers(), json=self._payload(prompt, max_tokens)) as resp:
+            if resp.status != 200:
+                raise await self._error(resp)
+
+            data = await resp.json()
+            return data.get("results", [{}])[0].get("generated_text", "No response generated.")
+
+    async def generate_stream(self, prompt: str, max_tokens: int = 512) -> AsyncIterator[str]:
+        """Yield generated text chunks as the model produces them."""
+        url = f"{self._deployment_url()}/{IBM_STREAM_PATH}"
+        headers = dict(self._headers(), Accept="text/event-stream")
+
+        session = await HTTPClientPool.session()
+        async with session.post(url, headers=headers, json=self._payload(prompt, max_tokens)) as resp:
+            if resp.status != 200:
+                raise await self._error(resp)
 
-                data = await resp.json()
-                return data.get("results", [{}])[0].get("generated_text", "No response generated.")
+            # Each event carries the newly generated text in the non-streaming result shape
+            async for _, data in read_events(resp):
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data).get("results", [{}])[0].get("generated_text", "")
+                if chunk:
+                    yield chunk
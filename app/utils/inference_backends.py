@@ -0,0 +1,251 @@
+"""Selectable CPU inference backends for the emotion classifier and the embedding model.
+
+Backends:
+    torch       full-precision PyTorch (transformers pipeline / SentenceTransformer)
+    int8        PyTorch with dynamic int8 quantization of every Linear layer
+    onnx        ONNX Runtime on an exported fp32 graph
+    onnx_int8   ONNX Runtime on the exported graph with dynamically quantized weights
+
+The ONNX backends need artifacts produced offline:
+
+    python -m app.utils.inference_backends export [--task classification|embedding|all]
+"""
+from typing import Dict, Any, List, Optional, Protocol, Union
+import os
+import sys
+import json
+import argparse
+import numpy as np
+import structlog
+
+logger = structlog.get_logger()
+
+BACKENDS = ("torch", "int8", "onnx", "onnx_int8")
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch")
+EMOTION_BACKEND = os.getenv("EMOTION_BACKEND", INFERENCE_BACKEND)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", INFERENCE_BACKEND)
+INFERENCE_ARTIFACT_DIR = os.getenv("INFERENCE_ARTIFACT_DIR", "models/exported")
+ONNX_OPSET = int(os.getenv("ONNX_OPSET", "14"))
+# Intra-op threads for ONNX Runtime sessions; 0 keeps the runtime default
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", os.getenv("INFERENCE_TORCH_THREADS", "0")))
+
+EMOTION_MODEL = "cardiffnlp/twitter-roberta-base-sentiment-latest"
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+class TextClassifier(Protocol):
+    """Called like a transformers text-classification pipeline."""
+
+    def __call__(self, texts: Union[str, List[str]], batch_size: int = 1,
+                 truncation: bool = True) -> List[Dict[str, Any]]: ...
+
+
+class TextEmbedder(Protocol):
+    """The subset of SentenceTransformer used by the retriever and index builder."""
+
+    tokenizer: Any
+    max_seq_length: int
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32,
+               show_progress_bar: bool = False, **kwargs) -> np.ndarray: ...
+
+    def get_sentence_embedding_dimension(self) -> int: ...
+
+
+def artifact_dir(model_name: str, root: Optional[str] = None) -> str:
+    return os.path.join(root or INFERENCE_ARTIFACT_DIR, model_name.replace("/", "__"))
+
+
+def backend_model_key(model_name: str, backend: str) -> str:
+    """Identity of a model's outputs; backends differ slightly, so caches key on both."""
+    return model_name if backend == "torch" else f"{model_name}@{backend}"
+
+
+def _check_backend(backend: str) -> None:
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}', expected one of {BACKENDS}")
+
+
+def _quantize_dynamic(module):
+    import torch
+    return torch.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _onnx_session(model_dir: str, backend: str):
+    import onnxruntime as ort
+    path = os.path.join(model_dir, "model.int8.onnx" if backend == "onnx_int8" else "model.onnx")
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} not found; run 'python -m app.utils.inference_backends export' first.")
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if ONNX_THREADS > 0:
+        options.intra_op_num_threads = ONNX_THREADS
+    return ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+
+class OnnxTextClassifier:
+    """Sequence classifier on ONNX Runtime with the pipeline's call signature."""
+
+    def __init__(self, model_dir: str, backend: str = "onnx"):
+        from transformers import AutoConfig, AutoTokenizer
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.id2label = {int(k): v for k, v in AutoConfig.from_pretrained(model_dir).id2label.items()}
+        self.session = _onnx_session(model_dir, backend)
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def __call__(self, texts: Union[str, List[str]], batch_size: int = 1,
+                 truncation: bool = True) -> List[Dict[str, Any]]:
+        texts = [texts] if isinstance(texts, str) else list(texts)
+        results = []
+        for start in range(0, len(texts), max(1, batch_size)):
+            encoded = self.tokenizer(texts[start:start + batch_size], padding=True,
+                                     truncation=truncation, return_tensors="np")
+            feeds = {k: v.astype("int64") for k, v in encoded.items() if k in self.input_names}
+            logits = self.session.run(None, feeds)[0]
+            probs = np.exp(logits - logits.max(axis=1, keepdims=True))
+            probs /= probs.sum(axis=1, keepdims=True)
+            for row in probs:
+                best = int(row.argmax())
+                results.append({"label": self.id2label[best], "score": float(row[best])})
+        return results
+
+
+class OnnxTextEmbedder:
+    """Sentence embedder on ONNX Runtime; pooling and normalization follow the exported model."""
+
+    def __init__(self, model_dir: str, backend: str = "onnx"):
+        from transformers import AutoTokenizer
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        with open(os.path.join(model_dir, "pooling.json"), "r", encoding="utf-8") as f:
+            pooling = json.load(f)
+        self.max_seq_length = pooling["max_seq_length"]
+        self.pooling_mode = pooling["mode"]
+        self.normalize = pooling["normalize"]
+        self.dimension = pooling["dimension"]
+        self.session = _onnx_session(model_dir, backend)
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32,
+               show_progress_bar: bool = False, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        sentences = [sentences] if single else list(sentences)
+        embeddings = np.empty((len(sentences), self.dimension), dtype="float32")
+        # Longest first, like SentenceTransformer, so batches pad to similar lengths
+        order = np.argsort([-len(s) for s in sentences], kind="stable")
+        for start in range(0, len(sentences), batch_size):
+            rows = order[start:start + batch_size]
+            encoded = self.tokenizer([sentences[i] for i in rows], padding=True, truncation=True,
+                                     max_length=self.max_seq_length, return_tensors="np")
+            feeds = {k: v.astype("int64") for k, v in encoded.items() if k in self.input_names}
+            hidden = self.session.run(None, feeds)[0]
+            if self.pooling_mode == "cls":
+                pooled = hidden[:, 0]
+            else:
+                mask = encoded["attention_mask"][..., None].astype("float32")
+                pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            if self.normalize:
+                pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            embeddings[rows] = pooled
+        return embeddings[0] if single else embeddings
+
+
+def load_text_classifier(model_name: str = EMOTION_MODEL, backend: Optional[str] = None) -> TextClassifier:
+    backend = backend or EMOTION_BACKEND
+    _check_backend(backend)
+    logger.info("Loading text classifier", model=model_name, backend=backend)
+    if backend.startswith("onnx"):
+        return OnnxTextClassifier(artifact_dir(model_name), backend)
+
+    from transformers import pipeline
+    classifier = pipeline("sentiment-analysis", model=model_name)
+    if backend == "int8":
+        classifier.model = _quantize_dynamic(classifier.model)
+    return classifier
+
+
+def load_text_embedder(model_name: str = EMBEDDING_MODEL, backend: Optional[str] = None) -> TextEmbedder:
+    backend = backend or EMBEDDING_BACKEND
+    _check_backend(backend)
+    logger.info("Loading text embedder", model=model_name, backend=backend)
+    if backend.startswith("onnx"):
+        return OnnxTextEmbedder(artifact_dir(model_name), backend)
+
+    from sentence_transformers import SentenceTransformer
+    embedder = SentenceTransformer(model_name, device="cpu")
+    if backend == "int8":
+        embedder = _quantize_dynamic(embedder)
+    return embedder
+
+
+def export(task: str, model_name: str, output_root: Optional[str] = None, quantize: bool = True) -> str:
+    """Export a model to ONNX (plus an int8-weight copy) with its tokenizer and config."""
+    import torch
+    output_dir = artifact_dir(model_name, output_root)
+    os.makedirs(output_dir, exist_ok=True)
+
+    if task == "classification":
+        from transformers import AutoModelForSequenceClassification, AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModelForSequenceClassification.from_pretrained(model_name)
+        output_name = "logits"
+    elif task == "embedding":
+        from sentence_transformers import SentenceTransformer
+        embedder = SentenceTransformer(model_name, device="cpu")
+        tokenizer, model = embedder.tokenizer, embedder[0].auto_model
+        pooling = embedder[1].get_pooling_mode_str()
+        if pooling not in ("mean", "cls"):
+            raise ValueError(f"Pooling mode '{pooling}' is not supported by the ONNX embedder.")
+        with open(os.path.join(output_dir, "pooling.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "mode": pooling,
+                "normalize": any(type(m).__name__ == "Normalize" for m in embedder),
+                "max_seq_length": embedder.max_seq_length,
+                "dimension": embedder.get_sentence_embedding_dimension(),
+            }, f, indent=2)
+        output_name = "last_hidden_state"
+    else:
+        raise ValueError(f"Unknown task '{task}', expected 'classification' or 'embedding'")
+
+    model.eval()
+    sample = tokenizer(["An example sentence for export."], return_tensors="pt")
+    input_names = list(sample.keys())
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes[output_name] = {0: "batch", 1: "sequence"} if task == "embedding" else {0: "batch"}
+    onnx_path = os.path.join(output_dir, "model.onnx")
+    with torch.no_grad():
+        # A trailing dict is passed as keyword arguments, so input order does not matter
+        torch.onnx.export(model, (dict(sample),), onnx_path, input_names=input_names,
+                          output_names=[output_name], dynamic_axes=dynamic_axes, opset_version=ONNX_OPSET)
+    tokenizer.save_pretrained(output_dir)
+    model.config.save_pretrained(output_dir)
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(onnx_path, os.path.join(output_dir, "model.int8.onnx"), weight_type=QuantType.QInt8)
+    logger.info("Model exported", task=task, model=model_name, output_dir=output_dir)
+    return output_dir
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Export inference backend artifacts.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="export models to ONNX")
+    export_parser.add_argument("--task", choices=("classification", "embedding", "all"), default="all")
+    export_parser.add_argument("--model", help="model name (default: the app's model for the task)")
+    export_parser.add_argument("--output-dir", default=INFERENCE_ARTIFACT_DIR)
+    export_parser.add_argument("--no-quantize", action="store_true", help="skip the int8 ONNX copy")
+    args = parser.parse_args(argv)
+
+    defaults = {"classification": EMOTION_MODEL, "embedding": EMBEDDING_MODEL}
+    tasks = list(defaults) if args.task == "all" else [args.task]
+    if args.model and len(tasks) > 1:
+        parser.error("--model needs a single --task")
+    for task in tasks:
+        print(export(task, args.model or defaults[task], args.output_dir, quantize=not args.no_quantize))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
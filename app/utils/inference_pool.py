@@ -0,0 +1,102 @@
+from typing import Dict, Any, Callable, Optional
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import os
+import time
+import asyncio
+import threading
+import structlog
+
+from app.utils import metrics
+
+logger = structlog.get_logger()
+
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", str(os.cpu_count() or 1)))
+# torch intra-op threads per forward pass; 0 keeps the torch default.
+# Size so that INFERENCE_WORKERS * INFERENCE_TORCH_THREADS ~= physical cores.
+INFERENCE_TORCH_THREADS = int(os.getenv("INFERENCE_TORCH_THREADS", "0"))
+
+
+class InferenceExecutor:
+    """Dedicated thread pool for CPU-bound model inference.
+
+    Torch and faiss release the GIL inside their kernels, so a thread pool keeps
+    the event loop free without duplicating model weights across processes.
+    """
+
+    _executor: Optional[ThreadPoolExecutor] = None
+    _lock = threading.Lock()
+    _workers = 0
+    _queued = 0
+    _active = 0
+    _max_queued = 0
+    _completed = 0
+    _wait_ms = deque(maxlen=1024)
+    _run_ms = deque(maxlen=1024)
+
+    @classmethod
+    def initialize(cls, workers: int = None, torch_threads: int = None):
+        with cls._lock:
+            if cls._executor is not None:
+                return
+            cls._workers = workers or INFERENCE_WORKERS
+            cls._executor = ThreadPoolExecutor(max_workers=cls._workers, thread_name_prefix="inference")
+
+        torch_threads = INFERENCE_TORCH_THREADS if torch_threads is None else torch_threads
+        if torch_threads > 0:
+            try:
+                import torch
+                torch.set_num_threads(torch_threads)
+            except ImportError:
+                pass
+        logger.info("Inference executor started", workers=cls._workers, torch_threads=torch_threads)
+
+    @classmethod
+    def shutdown(cls):
+        with cls._lock:
+            executor, cls._executor = cls._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    @classmethod
+    async def run(cls, fn: Callable, *args) -> Any:
+        """Run fn(*args) on the inference pool and await its result."""
+        if cls._executor is None:
+            cls.initialize()
+        submitted = time.perf_counter()
+        with cls._lock:
+            cls._queued += 1
+            cls._max_queued = max(cls._max_queued, cls._queued)
+
+        def job():
+            started = time.perf_counter()
+            with cls._lock:
+                cls._queued -= 1
+                cls._active += 1
+                cls._wait_ms.append((started - submitted) * 1000)
+            try:
+                return fn(*args)
+            finally:
+                with cls._lock:
+                    cls._active -= 1
+                    cls._completed += 1
+                    cls._run_ms.append((time.perf_counter() - started) * 1000)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(cls._executor, job)
+
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        with cls._lock:
+            return {
+                "workers": cls._workers,
+                "queue_depth": cls._queued,
+                "max_queue_depth": cls._max_queued,
+                "active": cls._active,
+                "completed": cls._completed,
+                "wait_ms": metrics.percentiles(cls._wait_ms),
+                "run_ms": metrics.percentiles(cls._run_ms),
+            }
+
+
+metrics.register("inference_executor", InferenceExecutor.stats)
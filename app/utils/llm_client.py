@@ -0,0 +1,407 @@
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+from collections import deque
+from contextlib import AsyncExitStack, asynccontextmanager
+import os
+import time
+import random
+import asyncio
+import aiohttp
+import structlog
+
+from app.utils import metrics
+
+logger = structlog.get_logger()
+
+LLM_BACKEND = os.getenv("LLM_BACKEND", "ibm")  # ibm | stub (deterministic offline model)
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "25"))  # seconds per call, including retries
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.2"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "2.0"))
+LLM_RETRYABLE_STATUSES = frozenset(
+    int(s) for s in os.getenv("LLM_RETRYABLE_STATUSES", "408,429,500,502,503,504").split(",") if s.strip()
+)
+LLM_HEDGE_PERCENTILE = int(os.getenv("LLM_HEDGE_PERCENTILE", "0"))  # e.g. 95; 0 disables hedging
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "50"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))  # consecutive failures to open
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", "30"))  # seconds open before a probe
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "64"))  # callers waiting for a slot before rejecting
+
+
+class LLMError(RuntimeError):
+    """Base class for LLM client failures."""
+
+
+class LLMHTTPError(LLMError):
+    """Non-200 response from an LLM API."""
+
+    def __init__(self, status: int, detail: str = "", retry_after: Optional[float] = None):
+        super().__init__(f"LLM API error: {status}")
+        self.status = status
+        self.detail = detail
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return self.status in LLM_RETRYABLE_STATUSES
+
+
+class CircuitOpenError(LLMError):
+    """The upstream is failing; calls fail fast until the breaker's reset timeout."""
+
+
+class LLMOverloadedError(LLMError):
+    """Too many calls already waiting for a concurrency slot."""
+
+
+class LLMDeadlineError(LLMError):
+    """The call did not complete within its deadline."""
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, LLMHTTPError):
+        return error.retryable
+    return isinstance(error, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError))
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker.
+
+    closed -> open after ``failure_threshold`` consecutive failures; open calls
+    fail fast for ``reset_timeout`` seconds, then a single probe is let through
+    (half-open) and its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, failure_threshold: int = LLM_BREAKER_FAILURES, reset_timeout: float = LLM_BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.opened = 0
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe_started: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "open":
+            return False
+        # Half-open: one probe at a time; a probe that never reported back is replaced
+        now = time.monotonic()
+        if self._probe_started is None or now - self._probe_started >= self.reset_timeout:
+            self._probe_started = now
+            return True
+        return False
+
+    def record_success(self):
+        self._failures = 0
+        self._opened_at = None
+        self._probe_started = None
+
+    def release_probe(self):
+        """The half-open probe was admitted but never reached the upstream; let another call probe."""
+        self._probe_started = None
+
+    def record_failure(self):
+        self._failures += 1
+        probe_failed = self._probe_started is not None
+        if probe_failed or (self._opened_at is None and self._failures >= self.failure_threshold):
+            self._opened_at = time.monotonic()
+            self.opened += 1
+            logger.warning("LLM circuit breaker opened", consecutive_failures=self._failures)
+        self._probe_started = None
+
+
+class ResilientLLMClient:
+    """Deadline, retry, hedging, circuit-breaker and concurrency wrapper around an LLM client.
+
+    ``backend`` is any object with ``generate(prompt, max_tokens)`` and
+    ``generate_stream(prompt, max_tokens)`` (IBMClient, StubLLMClient), and the
+    wrapper exposes the same two methods so ChatEngine can use either.
+
+    - every call has a deadline covering queueing, all attempts and backoff;
+    - retryable failures (429/5xx, timeouts, connection errors) are retried
+      with full-jitter exponential backoff, honouring Retry-After;
+    - with hedging enabled, a second request is sent when the first has not
+      answered by the configured latency percentile, and the first reply wins;
+    - a circuit breaker fails fast, without queueing for a slot, while the
+      upstream keeps failing;
+    - at most ``max_concurrency`` requests are in flight, with a bounded
+      number of callers queued behind them; the rest are rejected at once.
+
+    Streams are retried only until their first chunk arrives and are never hedged.
+    """
+
+    def __init__(self,
+                 backend: Any,
+                 deadline: float = LLM_DEADLINE,
+                 max_retries: int = LLM_MAX_RETRIES,
+                 hedge_percentile: int = LLM_HEDGE_PERCENTILE,
+                 max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 max_queue: int = LLM_MAX_QUEUE,
+                 breaker: Optional[CircuitBreaker] = None,
+                 name: str = "llm_client"):
+        self.backend = backend
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.hedge_percentile = hedge_percentile
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.breaker = breaker or CircuitBreaker()
+        # Identify the generation settings, e.g. for the generation cache key
+        self.model = getattr(backend, "model", type(backend).__name__)
+        self.parameters = getattr(backend, "parameters", {})
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._inflight = 0
+        self._queued = 0
+
+        self._calls = 0
+        self._successes = 0
+        self._failures = 0
+        self._retries = 0
+        self._hedges = 0
+        self._hedge_wins = 0
+        self._fast_failures = 0
+        self._rejected = 0
+        self._deadline_exceeded = 0
+        self._latency_ms = deque(maxlen=1024)  # successful attempts, drives the hedge delay
+        self._call_ms = deque(maxlen=1024)
+        metrics.register(name, self.stats)
+
+    async def generate(self, prompt: str, max_tokens: int = 512) -> str:
+        self._calls += 1
+        started = time.monotonic()
+        deadline = started + self.deadline
+        call = lambda: self.backend.generate(prompt=prompt, max_tokens=max_tokens)
+        try:
+            result = await self._with_retries(lambda: self._hedged(call, deadline), deadline)
+        except Exception:
+            self._failures += 1
+            raise
+        self._successes += 1
+        self._call_ms.append((time.monotonic() - started) * 1000)
+        return result
+
+    async def generate_stream(self, prompt: str, max_tokens: int = 512) -> AsyncIterator[str]:
+        self._calls += 1
+        started = time.monotonic()
+        deadline = started + self.deadline
+        try:
+            resources, stream, first = await self._with_retries(
+                lambda: self._open_stream(prompt, max_tokens, deadline), deadline
+            )
+        except Exception:
+            self._failures += 1
+            raise
+
+        # The concurrency slot stays held until the stream is finished or closed
+        async with resources:
+            try:
+                if first:
+                    yield first
+                async for chunk in stream:
+                    yield chunk
+            except Exception as e:
+                self._failures += 1
+                self.breaker.record_failure()
+                logger.warning("LLM stream failed mid-response", error=str(e))
+                raise
+        self._successes += 1
+        self._call_ms.append((time.monotonic() - started) * 1000)
+
+    async def _open_stream(self, prompt: str, max_tokens: int, deadline: float):
+        """One stream attempt: take a slot, start the stream and wait for its first chunk."""
+        resources = AsyncExitStack()
+        await resources.enter_async_context(self._admitted(deadline))
+        try:
+            started = time.monotonic()
+            stream = self.backend.generate_stream(prompt=prompt, max_tokens=max_tokens)
+            resources.push_async_callback(stream.aclose)
+            try:
+                first = await asyncio.wait_for(stream.__anext__(), timeout=self._remaining(deadline))
+            except StopAsyncIteration:
+                first = ""
+        except asyncio.CancelledError:
+            await resources.aclose()
+            raise
+        except Exception as e:
+            await resources.aclose()
+            self._record_attempt_failure(e)
+            raise
+        self.breaker.record_success()
+        self._latency_ms.append((time.monotonic() - started) * 1000)
+        return resources, stream, first
+
+    async def _with_retries(self, attempt_fn: Callable[[], Awaitable[Any]], deadline: float) -> Any:
+        attempt = 0
+        while True:
+            try:
+                return await attempt_fn()
+            except LLMDeadlineError:
+                self._deadline_exceeded += 1
+                raise
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError) and deadline <= time.monotonic():
+                    self._deadline_exceeded += 1
+                    raise LLMDeadlineError(f"LLM call exceeded its {self.deadline}s deadline") from e
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                if self.breaker.state == "open":
+                    # The failures so far opened the breaker; don't back off only to fail fast
+                    self._fast_failures += 1
+                    raise CircuitOpenError("LLM circuit breaker is open") from e
+                delay = self._backoff(attempt, e)
+                if time.monotonic() + delay >= deadline:
+                    raise
+                attempt += 1
+                self._retries += 1
+                logger.info("Retrying LLM call", attempt=attempt, delay=round(delay, 3), error=str(e))
+                await asyncio.sleep(delay)
+
+    async def _hedged(self, call: Callable[[], Awaitable[str]], deadline: float) -> str:
+        """One attempt; with hedging on, a backup request races it once the hedge delay passes."""
+        hedge_delay = self._hedge_delay()
+        if hedge_delay is None:
+            return await self._attempt(call, deadline)
+
+        first = asyncio.ensure_future(self._attempt(call, deadline))
+        pending = {first}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=min(hedge_delay, self._remaining(deadline)))
+            # No hedge when the answer is in, every slot is busy, or the breaker is not closed
+            if done or self._semaphore().locked() or self.breaker.state != "closed":
+                return await first
+
+            self._hedges += 1
+            backup = asyncio.ensure_future(self._attempt(call, deadline))
+            pending.add(backup)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is backup:
+                            self._hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _attempt(self, call: Callable[[], Awaitable[str]], deadline: float) -> str:
+        async with self._admitted(deadline):
+            started = time.monotonic()
+            try:
+                result = await asyncio.wait_for(call(), timeout=self._remaining(deadline))
+            except Exception as e:
+                self._record_attempt_failure(e)
+                raise
+            self.breaker.record_success()
+            self._latency_ms.append((time.monotonic() - started) * 1000)
+            return result
+
+    @asynccontextmanager
+    async def _admitted(self, deadline: float):
+        """Pass the circuit breaker, then hold a request slot.
+
+        The breaker is checked first, so while it is open calls fail fast
+        instead of queueing for a slot. A half-open probe that ends without
+        recording an outcome (no slot in time, cancelled) frees the probe.
+        """
+        probe = self._check_breaker()
+        try:
+            async with self._slot(deadline):
+                yield
+        finally:
+            if probe:
+                self.breaker.release_probe()
+
+    @asynccontextmanager
+    async def _slot(self, deadline: float):
+        """Hold one of the ``max_concurrency`` request slots, waiting at most until the deadline."""
+        slots = self._semaphore()
+        if slots.locked() and self._queued >= self.max_queue:
+            self._rejected += 1
+            raise LLMOverloadedError("LLM request queue is full")
+        self._queued += 1
+        try:
+            await asyncio.wait_for(slots.acquire(), timeout=self._remaining(deadline))
+        finally:
+            self._queued -= 1
+        self._inflight += 1
+        try:
+            yield
+        finally:
+            self._inflight -= 1
+            slots.release()
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._slots is None or self._loop is not loop:
+            self._loop = loop
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+        return self._slots
+
+    def _check_breaker(self) -> bool:
+        """Fail fast unless the breaker lets this call through; True if it is the half-open probe."""
+        probe = self.breaker.state == "half_open"
+        if not self.breaker.allow():
+            self._fast_failures += 1
+            raise CircuitOpenError("LLM circuit breaker is open")
+        return probe
+
+    def _record_attempt_failure(self, error: BaseException):
+        # Client errors (bad request, auth) say nothing about upstream health
+        if is_retryable(error) or not isinstance(error, LLMHTTPError):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    def _remaining(self, deadline: float) -> float:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise LLMDeadlineError(f"LLM call exceeded its {self.deadline}s deadline")
+        return remaining
+
+    def _backoff(self, attempt: int, error: BaseException) -> float:
+        """Full-jitter exponential backoff; a Retry-After from the server sets the floor."""
+        delay = random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * 2 ** attempt))
+        retry_after = getattr(error, "retry_after", None)
+        return max(delay, retry_after) if retry_after else delay
+
+    def _hedge_delay(self) -> Optional[float]:
+        if not self.hedge_percentile or len(self._latency_ms) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        key = f"p{self.hedge_percentile}"
+        return metrics.percentiles(self._latency_ms, (self.hedge_percentile,))[key] / 1000
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": type(self.backend).__name__,
+            "calls": self._calls,
+            "successes": self._successes,
+            "failures": self._failures,
+            "retries": self._retries,
+            "hedges": self._hedges,
+            "hedge_wins": self._hedge_wins,
+            "fast_failures": self._fast_failures,
+            "rejected": self._rejected,
+            "deadline_exceeded": self._deadline_exceeded,
+            "breaker": self.breaker.state,
+            "breaker_opened": self.breaker.opened,
+            "inflight": self._inflight,
+            "queued": self._queued,
+            "attempt_ms": metrics.percentiles(self._latency_ms),
+            "call_ms": metrics.percentiles(self._call_ms),
+        }
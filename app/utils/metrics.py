@@ -0,0 +1,26 @@
+from typing import Dict, Any, Callable, Iterable, Sequence
+import math
+
+# name -> zero-argument callable returning a JSON-serializable stats dict
+_providers: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+
+def register(name: str, provider: Callable[[], Dict[str, Any]]) -> None:
+    """Register a stats provider to be included in the metrics snapshot."""
+    _providers[name] = provider
+
+
+def snapshot() -> Dict[str, Dict[str, Any]]:
+    """Collect the current stats of every registered provider."""
+    return {name: provider() for name, provider in list(_providers.items())}
+
+
+def percentiles(samples: Iterable[float], points: Sequence[int] = (50, 95, 99)) -> Dict[str, float]:
+    """Nearest-rank percentiles of a sample window, e.g. {"p50": ..., "p95": ...}."""
+    ordered = sorted(samples)
+    if not ordered:
+        return {f"p{p}": 0.0 for p in points}
+    return {
+        f"p{p}": round(ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)], 3)
+        for p in points
+    }
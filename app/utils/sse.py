@@ -0,0 +1,38 @@
+from typing import Any, AsyncIterator, Optional, Tuple
+import json
+
+import aiohttp
+
+# Response headers for event streams; X-Accel-Buffering stops nginx from buffering tokens
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+async def read_events(response: aiohttp.ClientResponse) -> AsyncIterator[Tuple[str, str]]:
+    """Parse a server-sent-events response body into (event, data) pairs as they arrive."""
+    event, data = "message", []
+    async for raw in response.content:
+        line = raw.decode("utf-8").rstrip("\r\n")
+        if not line:
+            if data:
+                yield event, "\n".join(data)
+            event, data = "message", []
+            continue
+        if line.startswith(":"):
+            continue  # comment / keep-alive
+        field, _, value = line.partition(":")
+        if value.startswith(" "):
+            value = value[1:]
+        if field == "event":
+            event = value
+        elif field == "data":
+            data.append(value)
+    if data:
+        yield event, "\n".join(data)
+
+
+def format_event(data: Any, event: Optional[str] = None) -> str:
+    """Encode one server-sent event; non-string data is sent as JSON."""
+    payload = data if isinstance(data, str) else json.dumps(data, ensure_ascii=False)
+    lines = [f"event: {event}"] if event else []
+    lines.extend(f"data: {line}" for line in payload.split("\n"))
+    return "\n".join(lines) + "\n\n"
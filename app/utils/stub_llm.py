@@ -0,0 +1,145 @@
+"""Deterministic stand-in for the LLM API, for offline development and load tests.
+
+StubLLMClient is used in-process with LLM_BACKEND=stub. The same model can be
+served over HTTP with the IBM deployment routes, so the real IBMClient,
+connection pool and resilience layer can be exercised against it:
+
+    python -m app.utils.stub_llm --port 8090 [--latency-ms 300] [--error-rate 0.05]
+    IBM_API_URL=http://127.0.0.1:8090 IBM_API_KEY=stub uvicorn app.main:app
+
+Replies depend only on the prompt. Latency and injected failures come from a
+seeded RNG, so a load test replays the same sequence of delays and errors.
+"""
+from typing import AsyncIterator, List
+import os
+import random
+import asyncio
+import hashlib
+import argparse
+from aiohttp import web
+
+from app.utils.ibm_client import IBM_STREAM_PATH
+from app.utils.llm_client import LLMHTTPError
+from app.utils.sse import format_event
+
+LLM_STUB_LATENCY_MS = float(os.getenv("LLM_STUB_LATENCY_MS", "300"))  # time to first token
+LLM_STUB_JITTER_MS = float(os.getenv("LLM_STUB_JITTER_MS", "100"))
+LLM_STUB_TOKEN_MS = float(os.getenv("LLM_STUB_TOKEN_MS", "15"))  # per streamed token
+LLM_STUB_ERROR_RATE = float(os.getenv("LLM_STUB_ERROR_RATE", "0"))
+LLM_STUB_ERROR_STATUS = int(os.getenv("LLM_STUB_ERROR_STATUS", "503"))
+LLM_STUB_SEED = int(os.getenv("LLM_STUB_SEED", "0"))
+
+_WORDS = (
+    "ALS care team support breathing nutrition mobility speech equipment plan "
+    "family caregiver clinic therapy comfort energy routine question symptoms "
+    "daily help together rest progress options neurologist appointment"
+).split()
+
+
+class StubLLMClient:
+    """Fake model with the IBMClient interface: fixed replies, simulated latency and errors."""
+
+    def __init__(self,
+                 latency_ms: float = LLM_STUB_LATENCY_MS,
+                 jitter_ms: float = LLM_STUB_JITTER_MS,
+                 token_ms: float = LLM_STUB_TOKEN_MS,
+                 error_rate: float = LLM_STUB_ERROR_RATE,
+                 error_status: int = LLM_STUB_ERROR_STATUS,
+                 seed: int = LLM_STUB_SEED):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.token_ms = token_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._rng = random.Random(seed)
+        self.model = "stub"
+        self.parameters = {}
+
+    def reset(self, seed: int = LLM_STUB_SEED):
+        """Restart the latency / failure sequence, e.g. between benchmark runs."""
+        self._rng.seed(seed)
+
+    def reply_tokens(self, prompt: str, max_tokens: int = 512) -> List[str]:
+        """The reply for a prompt, as streamed tokens; the same prompt always gets the same reply."""
+        digest = hashlib.sha256(prompt.encode("utf-8")).digest()
+        count = min(max_tokens, 12 + digest[0] % 36)
+        words = [_WORDS[digest[i % len(digest)] % len(_WORDS)] for i in range(count)]
+        words[0] = words[0].capitalize()
+        return [words[0]] + [f" {word}" for word in words[1:]] + ["."]
+
+    async def generate(self, prompt: str, max_tokens: int = 512) -> str:
+        await self._simulate_request()
+        return "".join(self.reply_tokens(prompt, max_tokens))
+
+    async def generate_stream(self, prompt: str, max_tokens: int = 512) -> AsyncIterator[str]:
+        await self._simulate_request()
+        for i, token in enumerate(self.reply_tokens(prompt, max_tokens)):
+            if i and self.token_ms:
+                await asyncio.sleep(self.token_ms / 1000)
+            yield token
+
+    async def _simulate_request(self):
+        delay = max(0.0, self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms))
+        failed = self._rng.random() < self.error_rate
+        await asyncio.sleep(delay / 1000)
+        if failed:
+            raise LLMHTTPError(self.error_status, "Injected stub failure")
+
+
+def create_app(stub: StubLLMClient) -> web.Application:
+    """aiohttp app serving the IBM deployment routes used by IBMClient."""
+    base = "/v1/projects/{project}/deployments/{model}"
+
+    def read_input(body):
+        params = body["input"].get("parameters", {})
+        return body["input"]["prompt"], params.get("max_new_tokens", 512)
+
+    async def predictions(request):
+        prompt, max_tokens = read_input(await request.json())
+        try:
+            text = await stub.generate(prompt, max_tokens)
+        except LLMHTTPError as e:
+            return web.json_response({"error": e.detail}, status=e.status)
+        return web.json_response({"results": [{"generated_text": text}]})
+
+    async def generation_stream(request):
+        prompt, max_tokens = read_input(await request.json())
+        tokens = stub.generate_stream(prompt, max_tokens)
+        try:
+            first = await tokens.__anext__()
+        except LLMHTTPError as e:
+            return web.json_response({"error": e.detail}, status=e.status)
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        await response.write(format_event({"results": [{"generated_text": first}]}).encode("utf-8"))
+        async for token in tokens:
+            await response.write(format_event({"results": [{"generated_text": token}]}).encode("utf-8"))
+        await response.write(format_event("[DONE]").encode("utf-8"))
+        return response
+
+    app = web.Application()
+    app.router.add_post(f"{base}/predictions", predictions)
+    app.router.add_post(f"{base}/{IBM_STREAM_PATH}", generation_stream)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the deterministic stub LLM over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency-ms", type=float, default=LLM_STUB_LATENCY_MS)
+    parser.add_argument("--jitter-ms", type=float, default=LLM_STUB_JITTER_MS)
+    parser.add_argument("--token-ms", type=float, default=LLM_STUB_TOKEN_MS)
+    parser.add_argument("--error-rate", type=float, default=LLM_STUB_ERROR_RATE)
+    parser.add_argument("--error-status", type=int, default=LLM_STUB_ERROR_STATUS)
+    parser.add_argument("--seed", type=int, default=LLM_STUB_SEED)
+    args = parser.parse_args()
+
+    stub = StubLLMClient(args.latency_ms, args.jitter_ms, args.token_ms,
+                         args.error_rate, args.error_status, args.seed)
+    web.run_app(create_app(stub), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Latency, throughput and agreement of inference backends versus fp32 PyTorch.
+
+    python -m benchmarks.bench_backends [--task classification|embedding|all]
+                                        [--backends torch int8 onnx onnx_int8] [--texts file.txt]
+
+ONNX backends need exported artifacts (python -m app.utils.inference_backends export);
+backends that fail to load are reported and skipped. Agreement is always measured
+against the fp32 torch backend (loaded even if not in --backends); without it,
+agreement is not reported.
+"""
+import time
+import argparse
+import numpy as np
+
+from app.utils.inference_backends import (
+    BACKENDS, EMBEDDING_MODEL, EMOTION_MODEL, load_text_classifier, load_text_embedder
+)
+from app.utils.metrics import percentiles
+
+SAMPLE_TEXTS = [
+    "I was diagnosed with ALS last month and I am scared about what comes next.",
+    "The BiPAP machine helps me sleep through the night now.",
+    "My husband is struggling to swallow; should we talk about a PEG tube?",
+    "Thank you, the speech therapist's tips really helped today!",
+    "What does riluzole do and are there side effects?",
+    "I feel lonely since I stopped going to work.",
+    "We found a great support group for caregivers in our town.",
+    "How do I apply for a power wheelchair through insurance?",
+]
+
+
+def timed(fn, texts, batch_size, repeat):
+    """Per-call latency (ms) for single texts, then throughput (texts/s) in batches."""
+    latencies = []
+    for _ in range(repeat):
+        for text in texts:
+            started = time.perf_counter()
+            fn([text], 1)
+            latencies.append((time.perf_counter() - started) * 1000)
+    batch = (texts * (batch_size // len(texts) + 1))[:batch_size]
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn(batch, batch_size)
+    throughput = batch_size * repeat / (time.perf_counter() - started)
+    return percentiles(latencies), throughput
+
+
+def load_reference(loader, model_name):
+    """The fp32 torch model every backend is compared against, or None if it cannot be loaded."""
+    try:
+        return loader(model_name, "torch")
+    except Exception as e:
+        print(f"{'torch':>10}: reference unavailable ({e}); agreement not reported")
+        return None
+
+
+def bench_classification(backends, texts, batch_size, repeat):
+    reference = load_reference(load_text_classifier, EMOTION_MODEL)
+    baseline = None
+    if reference is not None:
+        baseline = [r["label"] for r in reference(texts, batch_size=len(texts), truncation=True)]
+    for backend in backends:
+        try:
+            classifier = reference if backend == "torch" and reference is not None \
+                else load_text_classifier(EMOTION_MODEL, backend)
+        except Exception as e:
+            print(f"{backend:>10}: unavailable ({e})")
+            continue
+        run = lambda batch, size: classifier(batch, batch_size=size, truncation=True)
+        run(texts, len(texts))  # warm up
+        labels = [r["label"] for r in run(texts, len(texts))]
+        latency, throughput = timed(run, texts, batch_size, repeat)
+        agreement = ""
+        if baseline is not None:
+            agreement = f"  label_agreement={np.mean([a == b for a, b in zip(labels, baseline)]):.3f}"
+        print(f"{backend:>10}: latency_ms={latency}  throughput={throughput:.1f}/s{agreement}")
+
+
+def bench_embedding(backends, texts, batch_size, repeat):
+    reference = load_reference(load_text_embedder, EMBEDDING_MODEL)
+    baseline = None
+    if reference is not None:
+        baseline = np.asarray(reference.encode(texts, batch_size=len(texts), show_progress_bar=False),
+                              dtype="float32")
+    for backend in backends:
+        try:
+            embedder = reference if backend == "torch" and reference is not None \
+                else load_text_embedder(EMBEDDING_MODEL, backend)
+        except Exception as e:
+            print(f"{backend:>10}: unavailable ({e})")
+            continue
+        run = lambda batch, size: embedder.encode(batch, batch_size=size, show_progress_bar=False)
+        run(texts, len(texts))  # warm up
+        vectors = np.asarray(run(texts, len(texts)), dtype="float32")
+        latency, throughput = timed(run, texts, batch_size, repeat)
+        agreement = ""
+        if baseline is not None:
+            cosine = np.sum(vectors * baseline, axis=1) / (
+                np.linalg.norm(vectors, axis=1) * np.linalg.norm(baseline, axis=1))
+            # Do nearest neighbours among the sample texts stay the same?
+            same_neighbour = np.mean(np.argsort(-(vectors @ vectors.T), axis=1)[:, 1] ==
+                                     np.argsort(-(baseline @ baseline.T), axis=1)[:, 1])
+            agreement = (f"  cosine_mean={cosine.mean():.4f} cosine_min={cosine.min():.4f}  "
+                         f"neighbour_agreement={same_neighbour:.3f}")
+        print(f"{backend:>10}: latency_ms={latency}  throughput={throughput:.1f}/s{agreement}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--task", choices=("classification", "embedding", "all"), default="all")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS),
+                        help="agreement is always measured against torch")
+    parser.add_argument("--texts", help="one text per line (default: built-in samples)")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    texts = SAMPLE_TEXTS
+    if args.texts:
+        with open(args.texts, "r", encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+
+    if args.task in ("classification", "all"):
+        print(f"classification: {EMOTION_MODEL}")
+        bench_classification(args.backends, texts, args.batch_size, args.repeat)
+    if args.task in ("embedding", "all"):
+        print(f"embedding: {EMBEDDING_MODEL}")
+        bench_embedding(args.backends, texts, args.batch_size, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Chunker throughput and chunk-size distribution on large markdown files.
+
+    python -m benchmarks.bench_chunker [file.md ...] [--tokenizer] [--repeat 3]
+
+Without files, a synthetic English/Chinese markdown document is generated.
+"""
+import argparse
+import random
+import time
+
+from app.embedding.chunker import Chunker, approximate_token_count, tokenizer_token_count
+from app.utils.metrics import percentiles
+
+
+def legacy_split_text(text: str, chunk_size: int = 500, overlap: int = 50):
+    """The original IndexBuilder.split_text, kept for comparison."""
+    chunks, current_chunk = [], ""
+    sentences = text.replace("\n", " ").split("。")
+    for sentence in sentences:
+        if len(current_chunk) + len(sentence) < chunk_size:
+            current_chunk += sentence + "。"
+        else:
+            chunks.append(current_chunk)
+            current_chunk = current_chunk[-overlap:] + sentence + "。"
+    if current_chunk:
+        chunks.append(current_chunk)
+    return chunks
+
+
+def synthetic_markdown(sections: int) -> str:
+    rng = random.Random(0)
+    words = ("ALS patients often use BiPAP at night while a PEG tube supports nutrition "
+             "and caregivers coordinate speech therapy and mobility aids").split()
+    parts = []
+    for s in range(sections):
+        parts.append(f"## Section {s}\n")
+        for _ in range(rng.randint(3, 8)):
+            sentence_count = rng.randint(2, 6)
+            en = " ".join(" ".join(rng.choices(words, k=rng.randint(8, 25))).capitalize() + "."
+                          for _ in range(sentence_count))
+            parts.append(en + " 患者需要呼吸支持。家属需要心理支持。\n")
+    return "\n".join(parts)
+
+
+def run(name, split, text, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        chunks = split(text)
+    elapsed = time.perf_counter() - started
+    return name, chunks, elapsed / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("files", nargs="*")
+    parser.add_argument("--sections", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--tokenizer", action="store_true", help="count tokens with the MiniLM tokenizer")
+    args = parser.parse_args()
+
+    if args.files:
+        text = "\n\n".join(open(path, "r", encoding="utf-8").read() for path in args.files)
+    else:
+        text = synthetic_markdown(args.sections)
+    counter = tokenizer_token_count() if args.tokenizer else approximate_token_count
+    chunker = Chunker(token_counter=counter)
+    print(f"input: {len(text) / 1e6:.2f} MB")
+
+    for name, chunks, seconds in (run("chunker", chunker.chunk, text, args.repeat),
+                                  run("legacy split_text", legacy_split_text, text, args.repeat)):
+        lengths = [counter(c) for c in chunks]
+        over = sum(1 for n in lengths if n > chunker.max_tokens)
+        print(f"{name:>18}: {seconds * 1000:8.1f} ms  {len(chunks) / seconds:10.0f} chunks/s  "
+              f"{len(text) / seconds / 1e6:6.1f} MB/s  chunks={len(chunks)}  "
+              f"tokens min={min(lengths, default=0)} {percentiles(lengths)} max={max(lengths, default=0)}  "
+              f"over_limit={over}")
+
+
+if __name__ == "__main__":
+    main()
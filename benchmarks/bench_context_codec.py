@@ -0,0 +1,109 @@
+"""Encode/decode time and stored bytes per session for the context codecs.
+
+    python -m benchmarks.bench_context_codec [--sessions 200] [--messages 20]
+                                             [--compress-threshold 256]
+
+Sessions are synthetic 20-message histories with short user turns and longer
+assistant replies. "blob" is the old layout (one json.dumps of the whole
+context); the others encode each message as ContextMemory stores it.
+Codecs whose package is not installed are reported and skipped.
+"""
+import time
+import json
+import random
+import argparse
+from datetime import datetime, timedelta
+
+from app.utils.context_codec import CONTEXT_CODECS, ContextCodec
+from app.utils.metrics import percentiles
+
+USER_TURNS = [
+    "I was diagnosed with ALS last month and I am scared about what comes next.",
+    "My husband is struggling to swallow; should we talk about a PEG tube?",
+    "How do I apply for a power wheelchair through insurance?",
+    "What does riluzole do and are there side effects?",
+    "I feel lonely since I stopped going to work.",
+]
+ASSISTANT_SENTENCES = [
+    "It is completely understandable to feel that way after such a big change.",
+    "Many people find it helpful to write down questions before their next clinic visit.",
+    "Your ALS care team, including a speech-language pathologist, can assess swallowing safely.",
+    "A feeding tube is usually discussed early, while breathing is still strong.",
+    "Occupational therapists can recommend equipment and help with insurance paperwork.",
+    "Support groups for patients and caregivers are available online and in person.",
+    "Would you like me to share some resources about this?",
+]
+
+
+def make_session(rng: random.Random, messages: int):
+    started = datetime(2026, 1, 1) + timedelta(seconds=rng.randrange(10 ** 7))
+    history = []
+    for i in range(messages):
+        if i % 2 == 0:
+            role, content = "user", rng.choice(USER_TURNS)
+        else:
+            role, content = "assistant", " ".join(rng.sample(ASSISTANT_SENTENCES, rng.randint(3, 6)))
+        timestamp = (started + timedelta(seconds=30 * i, microseconds=rng.randrange(10 ** 6))).isoformat()
+        history.append({"role": role, "content": content, "timestamp": timestamp})
+    return history
+
+
+def bench_blob(sessions):
+    encode_us, decode_us, sizes = [], [], []
+    for history in sessions:
+        context = {"session_id": "bench", "messages": history, "turn_count": len(history) // 2}
+        started = time.perf_counter()
+        blob = json.dumps(context)
+        encode_us.append((time.perf_counter() - started) * 1e6)
+        started = time.perf_counter()
+        json.loads(blob)
+        decode_us.append((time.perf_counter() - started) * 1e6)
+        sizes.append(len(blob.encode("utf-8")))
+    return encode_us, decode_us, sizes
+
+
+def bench_codec(codec, sessions):
+    encode_us, decode_us, sizes = [], [], []
+    for history in sessions:
+        started = time.perf_counter()
+        values = [codec.encode(message) for message in history]
+        encode_us.append((time.perf_counter() - started) * 1e6)
+        started = time.perf_counter()
+        decoded = [codec.decode(value) for value in values]
+        decode_us.append((time.perf_counter() - started) * 1e6)
+        sizes.append(sum(len(value) for value in values))
+        assert decoded == history, f"{codec.name} did not round-trip"
+    return encode_us, decode_us, sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--compress-threshold", type=int, default=256)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    sessions = [make_session(rng, args.messages) for _ in range(args.sessions)]
+
+    runs = [("blob", None)]
+    for name in CONTEXT_CODECS:
+        runs.append((name, 0))
+        runs.append((f"{name}+zstd", args.compress_threshold))
+
+    for label, threshold in runs:
+        if threshold is None:
+            encode_us, decode_us, sizes = bench_blob(sessions)
+        else:
+            try:
+                codec = ContextCodec(label.split("+")[0], compress_threshold=threshold)
+            except ImportError as e:
+                print(f"{label:>14}: unavailable ({e})")
+                continue
+            encode_us, decode_us, sizes = bench_codec(codec, sessions)
+        print(f"{label:>14}: bytes/session={sum(sizes) / len(sizes):8.0f}  "
+              f"encode_us={percentiles(encode_us, (50, 95))}  decode_us={percentiles(decode_us, (50, 95))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Offline load test of the conversation context stores.
+
+    python -m benchmarks.bench_context_store [--backend memory|sqlite|redis] [--fallback none|memory|sqlite]
+                                             [--sessions 200] [--turns 10] [--concurrency 50]
+                                             [--redis-url redis://localhost:6379]
+
+Runs the chat engine's per-turn pattern (load the session, append a turn,
+change a field, flush) for many concurrent sessions through ContextMemory,
+and reports the per-turn latency and throughput. The SQLite store is created
+in a temporary directory. Every session is checked afterwards to hold its
+last CONTEXT_MAX_MESSAGES messages and every turn.
+"""
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+
+from app.core.context_backends import CONTEXT_MAX_MESSAGES, create_backend
+from app.core.context_memory import ContextMemory
+from app.utils.context_codec import ContextCodec
+from app.utils.metrics import percentiles
+
+
+async def run_session(session_id, turns, gate, latencies):
+    for turn in range(turns):
+        async with gate:
+            started = time.perf_counter()
+            session = await ContextMemory.load(session_id)
+            session.append_turn(f"Question {turn} about managing fatigue", f"Answer {turn} with some suggestions.")
+            session.set("stage", turn)
+            await session.flush()
+            latencies.append((time.perf_counter() - started) * 1000)
+
+
+async def bench(args):
+    with tempfile.TemporaryDirectory() as directory:
+        backend = create_backend(args.backend, args.fallback, args.redis_url, ContextCodec(),
+                                 sqlite_path=os.path.join(directory, "context.db"))
+        ContextMemory.initialize(backend=backend)
+        session_ids = [f"bench-{i}" for i in range(args.sessions)]
+        gate = asyncio.Semaphore(args.concurrency)
+        latencies = []
+        try:
+            for session_id in session_ids:
+                await ContextMemory.clear_context(session_id)
+            started = time.perf_counter()
+            await asyncio.gather(*(run_session(sid, args.turns, gate, latencies) for sid in session_ids))
+            elapsed = time.perf_counter() - started
+
+            incomplete = 0
+            for session_id in session_ids:
+                context = await ContextMemory.get_context(session_id)
+                if (context["turn_count"] != args.turns
+                        or len(context["messages"]) != min(2 * args.turns, CONTEXT_MAX_MESSAGES)):
+                    incomplete += 1
+                await ContextMemory.clear_context(session_id)
+        finally:
+            await ContextMemory.cleanup()
+
+    print(f"{backend.name:>14}: turns={len(latencies)}  turn_ms={percentiles(latencies)}  "
+          f"throughput={len(latencies) / elapsed:.0f}/s  incomplete_sessions={incomplete}")
+    print(f"{'':>14}  {ContextMemory.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--backend", default="memory", choices=("memory", "sqlite", "redis"))
+    parser.add_argument("--fallback", default="none", choices=("none", "memory", "sqlite"))
+    parser.add_argument("--redis-url", default="redis://localhost:6379")
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=50)
+    asyncio.run(bench(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Offline load test of the LLM client path against the stub model server.
+
+    python -m benchmarks.bench_llm_client [--requests 500] [--concurrency 50]
+                                          [--latency-ms 300] [--error-rate 0.05]
+                                          [--hedge-percentile 95] [--stream]
+
+Starts the stub server in-process on a local port, then sends the same request
+load through the plain IBMClient and through ResilientLLMClient, over the shared
+HTTP pool. Reports success rate, end-to-end latency and the resilience counters.
+"""
+import time
+import asyncio
+import argparse
+from aiohttp import web
+
+from app.utils.http_client import HTTPClientPool
+from app.utils.ibm_client import IBMClient
+from app.utils.llm_client import CircuitBreaker, ResilientLLMClient
+from app.utils.metrics import percentiles
+from app.utils.stub_llm import StubLLMClient, create_app
+
+
+async def run_load(client, prompts, concurrency, stream):
+    gate = asyncio.Semaphore(concurrency)
+    latencies, errors = [], {}
+
+    async def one(prompt):
+        async with gate:
+            started = time.perf_counter()
+            try:
+                if stream:
+                    async for _ in client.generate_stream(prompt=prompt):
+                        pass
+                else:
+                    await client.generate(prompt=prompt)
+                latencies.append((time.perf_counter() - started) * 1000)
+            except Exception as e:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(p) for p in prompts))
+    elapsed = time.perf_counter() - started
+    return latencies, errors, elapsed
+
+
+async def bench(args):
+    stub = StubLLMClient(args.latency_ms, args.jitter_ms, args.token_ms, args.error_rate, seed=args.seed)
+    runner = web.AppRunner(create_app(stub))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", args.port)
+    await site.start()
+    await HTTPClientPool.initialize()
+
+    prompts = [f"User question {i}: how can I manage fatigue this week?" for i in range(args.requests)]
+    ibm = IBMClient(api_key="stub", base_url=f"http://127.0.0.1:{args.port}", project_id="bench", model="stub")
+    clients = {
+        "plain": ibm,
+        "resilient": ResilientLLMClient(
+            ibm,
+            deadline=args.deadline,
+            max_retries=args.retries,
+            hedge_percentile=args.hedge_percentile,
+            max_concurrency=args.max_concurrency,
+            breaker=CircuitBreaker(),
+            name="bench_llm_client"
+        ),
+    }
+    try:
+        for name, client in clients.items():
+            stub.reset(args.seed)  # same latency/error sequence for both runs
+            latencies, errors, elapsed = await run_load(client, prompts, args.concurrency, args.stream)
+            print(f"{name:>10}: ok={len(latencies)}/{len(prompts)}  latency_ms={percentiles(latencies)}  "
+                  f"throughput={len(prompts) / elapsed:.1f}/s  errors={errors}")
+            if isinstance(client, ResilientLLMClient):
+                print(f"{'':>10}  {client.stats()}")
+    finally:
+        await HTTPClientPool.shutdown()
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--stream", action="store_true", help="use generate_stream instead of generate")
+    parser.add_argument("--port", type=int, default=8091)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--jitter-ms", type=float, default=100)
+    parser.add_argument("--token-ms", type=float, default=5)
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--deadline", type=float, default=10)
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument("--hedge-percentile", type=int, default=0)
+    parser.add_argument("--max-concurrency", type=int, default=16)
+    asyncio.run(bench(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Latency and quality of dense, keyword, hybrid and auto retrieval.
+
+    python -m benchmarks.bench_retrieval [--index PATH] [--metadata PATH] [--queries labels.jsonl]
+
+Quality is measured on known-item queries generated from the corpus: a
+"lexical" query is the two rarest terms of a chunk, a "sentence" query is
+the chunk's first sentence; the chunk itself is the relevant result. A
+labelled file (one {"query": ..., "relevant_ids": [...]} per line, ids as
+in the metadata "id" field) can be given instead.
+"""
+import re
+import json
+import time
+import random
+import asyncio
+import argparse
+
+from app.embedding.bm25_index import tokenize
+from app.embedding.retriever import SemanticRetriever, SEARCH_MODES
+from app.utils.metrics import percentiles
+
+
+def generated_queries(retriever: SemanticRetriever, count: int, seed: int = 0):
+    rng = random.Random(seed)
+    snapshot = retriever.snapshot
+    bm25 = snapshot.bm25
+    queries, seen = [], set()
+    for idx in rng.sample(range(len(snapshot)), min(count, len(snapshot))):
+        document = snapshot.document(idx)
+        terms = sorted(set(tokenize(document["content"])), key=bm25.idf, reverse=True)
+        sentence = re.split(r"(?<=[.!?。！？])\s*", document["content"].strip())[0]
+        candidates = [("lexical", " ".join(terms[:2]) if len(terms) >= 2 else ""),
+                      ("sentence", sentence if len(tokenize(sentence)) >= 4 else "")]
+        for kind, query in candidates:
+            # Repeated queries would be answered from the result cache
+            if query and query not in seen:
+                seen.add(query)
+                queries.append((kind, query, {document["id"]}))
+    return queries
+
+
+def labelled_queries(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        return [("labelled", item["query"], set(item["relevant_ids"])) for item in map(json.loads, f) if item]
+
+
+async def evaluate(retriever: SemanticRetriever, queries, mode: str, top_k: int):
+    retriever.result_cache.clear()
+    retriever.embedding_cache.clear()
+    by_kind = {}
+    for kind, query, relevant in queries:
+        started = time.perf_counter()
+        results = await retriever.search(query, top_k=top_k, mode=mode)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        ranks = [r["rank"] for r in results if r["metadata"].get("id") in relevant]
+        stats = by_kind.setdefault(kind, {"latency_ms": [], "hits": 0, "rr": 0.0, "n": 0})
+        stats["latency_ms"].append(elapsed_ms)
+        stats["n"] += 1
+        if ranks:
+            stats["hits"] += 1
+            stats["rr"] += 1 / min(ranks)
+    return by_kind
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--index", default="embedding/faiss_index/qol_vector.index")
+    parser.add_argument("--metadata", default="embedding/faiss_index/metadata.docs")
+    parser.add_argument("--queries", help="labelled queries (jsonl)")
+    parser.add_argument("--count", type=int, default=200, help="chunks to generate queries from")
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    retriever = SemanticRetriever(args.index, args.metadata)
+    if retriever.snapshot.bm25 is None:
+        raise SystemExit("The index has no keyword index; rebuild it with IndexBuilder first.")
+    queries = labelled_queries(args.queries) if args.queries else generated_queries(retriever, args.count)
+    print(f"{len(queries)} queries over {len(retriever.snapshot)} chunks")
+
+    async def run_all():
+        # Warm up the encoder and page cache before timing
+        await retriever.search("warm up", top_k=args.top_k, mode="hybrid")
+        for mode in SEARCH_MODES:
+            for kind, stats in (await evaluate(retriever, queries, mode, args.top_k)).items():
+                print(f"{mode:>8} {kind:>9}: recall@{args.top_k}={stats['hits'] / stats['n']:.3f}  "
+                      f"MRR={stats['rr'] / stats['n']:.3f}  latency_ms={percentiles(stats['latency_ms'])}")
+
+    asyncio.run(run_all())
+    retriever.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import os
+import sys
+import asyncio
+import hashlib
+
+import faiss
+import numpy as np
+import pytest
+
+# Let `pytest` run from anywhere, like `python -m pytest` from the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.embedding.bm25_index import BM25Index, bm25_path
+from app.embedding.doc_store import DocStore
+
+DIMENSION = 8
+
+
+class HashEmbedder:
+    """Deterministic stand-in for the sentence embedder: one fixed vector per text."""
+
+    def __init__(self):
+        self.encoded = 0
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return DIMENSION
+
+    def encode(self, texts, **kwargs) -> np.ndarray:
+        self.encoded += len(texts)
+        return np.stack([
+            np.frombuffer(hashlib.sha256(text.encode("utf-8")).digest()[:DIMENSION], dtype="uint8")
+            for text in texts
+        ]).astype("float32")
+
+
+@pytest.fixture
+def hash_embedder(monkeypatch):
+    """Replace model loading in the retriever with HashEmbedder."""
+    from app.embedding import retriever
+
+    embedder = HashEmbedder()
+    monkeypatch.setattr(retriever, "load_text_embedder", lambda *args, **kwargs: embedder)
+    return embedder
+
+
+def make_docs(prefix, count, **fields):
+    return [{"id": f"{prefix}{i}", "content": f"{prefix} document {i} about breathing support",
+             "source": "test", "chunk_index": i, **fields} for i in range(count)]
+
+
+def write_index(directory, documents, bm25=False):
+    """Save a flat index and document store for ``documents`` (and the keyword
+    index with ``bm25``), as IndexBuilder does."""
+    index_path, metadata_path = str(directory / "qol.index"), str(directory / "qol.docs")
+    index = faiss.IndexFlatL2(DIMENSION)
+    index.add(HashEmbedder().encode([doc["content"] for doc in documents]))
+    faiss.write_index(index, index_path)
+    DocStore.write(metadata_path, documents)
+    if bm25:
+        BM25Index.build(doc["content"] for doc in documents).save(bm25_path(index_path))
+    return index_path, metadata_path
+
+
+@pytest.fixture
+def index_files(tmp_path):
+    """A small saved main index and document store."""
+    return write_index(tmp_path, make_docs("base", 5))
+
+
+async def shutdown(retriever):
+    """Stop the retriever's compactor and query batcher before the test loop closes."""
+    retriever.close()
+    tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
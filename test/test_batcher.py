@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+from app.utils.batcher import MicroBatcher
+
+
+class Recorder:
+    """batch_fn that records each batch it is given."""
+
+    def __init__(self, fail_on=None):
+        self.batches = []
+        self.fail_on = fail_on
+
+    def __call__(self, items):
+        self.batches.append(list(items))
+        if self.fail_on in items:
+            raise ValueError(f"cannot classify {self.fail_on!r}")
+        return [item.upper() for item in items]
+
+
+async def stop(batcher):
+    batcher._worker.cancel()
+    await asyncio.gather(batcher._worker, return_exceptions=True)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_items_share_one_batch():
+    recorder = Recorder()
+    batcher = MicroBatcher(recorder, max_batch_size=16, max_wait_ms=20, name="test_batcher")
+    try:
+        results = await asyncio.gather(*(batcher.submit(f"text {i}") for i in range(5)))
+        assert results == [f"TEXT {i}" for i in range(5)]
+        assert recorder.batches == [[f"text {i}" for i in range(5)]]
+        assert batcher.stats()["batches"] == 1
+    finally:
+        await stop(batcher)
+
+
+@pytest.mark.asyncio
+async def test_batches_are_capped_at_max_batch_size():
+    recorder = Recorder()
+    batcher = MicroBatcher(recorder, max_batch_size=4, max_wait_ms=20, name="test_batcher")
+    try:
+        results = await asyncio.gather(*(batcher.submit(str(i)) for i in range(10)))
+        assert results == [str(i) for i in range(10)]
+        assert sorted(len(batch) for batch in recorder.batches) == [2, 4, 4]
+        assert sorted(item for batch in recorder.batches for item in batch) == sorted(str(i) for i in range(10))
+    finally:
+        await stop(batcher)
+
+
+@pytest.mark.asyncio
+async def test_errors_reach_every_caller_in_the_batch():
+    batcher = MicroBatcher(Recorder(fail_on="bad"), max_batch_size=8, max_wait_ms=20, name="test_batcher")
+    try:
+        results = await asyncio.gather(batcher.submit("good"), batcher.submit("bad"), return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+        # The batcher keeps serving later items
+        assert await batcher.submit("next") == "NEXT"
+    finally:
+        await stop(batcher)
+
+
+@pytest.mark.asyncio
+async def test_cancelled_callers_are_dropped_from_the_batch():
+    recorder = Recorder()
+    batcher = MicroBatcher(recorder, max_batch_size=8, max_wait_ms=50, name="test_batcher")
+    try:
+        abandoned = asyncio.ensure_future(batcher.submit("abandoned"))
+        kept = asyncio.ensure_future(batcher.submit("kept"))
+        await asyncio.sleep(0)
+        abandoned.cancel()
+        assert await kept == "KEPT"
+        assert recorder.batches == [["kept"]]
+    finally:
+        await stop(batcher)
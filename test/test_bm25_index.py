@@ -0,0 +1,65 @@
+import numpy as np
+
+from app.embedding.bm25_index import BM25Index, tokenize
+
+TEXTS = [
+    "Riluzole slows ALS progression.",
+    "BiPAP helps breathing at night; set up the bi-pap before sleep.",
+    "Breathing exercises and breathing support.",
+    "Sleep routine and fatigue.",
+    "呼吸训练帮助渐冻症患者。",
+]
+
+
+def test_tokenize_keeps_compound_terms_and_splits_cjk_into_bigrams():
+    assert tokenize("BiPAP, bi-pap and C9orf72 (v1.2).") == ["bipap", "bi-pap", "and", "c9orf72", "v1.2"]
+    assert tokenize("渐冻症 患") == ["渐冻", "冻症", "患"]
+    assert tokenize("  ...  ") == []
+
+
+def test_search_ranks_by_bm25_over_matching_documents_only():
+    index = BM25Index.build(TEXTS)
+    scores, ids = index.search("breathing support", top_k=10)
+    # Only documents sharing a term are scored; repeated terms rank higher
+    assert ids.tolist() == [2, 1] and scores[0] > scores[1] > 0
+    assert index.search("breathing", top_k=1)[1].tolist() == [2]
+    assert index.search("渐冻症", top_k=10)[1].tolist() == [4]
+    assert len(index.search("gastrostomy", top_k=10)[1]) == 0
+    # Rare terms weigh more than common ones
+    assert index.idf("riluzole") > index.idf("breathing")
+
+
+def test_allowed_ids_restrict_candidates():
+    index = BM25Index.build(TEXTS)
+    assert index.search("breathing sleep", top_k=10, allowed_ids=np.asarray([1, 3]))[1].tolist() == [1, 3]
+    assert len(index.search("breathing", top_k=10, allowed_ids=np.asarray([0, 4]))[1]) == 0
+
+
+def test_outside_texts_score_like_indexed_ones():
+    index = BM25Index.build(TEXTS)
+    scores, ids = index.search("breathing support", top_k=10)
+    outside_scores, outside_ids = index.score_texts("breathing support", [TEXTS[3], TEXTS[1], TEXTS[2]], top_k=10)
+    assert outside_ids.tolist() == [2, 1]
+    np.testing.assert_allclose(outside_scores, scores, rtol=1e-5)
+
+
+def test_save_and_load(tmp_path):
+    index = BM25Index.build(TEXTS)
+    path = str(tmp_path / "qol.bm25.npz")
+    index.save(path)
+    loaded = BM25Index.load(path)
+    assert len(loaded) == len(TEXTS) and loaded.vocabulary == index.vocabulary
+    for query in ("breathing support", "bipap sleep", "渐冻症"):
+        np.testing.assert_array_equal(loaded.search(query, 10)[1], index.search(query, 10)[1])
+        np.testing.assert_allclose(loaded.search(query, 10)[0], index.search(query, 10)[0])
+
+
+def test_short_queries_of_rare_known_terms_are_lexical():
+    index = BM25Index.build(TEXTS)
+    min_idf = index.idf("riluzole")
+    assert index.is_lexical("Riluzole", max_terms=3, min_idf=min_idf)
+    assert not index.is_lexical("breathing", max_terms=3, min_idf=min_idf)
+    # Unknown terms and long queries need the dense ranking
+    assert not index.is_lexical("riluzole dosage", max_terms=3, min_idf=min_idf)
+    assert not index.is_lexical("riluzole slows als progression", max_terms=3, min_idf=min_idf)
+    assert not index.is_lexical("", max_terms=3, min_idf=min_idf)
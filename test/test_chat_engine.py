@@ -0,0 +1,83 @@
+import pytest
+
+pytest.importorskip("langchain")
+pytest.importorskip("sqlalchemy")
+
+from app.core.chat_engine import FALLBACK_RESPONSE, ChatEngine
+from app.core.context_backends import MemoryContextBackend
+from app.utils.generation_cache import GenerationCache
+from test_context_memory import context_memory
+
+
+class Stub:
+    """Stage component whose methods return fixed values."""
+
+    def __init__(self, **results):
+        for name, result in results.items():
+            setattr(self, name, self._returning(result))
+
+    @staticmethod
+    def _returning(result):
+        async def method(*args, **kwargs):
+            return result
+        return method
+
+
+class BrokenPromptBuilder:
+    """Prompt builder failing in ``broken`` (a missing template, say)."""
+
+    def __init__(self, broken):
+        self.broken = broken
+
+    def _call(self, name):
+        if name == self.broken:
+            raise KeyError("supportive")
+        return "prompt"
+
+    def build(self, **kwargs):
+        return self._call("build")
+
+    def template_for(self, strategy):
+        return self._call("template_for")
+
+    def format_context(self, context):
+        return ""
+
+
+class UnusedLLMClient:
+    def generate_stream(self, prompt):
+        raise AssertionError("no prompt to send")
+
+
+class Registry:
+    def __init__(self, **components):
+        self.components = components
+
+    def get(self, name):
+        return self.components[name]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("broken", ["build", "template_for"])
+async def test_stream_falls_back_when_the_prompt_cannot_be_built(broken):
+    registry = Registry(
+        stage_estimator=Stub(estimate={"stage": 1, "stage_name": "early"}),
+        needs_analyzer=Stub(analyze=[{"type": "sleep"}]),
+        recommend_engine=Stub(generate=[]),
+        emotion_detector=Stub(detect={"emotion": "sad", "strategy": "supportive"}),
+        proactivity_engine=Stub(get_next_question=None),
+        prompt_builder=BrokenPromptBuilder(broken),
+        generation_cache=GenerationCache(mode="exact", name="test_generation_cache"),
+        llm_client=UnusedLLMClient(),
+    )
+    async with context_memory(MemoryContextBackend()) as memory:
+        engine = ChatEngine("user", "s1", registry=registry)
+        events = [event async for event in engine.stream_message("I can't sleep")]
+
+        assert events[0] == {"event": "token", "data": FALLBACK_RESPONSE}
+        assert events[-1]["event"] == "metadata"
+        assert events[-1]["data"]["response"] == FALLBACK_RESPONSE
+        assert events[-1]["data"]["degraded_stages"] == ["response"]
+        # The turn is still saved
+        messages = (await memory.get_context("s1"))["messages"]
+        assert [m["content"] for m in messages] == ["I can't sleep", FALLBACK_RESPONSE]
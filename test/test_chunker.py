@@ -0,0 +1,79 @@
+import pytest
+
+from app.embedding.chunker import Chunker, approximate_token_count
+
+
+def sentences(count, start=0):
+    return [f"Sentence number {i} is about breathing." for i in range(start, start + count)]
+
+
+def test_chunks_respect_the_token_limit_and_keep_every_sentence():
+    chunker = Chunker(max_tokens=30, overlap_tokens=8)
+    parts = sentences(20)
+    chunks = chunker.chunk(" ".join(parts))
+    assert len(chunks) > 1
+    assert all(approximate_token_count(chunk) <= 30 for chunk in chunks)
+    assert all(any(part in chunk for chunk in chunks) for part in parts)
+    assert chunks[0].startswith(parts[0]) and chunks[-1].endswith(parts[-1])
+
+
+def test_consecutive_chunks_overlap_by_trailing_sentences():
+    chunker = Chunker(max_tokens=30, overlap_tokens=8)
+    chunks = chunker.chunk(" ".join(sentences(20)))
+    for previous, current in zip(chunks, chunks[1:]):
+        carried = current.split(". ")[0] + "."
+        assert previous.endswith(carried)
+        assert approximate_token_count(carried) <= 8
+
+    no_overlap = Chunker(max_tokens=30, overlap_tokens=0).chunk(" ".join(sentences(20)))
+    assert " ".join(no_overlap) == " ".join(sentences(20))
+
+
+def test_short_and_empty_text():
+    chunker = Chunker(max_tokens=30)
+    assert chunker.chunk("One short sentence.") == ["One short sentence."]
+    assert chunker.chunk("") == []
+    assert chunker.chunk("  \n\n  ") == []
+
+
+def test_headings_start_new_sections():
+    chunker = Chunker(max_tokens=200)
+    text = "# Breathing\nUse the BiPAP at night.\n\n## Sleep\nKeep a routine. Avoid caffeine."
+    assert chunker.chunk_sections(text) == [
+        ("Breathing", "# Breathing Use the BiPAP at night."),
+        ("Sleep", "## Sleep Keep a routine. Avoid caffeine."),
+    ]
+    assert len(Chunker(max_tokens=200, markdown=False).chunk(text)) == 1
+
+
+def test_paragraphs_are_boundaries_without_punctuation():
+    chunker = Chunker(max_tokens=4, overlap_tokens=0)
+    assert chunker.chunk("first list item\n\nsecond list item") == ["first list item", "second list item"]
+    assert chunker.chunk("first list item\nsecond list item") == ["first list item second", "list item"]
+
+
+def test_chinese_sentences_split_and_join_without_spaces():
+    chunker = Chunker(max_tokens=16, overlap_tokens=0, language="zh")
+    text = "呼吸训练很重要。每天练习十分钟！坚持下去会更好。"
+    chunks = chunker.chunk(text)
+    assert chunks == ["呼吸训练很重要。每天练习十分钟！", "坚持下去会更好。"]
+    assert "".join(chunks) == text
+
+
+def test_overlong_sentences_are_split_on_words():
+    chunker = Chunker(max_tokens=10, overlap_tokens=0)
+    words = [f"word{i}" for i in range(35)]
+    chunks = chunker.chunk(" ".join(words))
+    assert all(approximate_token_count(chunk) <= 10 for chunk in chunks)
+    assert " ".join(chunks).split() == words
+
+
+def test_custom_token_counter():
+    chunker = Chunker(max_tokens=3, overlap_tokens=0, token_counter=lambda text: 1)
+    assert chunker.chunk(" ".join(sentences(7))) == [" ".join(sentences(3)), " ".join(sentences(3, 3)),
+                                                   " ".join(sentences(1, 6))]
+
+
+def test_rejects_unknown_languages():
+    with pytest.raises(ValueError):
+        Chunker(language="fr")
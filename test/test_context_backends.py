@@ -0,0 +1,259 @@
+import json
+import time
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+from app.core.context_backends import (
+    CONTEXT_MAX_MESSAGES, FLUSH_SCRIPT, MIGRATE_SCRIPT, FallbackContextBackend, MemoryContextBackend,
+    RedisContextBackend, SQLiteContextBackend, create_backend
+)
+from app.utils.context_codec import ContextCodec
+
+
+def message(role, content):
+    return {"role": role, "content": content, "timestamp": "2024-05-01T12:00:00.123456"}
+
+
+def turn(n):
+    return [message("user", f"question {n}"), message("assistant", f"answer {n}")]
+
+
+def fake_redis_backend(codec=None, client=None):
+    """A RedisContextBackend on fakeredis, which runs the Lua scripts in-process."""
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    backend = RedisContextBackend.__new__(RedisContextBackend)
+    backend.client = client or fakeredis.FakeAsyncRedis()
+    backend.codec = codec or ContextCodec()
+    backend._flush_script = backend.client.register_script(FLUSH_SCRIPT)
+    backend._migrate_script = backend.client.register_script(MIGRATE_SCRIPT)
+    backend.migrations = 0
+    return backend
+
+
+class BrokenBackend(MemoryContextBackend):
+    """A primary store that fails every call once ``down`` is set."""
+
+    name = "broken"
+
+    def __init__(self):
+        super().__init__()
+        self.down = False
+
+    async def fetch(self, session_id):
+        if self.down:
+            raise ConnectionError("store unavailable")
+        return await super().fetch(session_id)
+
+    async def flush(self, session_id, expected_version, turns, messages, fields):
+        if self.down:
+            raise ConnectionError("store unavailable")
+        return await super().flush(session_id, expected_version, turns, messages, fields)
+
+
+@asynccontextmanager
+async def open_backend(kind, directory):
+    if kind == "memory":
+        store = MemoryContextBackend()
+    elif kind == "sqlite":
+        store = SQLiteContextBackend(str(directory / "context.db"))
+    else:
+        store = fake_redis_backend()
+    try:
+        yield store
+    finally:
+        await store.close()
+
+
+every_backend = pytest.mark.parametrize("kind", ["memory", "sqlite", "redis"])
+
+
+@every_backend
+@pytest.mark.asyncio
+async def test_round_trip(kind, tmp_path):
+    async with open_backend(kind, tmp_path) as backend:
+        empty = await backend.fetch("s1")
+        assert empty["messages"] == [] and empty["turn_count"] == 0
+
+        assert await backend.flush("s1", 0, 1, turn(0), {"stage": 2}) == (True, 1)
+        context = await backend.fetch("s1")
+        assert context["messages"] == turn(0)
+        assert context["stage"] == 2
+        assert context["turn_count"] == 1 and context["version"] == 1
+
+        await backend.delete("s1")
+        assert (await backend.fetch("s1"))["messages"] == []
+
+
+@every_backend
+@pytest.mark.asyncio
+async def test_keeps_the_last_messages(kind, tmp_path):
+    async with open_backend(kind, tmp_path) as backend:
+        for n in range(CONTEXT_MAX_MESSAGES):
+            await backend.flush("s1", None, 1, turn(n), {})
+        context = await backend.fetch("s1")
+        assert len(context["messages"]) == CONTEXT_MAX_MESSAGES
+        assert context["messages"][-1]["content"] == f"answer {CONTEXT_MAX_MESSAGES - 1}"
+        assert context["turn_count"] == CONTEXT_MAX_MESSAGES
+
+
+@every_backend
+@pytest.mark.asyncio
+async def test_concurrent_flushes_lose_no_turns(kind, tmp_path):
+    async with open_backend(kind, tmp_path) as backend:
+        await asyncio.gather(*(backend.flush("s1", None, 1, [message("user", str(n))], {}) for n in range(8)))
+        context = await backend.fetch("s1")
+        assert sorted(m["content"] for m in context["messages"]) == [str(n) for n in range(8)]
+        assert context["version"] == 8 and context["turn_count"] == 8
+
+
+@pytest.mark.asyncio
+async def test_redis_converts_legacy_blobs_on_the_next_turn():
+    backend = fake_redis_backend()
+    legacy = {"session_id": "s1", "messages": turn(0), "turn_count": 1, "created_at": "2024-05-01T12:00:00"}
+    await backend.client.set("context:s1", json.dumps(legacy))
+    assert (await backend.fetch("s1"))["messages"] == turn(0)
+
+    await backend.flush("s1", None, 1, turn(1), {})
+    assert not await backend.client.exists("context:s1")
+    context = await backend.fetch("s1")
+    assert context["messages"] == turn(0) + turn(1)
+    assert context["turn_count"] == 2 and context["created_at"] == "2024-05-01T12:00:00"
+    await backend.close()
+
+
+@every_backend
+@pytest.mark.asyncio
+async def test_stale_version_keeps_messages_but_not_fields(kind, tmp_path):
+    async with open_backend(kind, tmp_path) as backend:
+        await backend.flush("s1", 0, 1, turn(0), {"stage": 1})
+        # A second turn loaded at version 0 lost the race: its messages land, its fields do not
+        assert await backend.flush("s1", 0, 1, turn(1), {"stage": 5}) == (False, 2)
+        context = await backend.fetch("s1")
+        assert context["stage"] == 1
+        assert [m["content"] for m in context["messages"]] == ["question 0", "answer 0", "question 1", "answer 1"]
+        assert context["turn_count"] == 2
+
+
+@pytest.mark.asyncio
+async def test_redis_flush_script_checks_the_version():
+    backend = fake_redis_backend()
+    await backend.flush("s1", 0, 1, turn(0), {"stage": 1, "needs": ["sleep"]})
+    assert await backend.flush("s1", 0, 1, turn(1), {"stage": 3}) == (False, 2)
+    assert await backend.flush("s1", 2, 1, turn(2), {"stage": 4}) == (True, 3)
+    context = await backend.fetch("s1")
+    assert context["stage"] == 4 and context["needs"] == ["sleep"]
+    assert len(context["messages"]) == 6 and context["turn_count"] == 3
+    await backend.close()
+
+
+@pytest.mark.asyncio
+async def test_redis_rewrites_messages_in_the_current_codec():
+    pytest.importorskip("msgpack")
+    old = fake_redis_backend(ContextCodec("json"))
+    await old.flush("s1", 0, 1, turn(0), {})
+
+    backend = fake_redis_backend(ContextCodec("msgpack"), client=old.client)
+    assert (await backend.fetch("s1"))["messages"] == turn(0)
+    assert backend.migrations == 1
+    stored = await backend.client.lrange("context:s1:messages", 0, -1)
+    assert not any(backend.codec.needs_migration(value) for value in stored)
+    await backend.close()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_sessions_expire(tmp_path):
+    backend = SQLiteContextBackend(str(tmp_path / "context.db"), ttl_seconds=0.05)
+    try:
+        await backend.flush("s1", 0, 1, turn(0), {"stage": 1})
+        time.sleep(0.1)
+        assert (await backend.fetch("s1"))["messages"] == []
+        # A write after expiry starts the session over
+        assert await backend.flush("s1", 1, 1, turn(1), {}) == (False, 1)
+        assert [m["content"] for m in (await backend.fetch("s1"))["messages"]] == ["question 1", "answer 1"]
+    finally:
+        await backend.close()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_rewrites_messages_in_the_current_codec(tmp_path):
+    pytest.importorskip("msgpack")
+    path = str(tmp_path / "context.db")
+    old = SQLiteContextBackend(path, ContextCodec("json"))
+    await old.flush("s1", 0, 1, turn(0), {})
+    await old.close()
+
+    backend = SQLiteContextBackend(path, ContextCodec("msgpack"))
+    try:
+        assert (await backend.fetch("s1"))["messages"] == turn(0)
+        assert backend.migrations == 1
+        assert (await backend.fetch("s1"))["messages"] == turn(0)
+        assert backend.migrations == 1
+    finally:
+        await backend.close()
+
+
+@pytest.mark.asyncio
+async def test_fallback_takes_over_failed_sessions():
+    primary, local = BrokenBackend(), MemoryContextBackend()
+    backend = FallbackContextBackend(primary, local)
+    backend.supports_invalidation = True  # as with a Redis primary
+
+    await backend.flush("s1", 0, 1, turn(0), {"stage": 1})
+    # Every write is mirrored to the fallback
+    assert (await local.fetch("s1"))["messages"] == turn(0)
+    assert backend.cacheable("s1")
+
+    primary.down = True
+    context = await backend.fetch("s1")
+    assert context["messages"] == turn(0) and context["stage"] == 1
+    assert not backend.cacheable("s1")
+    assert (await backend.flush("s1", 1, 1, turn(1), {"stage": 2}))[0]
+
+    # The session stays on the fallback once the primary is back
+    primary.down = False
+    context = await backend.fetch("s1")
+    assert len(context["messages"]) == 4 and context["stage"] == 2
+    assert backend.stats()["diverged_sessions"] == 1
+
+    await backend.delete("s1")
+    assert backend.cacheable("s1")
+    assert (await backend.fetch("s1"))["messages"] == []
+
+
+@pytest.mark.asyncio
+async def test_workers_sharing_the_fallback_store_follow_a_switch(tmp_path):
+    primary = BrokenBackend()  # one shared store, as with Redis
+    path = str(tmp_path / "context.db")
+    first = FallbackContextBackend(primary, SQLiteContextBackend(path))
+    second = FallbackContextBackend(primary, SQLiteContextBackend(path))
+    try:
+        await first.flush("s1", 0, 1, turn(0), {"stage": 1})
+        assert (await second.fetch("s1"))["messages"] == turn(0)
+
+        primary.down = True
+        await first.flush("s1", 1, 1, turn(1), {"stage": 2})
+        primary.down = False
+        # The other worker reads the fallback, not the primary missing that turn
+        context = await second.fetch("s1")
+        assert len(context["messages"]) == 4 and context["stage"] == 2
+        assert not second.cacheable("s1") and second.stats()["diverged_sessions"] == 1
+        await second.flush("s1", None, 1, turn(2), {})
+        assert len((await first.fetch("s1"))["messages"]) == 6
+        assert len((await primary.fetch("s1"))["messages"]) == 2
+
+        await second.delete("s1")
+        assert not await first.fallback.is_diverged("s1")
+    finally:
+        await first.close()
+        await second.fallback.close()
+
+
+def test_create_backend_rejects_a_non_local_fallback(tmp_path):
+    assert isinstance(create_backend("memory", "sqlite", sqlite_path=str(tmp_path / "c.db")), FallbackContextBackend)
+    with pytest.raises(ValueError):
+        create_backend("memory", "memory")
+    with pytest.raises(ValueError):
+        create_backend("sqlite", "redis", sqlite_path=str(tmp_path / "c.db"))
@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+from app.utils.context_codec import FLAG_ZSTD, FORMAT_JSON, FORMAT_MSGPACK, ContextCodec
+
+MESSAGE = {"role": "user", "content": "Mes mains sont faibles", "timestamp": "2024-05-01T12:00:00.123456"}
+
+
+def test_json_round_trip_and_legacy_values():
+    codec = ContextCodec("json")
+    data = codec.encode(MESSAGE)
+    assert data[0] == FORMAT_JSON
+    assert codec.decode(data) == MESSAGE
+    # Values written before the format byte existed are plain JSON
+    assert codec.decode(json.dumps(MESSAGE).encode()) == MESSAGE
+
+
+def test_msgpack_round_trip():
+    pytest.importorskip("msgpack")
+    codec = ContextCodec("msgpack")
+    assert codec.encode(MESSAGE)[0] == FORMAT_MSGPACK
+    for message in (MESSAGE, {**MESSAGE, "timestamp": "2024-05-01T12:00:00"},
+                    {**MESSAGE, "timestamp": "2024-05-01T12:00:00+02:00"}, {**MESSAGE, "stage": 2},
+                    {"role": "assistant", "content": "Bonjour"}):
+        assert codec.decode(codec.encode(message)) == message
+
+
+def test_compressed_values():
+    pytest.importorskip("zstandard")
+    codec = ContextCodec("json", compress_threshold=200)
+    long = {**MESSAGE, "content": "fatigue " * 50}
+    assert codec.encode(long)[0] == FORMAT_JSON | FLAG_ZSTD
+    assert codec.encode(MESSAGE)[0] == FORMAT_JSON
+    assert ContextCodec("json").decode(codec.encode(long)) == long
+    assert not ContextCodec("json").needs_migration(codec.encode(long))
+
+
+def test_needs_migration_compares_formats():
+    pytest.importorskip("msgpack")
+    old, new = ContextCodec("json"), ContextCodec("msgpack")
+    assert new.needs_migration(old.encode(MESSAGE))
+    assert new.needs_migration(json.dumps(MESSAGE).encode())
+    assert not new.needs_migration(new.encode(MESSAGE))
+    assert new.decode(old.encode(MESSAGE)) == old.decode(new.encode(MESSAGE)) == MESSAGE
+
+
+def test_rejects_unknown_codecs():
+    with pytest.raises(ValueError):
+        ContextCodec("pickle")
+    with pytest.raises(ValueError):
+        ContextCodec("json").decode(b"\x07{}")
@@ -0,0 +1,81 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from app.core.context_backends import MemoryContextBackend
+from app.core.context_memory import ContextMemory
+from test_context_backends import fake_redis_backend
+
+
+@asynccontextmanager
+async def context_memory(backend):
+    ContextMemory.initialize(backend=backend)
+    ContextMemory._announced.clear()
+    try:
+        yield ContextMemory
+    finally:
+        listener = ContextMemory._listener
+        await ContextMemory.cleanup()
+        if listener is not None:
+            await asyncio.gather(listener, return_exceptions=True)
+
+
+async def wait_for(condition, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "condition not reached"
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_flush_reports_a_lost_version_race():
+    async with context_memory(fake_redis_backend()) as memory:
+        first, second = await memory.load("s1"), await memory.load("s1")
+        first.append_turn("question 0", "answer 0")
+        first.set("stage", 1)
+        assert await first.flush()
+
+        second.append_turn("question 1", "answer 1")
+        second.set("stage", 4)
+        assert not await second.flush()
+        assert not second.dirty
+
+        context = await memory.get_context("s1")
+        assert context["stage"] == 1
+        assert [m["content"] for m in context["messages"]] == ["question 0", "answer 0", "question 1", "answer 1"]
+
+
+@pytest.mark.asyncio
+async def test_sessions_are_not_cached_without_invalidations():
+    async with context_memory(MemoryContextBackend()) as memory:
+        session = await memory.load("s1")
+        session.append_turn("question", "answer")
+        await session.flush()
+        reads = memory._backend_reads
+        await memory.load("s1")
+        assert memory._backend_reads == reads + 1
+
+
+@pytest.mark.asyncio
+async def test_another_workers_write_drops_the_local_copy():
+    backend = fake_redis_backend()
+    async with context_memory(backend) as memory:
+        await memory.load("s1")
+        await wait_for(lambda: memory._coherent)
+
+        session = await memory.load("s1")
+        session.append_turn("question 0", "answer 0")
+        await session.flush()
+        reads = memory._backend_reads
+        assert len((await memory.load("s1")).messages) == 2
+        assert memory._backend_reads == reads
+
+        # Another worker appends a turn; its announcement evicts this worker's copy
+        await backend.flush("s1", None, 1, [{"role": "user", "content": "question 1"}], {})
+        await wait_for(lambda: memory._local.peek("s1") is None)
+        assert len((await memory.load("s1")).messages) == 3
+        assert memory._backend_reads == reads + 1
+        assert memory.stats()["invalidations"] >= 1
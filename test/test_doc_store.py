@@ -0,0 +1,107 @@
+import json
+import pickle
+import struct
+
+import pytest
+
+from app.embedding import doc_store
+from app.embedding.doc_store import MAGIC, DocStore, _pad, load_metadata
+
+DOCUMENTS = [
+    {"id": "a-0", "content": "Exercices de respiration pour la SLA", "source": "fr.md", "chunk_index": 0,
+     "topic": "breathing", "stage": 2},
+    {"id": "a-1", "content": "呼吸训练可以帮助渐冻症患者。", "source": "zh.md", "chunk_index": 1,
+     "topic": "breathing", "section": "训练"},
+    {"id": "b-0", "content": "", "source": "fr.md", "chunk_index": 0, "topic": ["sleep", "fatigue"]},
+    {"id": 7, "content": "No source or chunk index"},
+]
+
+
+def expected(document):
+    doc = {"source": "", "chunk_index": -1, **document}
+    doc["id"] = str(doc["id"])
+    return doc
+
+
+def write_version_1(path, documents, monkeypatch):
+    """A store as written before category columns: topic and stage live in the extra JSON."""
+    with monkeypatch.context() as patch:
+        patch.setattr(doc_store, "CATEGORY_FIELDS", ())
+        DocStore.write(path, documents)
+    with open(path, "rb") as f:
+        raw = f.read()
+    (header_len,) = struct.unpack_from("<Q", raw, len(MAGIC))
+    start = len(MAGIC) + 8
+    header = json.loads(raw[start:start + header_len])
+    data = raw[start + header_len + _pad(start + header_len):]
+    header["version"] = 1
+    del header["categories"]
+    header = json.dumps(header).encode("utf-8")
+    with open(path, "wb") as f:
+        f.write(MAGIC + struct.pack("<Q", len(header)) + header + b"\0" * _pad(start + len(header)) + data)
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "metadata.docs")
+    DocStore.write(path, iter(DOCUMENTS))
+    store = DocStore(path)
+    assert len(store) == len(DOCUMENTS)
+    assert list(store) == [expected(doc) for doc in DOCUMENTS]
+    assert store[-1] == expected(DOCUMENTS[-1])
+    assert store.content(1) == DOCUMENTS[1]["content"]
+    # Scalar categories are dictionary-encoded; other values stay in the extra JSON
+    assert store.categories == {"topic": ["breathing"], "stage": [2]}
+    assert store.sources == ["fr.md", "zh.md", ""]
+    store.close()
+
+
+def test_appended_documents_follow_the_stored_ones(tmp_path):
+    path = str(tmp_path / "metadata.docs")
+    DocStore.write(path, DOCUMENTS[:2])
+    store = DocStore(path)
+    store.extend(DOCUMENTS[2:])
+    assert len(store) == 4
+    assert store[2] is DOCUMENTS[2] and store.content(3) == DOCUMENTS[3]["content"]
+    with pytest.raises(IndexError):
+        store[-5]
+    store.close()
+
+
+def test_readers_keep_their_mapping_when_the_file_is_replaced(tmp_path):
+    path = str(tmp_path / "metadata.docs")
+    DocStore.write(path, DOCUMENTS[:2])
+    old = DocStore(path)
+    DocStore.write(path, DOCUMENTS)
+    assert len(old) == 2 and old[1] == expected(DOCUMENTS[1])
+    assert len(DocStore(path)) == 4
+    old.close()
+
+
+def test_reads_version_1_stores(tmp_path, monkeypatch):
+    path = str(tmp_path / "metadata.docs")
+    write_version_1(path, DOCUMENTS, monkeypatch)
+    store = DocStore(path)
+    assert store.header["version"] == 1 and store.categories == {}
+    assert list(store) == [expected(doc) for doc in DOCUMENTS]
+    store.close()
+
+
+def test_loads_pickled_metadata(tmp_path):
+    path = str(tmp_path / "metadata.pkl")
+    with open(path, "wb") as f:
+        pickle.dump(DOCUMENTS, f)
+    legacy = load_metadata(path)
+    assert legacy == DOCUMENTS
+
+    converted = str(tmp_path / "metadata.docs")
+    DocStore.write(converted, legacy)
+    store = load_metadata(converted)
+    assert isinstance(store, DocStore) and list(store) == [expected(doc) for doc in DOCUMENTS]
+    store.close()
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "metadata.docs"
+    path.write_bytes(b"not a store at all")
+    with pytest.raises(ValueError):
+        DocStore(str(path))
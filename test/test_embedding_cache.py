@@ -0,0 +1,48 @@
+import numpy as np
+
+from app.embedding.embedding_cache import EmbeddingCache
+from conftest import HashEmbedder
+
+
+def test_only_unseen_texts_are_encoded(tmp_path):
+    embedder = HashEmbedder()
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite"), model_name="model-a")
+    texts = ["breathing exercises", "sleep routine", "breathing exercises"]
+
+    vectors = cache.encode(texts, embedder.encode)
+    np.testing.assert_array_equal(vectors, HashEmbedder().encode(texts))
+    # The repeated text is encoded once
+    assert embedder.encoded == 2
+    assert cache.stats == {"hits": 0, "misses": 2, "duplicates": 1}
+
+    vectors = cache.encode(["sleep routine", "new chunk"], embedder.encode)
+    np.testing.assert_array_equal(vectors, HashEmbedder().encode(["sleep routine", "new chunk"]))
+    assert embedder.encoded == 3
+    assert cache.stats == {"hits": 1, "misses": 3, "duplicates": 1}
+    assert len(cache) == 3
+    cache.close()
+
+
+def test_entries_persist_per_model(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    first = EmbeddingCache(path, model_name="model-a")
+    first.encode(["breathing exercises"], HashEmbedder().encode)
+    first.close()
+
+    embedder = HashEmbedder()
+    reopened = EmbeddingCache(path, model_name="model-a")
+    reopened.encode(["breathing exercises"], embedder.encode)
+    assert embedder.encoded == 0 and reopened.stats["hits"] == 1
+
+    # Another model never reuses these vectors
+    other = EmbeddingCache(path, model_name="model-b")
+    other.encode(["breathing exercises"], embedder.encode)
+    assert embedder.encoded == 1 and len(other) == 1
+    reopened.close()
+    other.close()
+
+
+def test_empty_input(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite"))
+    assert cache.encode([], HashEmbedder().encode).shape == (0, 0)
+    cache.close()
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from app.utils.generation_cache import GenerationCache
+
+PARAMS = {"temperature": 0.7}
+
+
+def key(message, context=""):
+    return GenerationCache.key("default", "early", "supportive", ["sleep", "fatigue"], context, message,
+                               "granite", PARAMS)
+
+
+async def embed(text):
+    # Messages differing only in their last word embed close together
+    words = text.split()
+    return np.array([len(words), sum(map(len, words[:-1])), 0.01 * len(words[-1])], dtype="float32")
+
+
+def test_key_depends_on_the_conversation_history():
+    history = "user: I can't sleep\nassistant: That sounds exhausting."
+    assert key("Any tips?", history) == key("any tips", history)
+    assert key("Any tips?", history)[0] != key("Any tips?", "user: My hands are weak")[0]
+    assert key("Any tips?", history)[1] != key("Any tips?")[1]
+    # Order of detected needs does not matter
+    assert key("Any tips?") == GenerationCache.key("default", "early", "supportive", ["fatigue", "sleep"], "",
+                                                   "Any tips?", "granite", PARAMS)
+
+
+@pytest.mark.asyncio
+async def test_exact_hits_only_for_the_same_history():
+    cache = GenerationCache(mode="exact", name="test_generation_cache")
+    await cache.set(key("Any tips?", "user: I can't sleep"), "Any tips?", "Try a wind-down routine.")
+    assert await cache.get(key("any tips", "user: I can't sleep"), "any tips") == "Try a wind-down routine."
+    assert await cache.get(key("Any tips?", "user: My hands are weak"), "Any tips?") is None
+    assert await cache.get(key("Any tips?"), "Any tips?") is None
+
+
+@pytest.mark.asyncio
+async def test_semantic_hits_stay_within_one_history():
+    cache = GenerationCache(mode="semantic", embed_fn=embed, similarity=0.99, name="test_generation_cache")
+    await cache.set(key("how do I sleep better", "user: hi"), "how do I sleep better", "Keep a routine.")
+    assert await cache.get(key("how do I sleep well", "user: hi"), "how do I sleep well") == "Keep a routine."
+    assert await cache.get(key("how do I sleep well", "user: hello"), "how do I sleep well") is None
+    assert cache.stats()["semantic_hits"] == 1
+
+
+def test_rejects_bad_modes():
+    with pytest.raises(ValueError):
+        GenerationCache(mode="fuzzy")
+    with pytest.raises(ValueError):
+        GenerationCache(mode="semantic")
+
+
+@pytest.mark.asyncio
+async def test_semantic_index_stays_bounded():
+    cache = GenerationCache(mode="semantic", embed_fn=embed, max_entries=10, name="test_generation_cache")
+    for i in range(5000):
+        # Every message in its own conversation: one prompt shape each
+        await cache.set(key(f"question {i}", f"user: message {i}"), f"question {i}", "reply")
+    assert len(cache._entries) == 10
+    assert len(cache._buckets) <= 10
+    assert sum(len(bucket) for bucket in cache._buckets.values()) == cache.stats()["vectors"] <= 10
+    # The newest messages are still found
+    assert await cache.get(key("question 4999", "user: message 4999"), "question 4999") == "reply"
+
+    cache._entries.clear()
+    assert await cache.get(key("question 4999 again", "user: message 4999"), "question 4999 again") is None
+    # Vectors whose entry is gone are dropped, along with their empty bucket
+    assert len(cache._buckets) == 9 and cache.stats()["vectors"] == 9
@@ -0,0 +1,145 @@
+import time
+import asyncio
+
+import pytest
+
+from app.utils import llm_client
+from app.utils.llm_client import (
+    CircuitBreaker, CircuitOpenError, LLMHTTPError, ResilientLLMClient
+)
+
+
+class ScriptedBackend:
+    """Answers each call with the next scripted outcome: a reply, an exception, or None to hang."""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    async def generate(self, prompt, max_tokens=512):
+        self.calls += 1
+        outcome = self.outcomes.pop(0) if self.outcomes else "ok"
+        if outcome is None:
+            await asyncio.sleep(3600)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+
+def make_client(backend, **kwargs):
+    kwargs.setdefault("breaker", CircuitBreaker(failure_threshold=3, reset_timeout=0.05))
+    return ResilientLLMClient(backend, name="test_llm_client", **kwargs)
+
+
+@pytest.fixture(autouse=True)
+def short_backoff(monkeypatch):
+    monkeypatch.setattr(llm_client, "LLM_RETRY_BASE_DELAY", 0.001)
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0.05)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+    assert breaker.opened == 1
+
+
+def test_breaker_lets_one_probe_through_when_half_open():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    # A failed probe re-opens the breaker for another reset timeout
+    breaker.record_failure()
+    assert breaker.state == "open" and breaker.opened == 2
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow() and breaker.allow()
+
+
+def test_released_probe_can_be_retaken():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.release_probe()
+    assert breaker.allow()
+
+
+@pytest.mark.asyncio
+async def test_retries_retryable_errors():
+    backend = ScriptedBackend(LLMHTTPError(503), LLMHTTPError(429), "answer")
+    client = make_client(backend)
+    assert await client.generate("hello") == "answer"
+    assert backend.calls == 3
+    assert client.stats()["retries"] == 2 and client.breaker.state == "closed"
+
+
+@pytest.mark.asyncio
+async def test_client_errors_are_not_retried():
+    backend = ScriptedBackend(LLMHTTPError(400))
+    client = make_client(backend)
+    with pytest.raises(LLMHTTPError):
+        await client.generate("hello")
+    assert backend.calls == 1 and client.breaker.state == "closed"
+
+
+@pytest.mark.asyncio
+async def test_open_breaker_fails_fast_without_waiting_for_a_slot():
+    backend = ScriptedBackend(*[LLMHTTPError(503)] * 3)
+    client = make_client(backend, max_retries=5, max_concurrency=1)
+    # The third failure opens the breaker, so the call stops retrying
+    with pytest.raises(CircuitOpenError):
+        await client.generate("hello")
+    assert backend.calls == 3
+
+    # With every slot busy, the call is still rejected at once instead of queueing
+    slots = client._semaphore()
+    await slots.acquire()
+    try:
+        with pytest.raises(CircuitOpenError):
+            await asyncio.wait_for(client.generate("hello"), timeout=1)
+    finally:
+        slots.release()
+
+    await asyncio.sleep(0.06)
+    assert await client.generate("hello") == "ok"
+    assert client.breaker.state == "closed"
+
+
+@pytest.mark.asyncio
+async def test_cancelled_probe_frees_the_half_open_slot():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    await asyncio.sleep(0.06)
+    client = make_client(ScriptedBackend(None), breaker=breaker)
+    probe = asyncio.ensure_future(client.generate("hello"))
+    await asyncio.sleep(0.01)
+    assert not breaker.allow()
+    probe.cancel()
+    await asyncio.gather(probe, return_exceptions=True)
+    assert breaker.allow()
+
+
+@pytest.mark.asyncio
+async def test_hedged_request_wins_when_the_first_hangs(monkeypatch):
+    monkeypatch.setattr(llm_client, "LLM_HEDGE_MIN_SAMPLES", 10)
+    backend = ScriptedBackend(None, "backup answer")
+    client = make_client(backend, hedge_percentile=95)
+    client._latency_ms.extend([20.0] * 10)
+    assert await asyncio.wait_for(client.generate("hello"), timeout=1) == "backup answer"
+    stats = client.stats()
+    assert stats["hedges"] == 1 and stats["hedge_wins"] == 1
+    # The losing attempt is cancelled and gives its slot back once it unwinds
+    await asyncio.sleep(0.01)
+    assert client.stats()["inflight"] == 0
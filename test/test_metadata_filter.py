@@ -0,0 +1,72 @@
+import faiss
+import numpy as np
+import pytest
+
+from app.embedding.doc_store import DocStore
+from app.embedding.metadata_filter import FilterIndex, matches, normalize_filters
+from app.embedding.retriever import IndexSnapshot
+from test_doc_store import DOCUMENTS, write_version_1
+
+
+def select(metadata, filters):
+    return FilterIndex(metadata).select(normalize_filters(filters)).tolist()
+
+
+def test_normalized_filters_ignore_order_and_reject_unknown_fields():
+    assert normalize_filters(None) is None and normalize_filters({}) is None
+    assert normalize_filters({"stage": [2, 1], "source": "fr.md"}) == \
+        normalize_filters({"source": ["fr.md"], "stage": ("1", "2")})
+    with pytest.raises(ValueError):
+        normalize_filters({"language": "fr"})
+    with pytest.raises(ValueError):
+        normalize_filters({"chunk_range": [1]})
+
+
+def test_selects_from_store_columns_and_appended_documents(tmp_path):
+    path = str(tmp_path / "metadata.docs")
+    DocStore.write(path, DOCUMENTS)
+    store = DocStore(path)
+    assert select(store, {"topic": "breathing"}) == [0, 1]
+    assert select(store, {"source": ["fr.md", "zh.md"]}) == [0, 1, 2]
+    # Fields intersect
+    assert select(store, {"stage": 2, "source": "fr.md"}) == [0]
+    assert select(store, {"stage": 3}) == []
+    assert select(store, {"chunk_range": [1, None]}) == [1]
+    assert select(store, {"chunk_range": [None, 0]}) == [0, 2, 3]
+
+    store.extend([{"id": "c-0", "content": "", "source": "fr.md", "chunk_index": 4, "stage": 2}])
+    assert select(store, {"stage": 2, "source": "fr.md"}) == [0, 4]
+    assert select(store, {"chunk_range": [1, None]}) == [1, 4]
+    store.close()
+
+
+def test_same_selection_for_lists_and_version_1_stores(tmp_path, monkeypatch):
+    path = str(tmp_path / "metadata.docs")
+    write_version_1(path, DOCUMENTS, monkeypatch)
+    store = DocStore(path)
+    for filters in ({"topic": "breathing"}, {"stage": 2, "source": "fr.md"}, {"chunk_range": [0, 0]}):
+        expected = [i for i, doc in enumerate(DOCUMENTS) if matches(doc, normalize_filters(filters))]
+        assert select(store, filters) == select(DOCUMENTS, filters) == expected
+    store.close()
+
+
+@pytest.mark.parametrize("factory", ["IVF4,Flat", "HNSW8"])
+def test_approximate_indexes_return_only_selected_documents(factory):
+    rng = np.random.default_rng(0)
+    vectors = rng.random((200, 8), dtype="float32")
+    index = faiss.index_factory(8, factory)
+    index.train(vectors)
+    index.add(vectors)
+    documents = [{"id": str(i), "content": "", "stage": i % 10, "topic": "rare" if i in (7, 150) else "common"}
+                 for i in range(200)]
+    snapshot = IndexSnapshot(index, documents, np.empty((0, 8), dtype="float32"), [], 0)
+
+    # 20 matches: searched approximately through the index's own selector parameters
+    distances, indices = snapshot.search(vectors[:2], 5, normalize_filters({"stage": 3}))
+    assert (indices != -1).all() and (indices % 10 == 3).all()
+    assert (np.diff(distances, axis=1) >= 0).all()
+    # 2 matches, fewer than top_k: searched exhaustively, padded with -1
+    _, indices = snapshot.search(vectors[:1], 5, normalize_filters({"topic": "rare"}))
+    assert sorted(indices[0][:2].tolist()) == [7, 150] and (indices[0][2:] == -1).all()
+    _, indices = snapshot.search(vectors[:1], 5, normalize_filters({"topic": "missing"}))
+    assert (indices == -1).all()
@@ -0,0 +1,129 @@
+import faiss
+import numpy as np
+import pytest
+
+from app.embedding import retriever as retriever_module
+from app.embedding.retriever import IndexSnapshot, SemanticRetriever
+from conftest import DIMENSION, make_docs, shutdown, write_index
+
+QUERY = "base document 2 about breathing support"
+
+
+@pytest.mark.asyncio
+async def test_cached_results_are_copies(hash_embedder, index_files):
+    retriever = SemanticRetriever(*index_files)
+    try:
+        first = await retriever.search(QUERY, top_k=2)
+        assert first[0]["metadata"]["id"] == "base2"
+        first[0]["metadata"]["content"] = "changed by a caller"
+        first[0]["score"] = -1.0
+        first.pop()
+
+        second = await retriever.search(QUERY, top_k=2)
+        assert retriever.result_cache.hits == 1
+        assert len(second) == 2
+        assert second[0]["metadata"]["content"] == QUERY and second[0]["score"] > 0
+        [many] = await retriever.search_many([QUERY], top_k=2)
+        assert many == second and many is not second
+    finally:
+        await shutdown(retriever)
+
+
+@pytest.mark.asyncio
+async def test_repeated_queries_are_encoded_once(hash_embedder, index_files):
+    retriever = SemanticRetriever(*index_files)
+    try:
+        await retriever.search(QUERY)
+        encoded = hash_embedder.encoded
+        await retriever.search("  Base   DOCUMENT 2 about breathing support", top_k=3)
+        assert hash_embedder.encoded == encoded
+        assert retriever.embedding_cache.hits == 1
+    finally:
+        await shutdown(retriever)
+
+
+@pytest.mark.asyncio
+async def test_new_documents_invalidate_cached_results(hash_embedder, index_files):
+    retriever = SemanticRetriever(*index_files)
+    try:
+        query = "new document 0 about breathing support"
+        assert (await retriever.search(query, top_k=1))[0]["metadata"]["id"] != "new0"
+        await retriever.add_documents(make_docs("new", 1))
+        assert (await retriever.search(query, top_k=1))[0]["metadata"]["id"] == "new0"
+    finally:
+        await shutdown(retriever)
+
+
+@pytest.mark.asyncio
+async def test_filters_apply_to_main_and_new_documents(hash_embedder, tmp_path):
+    retriever = SemanticRetriever(*write_index(tmp_path, make_docs("sleep", 4, topic="sleep")
+                                               + make_docs("breath", 4, topic="breathing")))
+    try:
+        await retriever.add_documents(make_docs("new", 2, topic="breathing", source="new.md"))
+        results = await retriever.search(QUERY, top_k=10, filters={"topic": "breathing"})
+        assert sorted(r["metadata"]["id"] for r in results) == ["breath0", "breath1", "breath2", "breath3",
+                                                               "new0", "new1"]
+        results = await retriever.search(QUERY, top_k=10, filters={"topic": "breathing", "chunk_range": [1, 2]})
+        assert sorted(r["metadata"]["id"] for r in results) == ["breath1", "breath2", "new1"]
+        results = await retriever.search(QUERY, top_k=10, filters={"source": "new.md"})
+        assert sorted(r["metadata"]["id"] for r in results) == ["new0", "new1"]
+        assert await retriever.search(QUERY, filters={"topic": "fatigue"}) == []
+        with pytest.raises(ValueError):
+            await retriever.search(QUERY, filters={"language": "fr"})
+    finally:
+        await shutdown(retriever)
+
+
+def ids(results):
+    return [r["metadata"]["id"] for r in results]
+
+
+@pytest.mark.asyncio
+async def test_keyword_and_hybrid_need_the_keyword_index(hash_embedder, index_files):
+    retriever = SemanticRetriever(*index_files)
+    try:
+        dense = await retriever.search(QUERY, top_k=3, mode="dense")
+        assert await retriever.search(QUERY, top_k=3, mode="keyword") == dense
+        assert await retriever.search(QUERY, top_k=3, mode="hybrid") == dense
+        with pytest.raises(ValueError):
+            await retriever.search(QUERY, mode="sparse")
+    finally:
+        await shutdown(retriever)
+
+
+@pytest.mark.asyncio
+async def test_search_modes(hash_embedder, tmp_path):
+    retriever = SemanticRetriever(*write_index(tmp_path, make_docs("base", 40), bm25=True))
+    try:
+        await retriever.add_documents([{"id": "new0", "content": "Riluzole dosage for ALS", "source": "new.md",
+                                        "chunk_index": 0}])
+        encoded = hash_embedder.encoded
+        keyword = await retriever.search("base document 17", top_k=3, mode="keyword")
+        assert ids(keyword)[0] == "base17" and keyword[0]["score"] > 1
+        assert ids(await retriever.search("riluzole", top_k=3, mode="keyword")) == ["new0"]
+        # Keyword queries never reach the encoder
+        assert hash_embedder.encoded == encoded
+
+        # Ranked first by both the dense and the keyword ranking
+        hybrid = await retriever.search("base document 17 about breathing support", top_k=3, mode="hybrid")
+        assert ids(hybrid)[0] == "base17"
+        assert hybrid[0]["score"] == pytest.approx(2 / (retriever_module.RETRIEVER_RRF_K + 1))
+        assert len(hybrid) == 3
+
+        # Short queries of rare known terms go to keywords only, the rest to hybrid
+        assert await retriever.search("base document 17", top_k=3, mode="auto") == keyword
+        auto = await retriever.search("base document 17 about breathing support", top_k=3, mode="auto")
+        assert auto == hybrid
+    finally:
+        await shutdown(retriever)
+
+
+def test_hybrid_search_fuses_rankings_by_reciprocal_rank(monkeypatch):
+    snapshot = IndexSnapshot(faiss.IndexFlatL2(DIMENSION), make_docs("base", 4),
+                             np.empty((0, DIMENSION), dtype="float32"), [], 0)
+    monkeypatch.setattr(snapshot, "search", lambda *args: (None, np.asarray([[0, 1, 2, -1]])))
+    monkeypatch.setattr(snapshot, "keyword_search", lambda *args: (None, np.asarray([[1, 3, -1, -1]])))
+    k = retriever_module.RETRIEVER_RRF_K
+    scores, indices = snapshot.hybrid_search(np.zeros((1, DIMENSION), dtype="float32"), [QUERY], top_k=3)
+    assert indices.tolist() == [[1, 0, 3]]
+    np.testing.assert_allclose(scores[0], [1 / (k + 2) + 1 / (k + 1), 1 / (k + 1), 1 / (k + 2)], rtol=1e-6)
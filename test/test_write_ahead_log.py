@@ -0,0 +1,123 @@
+import os
+
+import numpy as np
+import pytest
+
+from app.embedding import retriever as retriever_module
+from app.embedding import shared_index
+from app.embedding.retriever import SemanticRetriever
+from app.embedding.write_ahead_log import WriteAheadLog
+from conftest import DIMENSION, make_docs, shutdown
+
+
+def cached_paths(directory):
+    return sorted(os.path.basename(key[0]) for key in shared_index._indexes if key[0].startswith(str(directory)))
+
+
+def test_replay_returns_acknowledged_segments_only(tmp_path):
+    wal = WriteAheadLog(str(tmp_path / "wal"))
+    first = wal.append(np.ones((2, DIMENSION), dtype="float32"), make_docs("a", 2))
+    second = wal.append(np.zeros((1, DIMENSION), dtype="float32"), make_docs("b", 1))
+    # A crash between the two renames leaves vectors without documents
+    with open(os.path.join(wal.wal_dir, f"segment-{second + 1:010d}.vec"), "wb") as f:
+        f.write(np.ones(DIMENSION, dtype="<f4").tobytes())
+
+    last_seq, vectors, documents = WriteAheadLog(wal.wal_dir).replay(DIMENSION)
+    assert last_seq == second
+    assert vectors.shape == (3, DIMENSION)
+    assert [doc["id"] for doc in documents] == ["a0", "a1", "b0"]
+
+    wal.commit_compaction("main.index", "main.docs", first)
+    reopened = WriteAheadLog(wal.wal_dir)
+    assert reopened.main_paths("x.index", "x.docs") == ("main.index", "main.docs")
+    last_seq, vectors, documents = reopened.replay(DIMENSION)
+    assert last_seq == second and [doc["id"] for doc in documents] == ["b0"]
+    assert not os.path.exists(os.path.join(wal.wal_dir, f"segment-{first:010d}.jsonl"))
+
+
+@pytest.mark.asyncio
+async def test_added_documents_are_searchable_and_replayed(hash_embedder, index_files):
+    retriever = SemanticRetriever(*index_files)
+    try:
+        await retriever.add_documents(make_docs("new", 3))
+        results = await retriever.search("new document 1 about breathing support", top_k=1)
+        assert results[0]["metadata"]["id"] == "new1"
+    finally:
+        await shutdown(retriever)
+
+    reloaded = SemanticRetriever(*index_files)
+    assert len(reloaded.snapshot) == 8
+    assert len(reloaded.snapshot.delta_documents) == 3
+
+
+@pytest.mark.asyncio
+async def test_compaction_swaps_generations_without_leaking(hash_embedder, index_files, tmp_path):
+    retriever = SemanticRetriever(*index_files)
+    original = retriever.snapshot
+    try:
+        for round_ in range(3):
+            await retriever.add_documents(make_docs(f"round{round_}-", 2))
+            await retriever.compact()
+        assert retriever.snapshot.delta_documents == []
+        assert os.path.basename(retriever.main_index_path) == "main-000003.index"
+        # Only the current generation stays cached; replaced ones are released and closed
+        assert cached_paths(tmp_path) == ["main-000003.index"]
+        assert original.generation.retired
+        assert original.metadata._mmap.closed
+        results = await retriever.search("round1- document 0 about breathing support", top_k=1)
+        assert results[0]["metadata"]["id"] == "round1-0"
+    finally:
+        await shutdown(retriever)
+
+    reloaded = SemanticRetriever(*index_files)
+    assert len(reloaded.snapshot) == 11
+    assert reloaded.snapshot.delta_documents == []
+
+
+@pytest.mark.asyncio
+async def test_retired_documents_stay_open_while_a_search_reads_them(hash_embedder, index_files):
+    retriever = SemanticRetriever(*index_files)
+    try:
+        await retriever.add_documents(make_docs("new", 1))
+        with retriever._reading() as snapshot:
+            await retriever.compact()
+            assert snapshot.generation.retired
+            assert snapshot.document(0)["id"] == "base0"
+        assert snapshot.metadata._mmap.closed
+    finally:
+        await shutdown(retriever)
+
+
+def ids(results):
+    return [r["metadata"]["id"] for r in results]
+
+
+@pytest.mark.asyncio
+async def test_other_workers_follow_the_writer(hash_embedder, index_files, monkeypatch):
+    monkeypatch.setattr(retriever_module, "RETRIEVER_WAL_POLL_INTERVAL", 0)
+    writer, reader = SemanticRetriever(*index_files), SemanticRetriever(*index_files)
+    query = "new document 1 about breathing support"
+    try:
+        assert ids(await reader.search(query, top_k=1)) != ["new1"]
+        await writer.add_documents(make_docs("new", 2))
+        assert ids(await reader.search(query, top_k=1)) == ["new1"]
+        with pytest.raises(RuntimeError):
+            await reader.add_documents(make_docs("other", 1))
+
+        old_generation = reader.snapshot.generation
+        await writer.compact()
+        await writer.add_documents(make_docs("late", 1))
+        assert ids(await reader.search("late document 0 about breathing support", top_k=1)) == ["late0"]
+        assert os.path.basename(reader.main_index_path) == "main-000001.index"
+        assert len(reader.snapshot.metadata) == 7 and len(reader.snapshot.delta_documents) == 1
+        assert old_generation.retired
+
+        # Once the writer is gone, the next worker to ingest starts from its log
+        monkeypatch.setattr(retriever_module, "RETRIEVER_WAL_POLL_INTERVAL", 3600)
+        await writer.add_documents(make_docs("last", 1))
+        writer.wal._lock_file.close()
+        await reader.add_documents(make_docs("next", 1))
+        assert [doc["id"] for doc in reader.snapshot.delta_documents] == ["late0", "last0", "next0"]
+    finally:
+        reader.close()
+        await shutdown(writer)